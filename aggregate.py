@@ -0,0 +1,193 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : aggregate.py
+Purpose : Group-by aggregation of the magnitude and depth of the quakes
+          by year, month, tremor type or spatial cell, computed with
+          bincount and sort based segment reductions
+Revisions:
+    00 : import the required modules
+    01 : define the AggTable class, groupBy,groupKeys and aggregate
+    02 : AggTable.concat to append the rows of tables
+"""
+### Step 1 : Import the required modules
+import csv # importing csv module
+import numpy as np
+from quake_store import QuakeStore
+
+# quantiles computed for every group by default
+QUANTILES=(0.25,0.5,0.75)
+# size in degrees of the spatial cells
+CELL=10.0
+
+### Step 2 : define the AggTable class
+class AggTable:
+    '''
+    Description : result of an aggregation, one array per column and one
+                  row per group, the key columns first.
+    '''
+    def __init__(self,columns,keys):
+        '''
+        Input:
+            columns : dictionary of column name to array, in order
+            keys : names of the key columns
+        '''
+        self.columns=columns
+        self.keys=list(keys)
+
+    def __len__(self):
+        return len(self.columns[self.keys[0]])
+
+    def __getitem__(self,name):
+        return self.columns[name]
+
+    @classmethod
+    def concat(cls,tables):
+        '''
+        Input:
+            tables : list of AggTable with the same columns
+
+        Returns:
+            one AggTable with the rows of every table in turn
+        '''
+        return cls({name:np.concatenate([t.columns[name] for t in tables])
+                    for name in tables[0].columns},tables[0].keys)
+
+    def names(self):
+        '''
+        Returns the list of column names
+        '''
+        return list(self.columns)
+
+    def rows(self):
+        '''
+        Returns a list of dictionaries, one per group
+        '''
+        lists={name:values.tolist() for name,values in self.columns.items()}
+        return [{name:lists[name][i] for name in lists}
+                for i in range(len(self))]
+
+    def toDict(self,column):
+        '''
+        Input:
+            column : name of a column
+
+        Returns:
+            dictionary of the key of every group to its value in the
+            column, like the events and avg_mags dictionaries
+        '''
+        keys=zip(*(self.columns[k].tolist() for k in self.keys))
+        if len(self.keys)==1:
+            keys=(k[0] for k in keys)
+        return dict(zip(keys,self.columns[column].tolist()))
+
+    def toCsv(self,path):
+        '''
+        Description : writes the table to a csv file with a header row
+        '''
+        with open(path,'w',newline='') as f:
+            write=csv.writer(f)
+            write.writerow(self.names())
+            write.writerows(zip(*(values.tolist()
+                                  for values in self.columns.values())))
+
+### Step 3 : define the aggregation functions
+def groupBy(keys,values,quantiles=QUANTILES):
+    '''
+    Description : count, sum, mean, min, max and quantiles of every value
+                  column for each distinct key. The groups come from one
+                  sort of the keys, the counts and sums from bincount and
+                  the order statistics from one sort of each value column
+                  within the groups.
+
+    Input:
+        keys : dictionary of key name to array, rows with equal values in
+               every key array form a group
+        values : dictionary of name to float array of the same length
+        quantiles : fractions between 0 and 1
+
+    Returns:
+        AggTable with the key columns, 'count' and for every value
+        column name_sum, name_mean, name_min, name_max and name_q<pct>
+    '''
+    names=list(keys)
+    n=len(keys[names[0]])
+    if len(names)==1:
+        groups,index=np.unique(keys[names[0]],return_inverse=True)
+        columns={names[0]:groups}
+    else:
+        # rows of the distinct combinations of the key columns
+        records=np.rec.fromarrays([keys[k] for k in names],names=names)
+        groups,index=np.unique(records,return_inverse=True)
+        columns={k:np.asarray(groups[k]) for k in names}
+    index=index.reshape(n)
+    count=np.bincount(index,minlength=len(groups))
+    columns['count']=count
+    # position of the first and the last row of every group once the
+    # rows are sorted by group
+    start=np.cumsum(count)-count
+    last=start+count-1
+    for name,value in values.items():
+        value=np.asarray(value,dtype=np.float64)
+        total=np.bincount(index,weights=value,minlength=len(groups))
+        # the values sorted inside every group
+        ordered=value[np.lexsort((value,index))]
+        columns[f'{name}_sum']=total
+        columns[f'{name}_mean']=total/np.maximum(count,1)
+        columns[f'{name}_min']=ordered[start]
+        columns[f'{name}_max']=ordered[last]
+        for q in quantiles:
+            # linear interpolation between the closest ranks
+            pos=start+q*(count-1)
+            lo=np.floor(pos).astype(np.int64)
+            hi=np.minimum(lo+1,last)
+            frac=pos-lo
+            columns[f'{name}_q{round(q*100):02d}']=\
+                ordered[lo]+(ordered[hi]-ordered[lo])*frac
+    return AggTable(columns,names)
+
+def groupKeys(quakes,by,cell=CELL):
+    '''
+    Input:
+        quakes : QuakeStore
+        by : 'year', 'month', 'type' or 'cell'
+        cell : size in degrees of the spatial cells
+
+    Returns:
+        dictionary of key name to array, 'year' as integers, 'month' as
+        datetime64[M], 'type' as text and 'cell' as the latitude and
+        longitude of the south west corner of the cell
+    '''
+    if by=='year':
+        return {'year':quakes.datetime.astype('datetime64[Y]')
+                       .astype(np.int64)+1970}
+    if by=='month':
+        return {'month':quakes.datetime.astype('datetime64[M]')}
+    if by=='type':
+        names=np.array(quakes.types.categories,dtype=object)
+        return {'type':names[quakes.types.codes]}
+    if by=='cell':
+        return {'cell_lat':np.floor(quakes.lat/cell)*cell,
+                'cell_lng':np.floor(quakes.lng/cell)*cell}
+    raise ValueError(f"unknown grouping <{by}>")
+
+def aggregate(quakes,by='year',fields=('magnitude','depth'),cell=CELL,
+              quantiles=QUANTILES):
+    '''
+    Description : aggregates the fields of the quakes grouped by year,
+                  month, tremor type or spatial cell.
+
+    Input:
+        quakes : QuakeStore, dictionary of quakes data or list of
+                 (location,data) tuples such as mag_selected
+        by : 'year', 'month', 'type' or 'cell'
+        fields : columns of the QuakeStore to aggregate
+        cell : size in degrees of the spatial cells
+        quantiles : fractions between 0 and 1
+
+    Returns:
+        AggTable with one row per group in key order
+    '''
+    if not isinstance(quakes,QuakeStore):
+        quakes=QuakeStore.fromItems(quakes)
+    return groupBy(groupKeys(quakes,by,cell),
+                   {f:getattr(quakes,f) for f in fields},quantiles)
@@ -0,0 +1,873 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : benchmark.py
+Purpose : Timing the hot paths of final_project against the faster
+          implementations and checking that both give the same results
+Revisions:
+    00 : import the required modules
+    01 : findCities linear scan against the CityGrid index
+    02 : scalar havDist against the vectorized havDistMany and
+         havDistPairwise
+    03 : memory footprint of the dictionaries against the columnar
+         QuakeStore and CityStore
+    04 : cold and warm start through the binary cache
+    05 : strptime with the except fallback against parseDateTimes
+    06 : peak memory of loading the whole catalog against streaming it
+    07 : five successive selection lists against the single pass select
+    08 : linear scan selection against the sorted QuakeIndex
+    09 : per-year loops of the plots against the aggregate table
+    10 : scaling of the impact analysis with the number of processes
+    11 : closest city from a 5000 km findCities against nearestCities
+    12 : render time of the scatter against the density grid and hexbin
+    13 : dbscan on the full distance matrix against the neighbor grid
+    14 : full reload against the incremental ingest of appended rows
+    15 : impact of repeated selections with and without the ImpactCache
+    16 : overhead of the stage timers, disabled and enabled
+    17 : loadQuakes of one file against loadCatalog of a split catalog
+         with 1 to every cpu processes
+    18 : nearest city of every quake, findCities and CityGrid.nearest
+         per quake against the bulk nearestMany
+    19 : writing a selection with csv and json.dumps per row against
+         the chunked writers of export, reading it back parsed against
+         memory mapped
+    20 : select, QuakeStore.mask and streamQuakes against the lazy
+         Query on the same sources, the file with the conditions pushed
+         into the reader
+    21 : event rates and rolling b-values window by window against the
+         cumulative sums of timeseries
+    22 : ingest checks the saved state read back and prints the bytes
+         written by every save
+    23 : one import line per module
+    24 : ingest checks the saved index by its selections, its sorted
+         runs differ from those of a fresh index
+"""
+### Step 1 : Import the required modules
+import csv
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+import numpy as np
+from final_project import getCityData,getQuakeData,findCities,havDist,\
+                          select,nearestCities
+from spatial_index import CityGrid
+from haversine import Points,havDistMany,havDistPairwise
+from quake_store import QuakeStore,loadQuakes,loadCities
+from cache import cachedQuakes,cachedCities,fileHash
+from dates import parseDateTimes,MDY,ISO
+from streaming import streamSummary,streamQuakes,severity
+from range_index import QuakeIndex
+from aggregate import aggregate
+from impact import impactTable,ImpactCache
+from cluster import dbscan,components
+from ingest import Catalog
+from multi_load import loadCatalog,uniqueRows
+from country_join import nearestMany,joinCountries,countryTable
+from export import exportTable,readTable
+from query import Query
+from timeseries import eventRates,rollingBValue,bValue,gutenbergRichter,\
+                       DAY_MS
+from render import drawQuakes,useHeadless,showPlot
+import matplotlib.pyplot as plt
+import profiling
+
+# ranges selected from the saved index of ingest and from a fresh one
+INGEST_CHECKS={'lat':(-10,30),'lng':(100,180),
+               'date':('01/01/1990','12/31/2000'),'mag':(6,7)}
+
+### Step 2 : define the helper and benchmark functions
+def timeit(func,*args,repeat=3):
+    '''
+    Input:
+        func : function to be timed
+        args : arguments passed to the function
+        repeat : number of runs, the best one is reported
+
+    Returns:
+        (seconds,result) : best wall time and the result of the last run
+    '''
+    best=float('inf')
+    for i in range(repeat):
+        start=perf_counter()
+        result=func(*args)
+        best=min(best,perf_counter()-start)
+    return best,result
+
+def deepSizeOf(obj,seen=None):
+    '''
+    Returns the size in bytes of obj and everything it refers to,
+    counting shared objects once
+    '''
+    seen=set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size=sys.getsizeof(obj)
+    if isinstance(obj,dict):
+        size+=sum(deepSizeOf(k,seen)+deepSizeOf(v,seen)
+                  for k,v in obj.items())
+    elif isinstance(obj,(list,tuple,set)):
+        size+=sum(deepSizeOf(v,seen) for v in obj)
+    return size
+
+def randomLocations(n,seed=0):
+    '''
+    Returns a list of n random (lat,lng) tuples
+    '''
+    rng=random.Random(seed)
+    return [(rng.uniform(-90,90),rng.uniform(-180,180)) for i in range(n)]
+
+def benchFindCities(cityDict,queries=10,radii=(10,100,1000,5000)):
+    '''
+    Description : times findCities against CityGrid.findCities for a
+                  set of random locations and checks the results match.
+    '''
+    print("\n*** findCities: linear scan vs CityGrid ***")
+    build,grid=timeit(CityGrid,cityDict,repeat=1)
+    print(f"grid build {build*1000:.1f} ms for {len(grid)} cities")
+    points=Points.fromDegrees(cityDict.keys())
+    locs=randomLocations(queries)
+    for r in radii:
+        scan=indexed=0.0
+        for loc in locs:
+            t1,expected=timeit(findCities,loc,cityDict,r,points,repeat=1)
+            t2,got=timeit(grid.findCities,loc,r)
+            if got!=expected:
+                raise AssertionError(f"mismatch at {loc} radius {r}")
+            scan+=t1
+            indexed+=t2
+        print(f"radius {r:>5} km: scan {scan/queries*1000:8.3f} ms  "
+              f"grid {indexed/queries*1000:8.3f} ms  "
+              f"speedup {scan/indexed:6.1f}x")
+
+def benchHaversine(cityDict,queries=5,pairs=200):
+    '''
+    Description : times one origin against every city with the scalar
+                  havDist loop and with havDistMany, checks the two agree
+                  and does the same for a block of pairwise distances.
+    '''
+    print("\n*** havDist loop vs havDistMany ***")
+    locations=list(cityDict.keys())
+    points=Points.fromDegrees(locations)
+    scalar=vector=0.0
+    worst=0.0
+    for loc in randomLocations(queries,seed=1):
+        t1,expected=timeit(lambda:[havDist(loc,co) for co in locations],
+                           repeat=1)
+        t2,got=timeit(havDistMany,loc,points)
+        worst=max(worst,float(np.max(np.abs(got-np.array(expected)))))
+        scalar+=t1
+        vector+=t2
+    print(f"{len(locations)} cities: loop {scalar/queries*1000:8.3f} ms  "
+          f"vectorized {vector/queries*1000:8.3f} ms  "
+          f"speedup {scalar/vector:6.1f}x  max error {worst:.2e} km")
+    # pairwise distances of a set of random origins to every city
+    origins=randomLocations(pairs,seed=2)
+    t,matrix=timeit(havDistPairwise,Points.fromDegrees(origins),points,
+                    "miles",1<<20,repeat=1)
+    expected=np.array([[havDist(o,co,"miles") for co in locations[:100]]
+                       for o in origins])
+    worst=float(np.max(np.abs(matrix[:,:100]-expected)))
+    print(f"pairwise {pairs}x{len(locations)}: {t*1000:8.3f} ms  "
+          f"max error {worst:.2e} miles")
+
+def benchMemory(cityDict):
+    '''
+    Description : compares the memory held by the dictionaries of
+                  getQuakeData and getCityData with the columnar stores
+                  and the time taken to load them.
+    '''
+    print("\n*** dictionaries vs columnar stores ***")
+    t1,qDict=timeit(getQuakeData,repeat=1)
+    t2,quakes=timeit(loadQuakes,repeat=1)
+    t3,cities=timeit(loadCities,repeat=1)
+    for name,rows,old,new in (
+            ("quakes",len(qDict),deepSizeOf(qDict),quakes),
+            ("cities",len(cityDict),deepSizeOf(cityDict),cities)):
+        print(f"{name}: dict {old/1e6:7.2f} MB for {rows} records "
+              f"({old/rows:5.0f} B each)  store {new.nbytes/1e6:7.2f} MB "
+              f"for {len(new)} records ({new.nbytes/len(new):5.0f} B each)")
+    print(f"load quakes: getQuakeData {t1*1000:.1f} ms  "
+          f"loadQuakes {t2*1000:.1f} ms  loadCities {t3*1000:.1f} ms")
+    # the last row at a location is the one the dictionary keeps
+    last={quakes.location(i):i for i in range(len(quakes))}
+    for loc,data in qDict.items():
+        record=quakes.record(last[loc])
+        record['Depth']=data['Depth']
+        if record!=data:
+            raise AssertionError(f"mismatch at {loc}")
+    print(f"{len(quakes)-len(qDict)} quakes sharing a location kept "
+          f"by the store")
+
+def benchStartup(cityDict):
+    '''
+    Description : times loading both files without the cache, with an
+                  empty cache (parse and write) and with a warm cache,
+                  and checks the cached dictionaries equal the ones of
+                  getCityData and getQuakeData.
+    '''
+    print("\n*** startup: csv parsing vs binary cache ***")
+    def parse():
+        return getCityData(),getQuakeData()
+    def cached(cache_dir):
+        return (cachedCities(cache_dir=cache_dir).toDict(),
+                cachedQuakes(cache_dir=cache_dir).toDict())
+    cache_dir=tempfile.mkdtemp()
+    try:
+        t1,expected=timeit(parse,repeat=1)
+        t2,cold=timeit(cached,cache_dir,repeat=1)
+        t3,warm=timeit(cached,cache_dir)
+        t4,stores=timeit(lambda:(cachedCities(cache_dir=cache_dir),
+                                 cachedQuakes(cache_dir=cache_dir)))
+    finally:
+        shutil.rmtree(cache_dir)
+    if not expected==cold==warm:
+        raise AssertionError("cached dictionaries differ from the csv")
+    print(f"csv parsing {t1*1000:8.1f} ms")
+    print(f"cold cache  {t2*1000:8.1f} ms (parse and write)")
+    print(f"warm cache  {t3*1000:8.1f} ms (dictionaries)  "
+          f"{t4*1000:6.1f} ms (stores only)")
+
+def benchDates(cityDict):
+    '''
+    Description : times the row by row strptime parsing of the Date and
+                  Time fields, with the second try for the ISO rows,
+                  against parseDateTimes and checks both agree.
+    '''
+    print("\n*** dates: strptime per row vs parseDateTimes ***")
+    with open("earthquakesF23.csv") as f:
+        rows=list(csv.DictReader(f))
+    dates=[row['Date'] for row in rows]
+    times=[row['Time'] for row in rows]
+    def perRow():
+        parsed=[]
+        for d,t in zip(dates,times):
+            try:
+                parsed.append(datetime.strptime(f'{d} {t}',MDY))
+            except ValueError:
+                parsed.append(datetime.strptime(d,ISO))
+        return parsed
+    t1,expected=timeit(perRow)
+    t2,(values,report)=timeit(parseDateTimes,dates,times)
+    if values.astype(object).tolist()!=expected:
+        raise AssertionError("parsed dates differ")
+    print(f"{len(dates)} rows: strptime {t1*1000:8.1f} ms  "
+          f"parseDateTimes {t2*1000:6.1f} ms  speedup {t1/t2:5.1f}x")
+    for fmt,count in report['formats'].items():
+        print(f"  {count:>6} rows as {fmt}")
+    print(f"  {len(report['rejected']):>6} rows rejected")
+
+def peakMemory(func,*args):
+    '''
+    Returns (seconds,peak bytes allocated,result) of a call of func
+    '''
+    tracemalloc.start()
+    start=perf_counter()
+    result=func(*args)
+    seconds=perf_counter()-start
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds,peak,result
+
+def benchStreaming(cityDict,copies=(1,4,16),chunk_rows=20000):
+    '''
+    Description : writes catalogs made of several copies of the quake
+                  file and compares the peak memory of loadQuakes plus
+                  the aggregates with streamSummary over the same file.
+    '''
+    print("\n*** streaming: whole file vs chunks ***")
+    with open("earthquakesF23.csv") as f:
+        header=f.readline()
+        body=f.read().rstrip('\n')+'\n'
+    folder=tempfile.mkdtemp()
+    def whole(path):
+        quakes=loadQuakes(path)
+        radius=severity(quakes.magnitude)
+        return len(quakes),float(radius.max())
+    try:
+        for n in copies:
+            path=f"{folder}/quakes{n}.csv"
+            with open(path,'w') as f:
+                f.write(header+body*n)
+            t1,m1,(rows,largest)=peakMemory(whole,path)
+            t2,m2,summary=peakMemory(streamSummary,path,10,chunk_rows)
+            if summary['selected']!=rows or summary['top'][0][0]!=largest:
+                raise AssertionError("streamed results differ")
+            print(f"{rows:>8} rows: whole {t1:6.2f} s {m1/1e6:7.1f} MB  "
+                  f"streamed {t2:6.2f} s {m2/1e6:7.1f} MB")
+    finally:
+        shutil.rmtree(folder)
+
+def benchSelect(cityDict):
+    '''
+    Description : times the selection of the interactive session, one
+                  list per stage, against select with all five ranges.
+    '''
+    print("\n*** selection: five stages vs single pass ***")
+    qDict=getQuakeData()
+    lat,lng,mag=(-40,40),(-150,150),(5.6,8)
+    days=(datetime(1970,1,1).date(),datetime(2010,12,31).date())
+    def stages():
+        ty_selected=list(filter(lambda x:x[1]['Type']=='Earthquake',
+                                qDict.items()))
+        lat_selected=[((la,ln),data) for (la,ln),data in ty_selected
+                      if lat[0]<=la<=lat[1]]
+        lng_selected=[((la,ln),data) for (la,ln),data in lat_selected
+                      if lng[0]<=ln<=lng[1]]
+        date_selected=[((la,ln),data) for (la,ln),data in lng_selected
+                       if days[0]<=data['datetime'].date()<=days[1]]
+        return [((la,ln),data) for (la,ln),data in date_selected
+                if mag[0]<=data['Magnitude']<=mag[1]]
+    t1,expected=timeit(stages)
+    t2,got=timeit(select,qDict,'Earthquake',lat,lng,days,mag)
+    if got!=expected:
+        raise AssertionError("selections differ")
+    print(f"{len(got)} of {len(qDict)} records: stages {t1*1000:7.2f} ms  "
+          f"select {t2*1000:7.2f} ms")
+
+def benchIndex(cityDict,copies=(1,100)):
+    '''
+    Description : times QuakeStore.mask, a scan of every row, against
+                  QuakeIndex.select on the catalog and on a catalog made
+                  of many copies of it, and checks both agree.
+    '''
+    print("\n*** selection: column scan vs sorted indexes ***")
+    quakes=cachedQuakes()
+    queries=[dict(lat=(35,36)),
+             dict(mag=(8,10),date=('01/01/2000','12/31/2010')),
+             dict(type='Nuc',lat=(-10,60),lng=(-120,80),mag=(5,7))]
+    for n in copies:
+        store=QuakeStore.concat([quakes]*n) if n>1 else quakes
+        build,index=timeit(QuakeIndex,store,repeat=1)
+        t,hint=timeit(index.rangeOf,'mag',repeat=100)
+        print(f"{len(store)} rows: index build {build*1000:.1f} ms  "
+              f"range hint {t*1e6:.1f} us")
+        for query in queries:
+            t1,expected=timeit(lambda:np.flatnonzero(store.mask(**query)))
+            t2,got=timeit(lambda:index.select(**query))
+            if not np.array_equal(got,expected):
+                raise AssertionError(f"selections differ for {query}")
+            print(f"  {len(got):>7} rows  scan {t1*1000:8.3f} ms  "
+                  f"index {t2*1000:8.3f} ms  {sorted(query)}")
+
+def benchAggregate(cityDict):
+    '''
+    Description : times the per-year dictionaries of the plots, a scan
+                  of the selection for every year, against aggregate.
+    '''
+    print("\n*** per-year aggregates: loops vs aggregate ***")
+    mag_selected=list(getQuakeData().items())
+    def loops():
+        year_selected=sorted(set(map(lambda x: x[1]['datetime'].year,
+                                     mag_selected)))
+        events={}
+        avg_mags={}
+        for year in year_selected:
+            item=[data['Magnitude'] for loc,data in mag_selected
+                  if data['datetime'].year==year]
+            events[year]=len(item)
+            avg_mags[year]=sum(item)/len(item)
+        return events,avg_mags
+    t1,(events,avg_mags)=timeit(loops,repeat=1)
+    t2,years=timeit(aggregate,mag_selected,'year')
+    if years.toDict('count')!=events or \
+       years.toDict('magnitude_mean')!=avg_mags:
+        raise AssertionError("aggregates differ")
+    store=cachedQuakes()
+    t3,table=timeit(aggregate,store,'year')
+    print(f"{len(events)} years of {len(mag_selected)} records: loops "
+          f"{t1*1000:8.1f} ms  aggregate {t2*1000:6.1f} ms  "
+          f"(from the store {t3*1000:5.1f} ms)")
+    for by in ('month','type','cell'):
+        t,table=timeit(aggregate,store,by)
+        print(f"  by {by:<5} {len(table):>4} groups {t*1000:6.1f} ms")
+
+def benchImpact(cityDict,checks=20):
+    '''
+    Description : times impactTable over every quake with 1 to N worker
+                  processes, N the number of cpus, and checks a sample of
+                  the rows against findCities.
+    '''
+    print("\n*** impact: every quake, 1 to N processes ***")
+    quakes=cachedQuakes()
+    grid=CityGrid(cityDict)
+    counts=sorted({1,2,4,8,16,os.cpu_count() or 1})
+    base=None
+    for workers in [w for w in counts if w<=(os.cpu_count() or 1)] or [1]:
+        t,table=timeit(lambda:impactTable(quakes,cityDict,workers,
+                                          grid=grid),repeat=1)
+        base=base or t
+        print(f"{workers:>3} processes: {t:6.2f} s  "
+              f"{len(table)/t:8.0f} quakes/s  speedup {base/t:5.2f}x")
+    random.seed(0)
+    for i in random.sample(range(len(quakes)),checks):
+        loc=quakes.location(i)
+        close=findCities(loc,cityDict,float(table['radius'][i]))
+        if len(close)!=table['affected'][i] or \
+           sum(c['pop'] for c in close)!=table['population'][i]:
+            raise AssertionError(f"impact differs at {loc}")
+
+def benchNearest(cityDict,queries=20,k=(1,10)):
+    '''
+    Description : times the closest city of reportLargest, a 5000 km
+                  findCities sorted by distance, against the best-first
+                  nearestCities at quake locations and random locations,
+                  and checks the results match whenever findCities finds
+                  a city.
+    '''
+    print("\n*** closest city: 5000 km findCities vs nearestCities ***")
+    grid=CityGrid(cityDict)
+    points=Points.fromDegrees(cityDict.keys())
+    quakes=cachedQuakes()
+    step=max(1,len(quakes)//queries)
+    for name,locs in (('quakes',[quakes.location(i) for i in
+                                 range(0,len(quakes),step)][:queries]),
+                      ('random',randomLocations(queries))):
+        scan=0.0
+        for loc in locs:
+            t,close=timeit(findCities,loc,cityDict,5000,points,repeat=1)
+            scan+=t
+            got=nearestCities(loc,cityDict,1,grid)
+            if close and got!=close[:1]:
+                raise AssertionError(f"closest city differs at {loc}")
+        line=f"{name}: radius+sort {scan/len(locs)*1000:8.3f} ms"
+        for n in k:
+            t=sum(timeit(grid.nearestCities,loc,n)[0] for loc in locs)
+            line+=f"  k={n} {t/len(locs)*1000:6.3f} ms ({scan/t:5.1f}x)"
+        print(line)
+
+def benchRender(cityDict,counts=(1000,10000,100000,1000000),
+                scatter_max=100000):
+    '''
+    Description : times drawing and writing a png and an svg of random
+                  quakes with one marker per quake, with the density grid
+                  and with the hexbin, for growing numbers of quakes.
+    '''
+    print("\n*** render: scatter vs density grid vs hexbin ***")
+    useHeadless()
+    rng=np.random.default_rng(0)
+    folder=tempfile.mkdtemp()
+    def render(mode,lngs,lats,mags,fmt):
+        drawn=drawQuakes(plt.gca(),lngs,lats,mags,mode,max_points=0)
+        plt.colorbar(drawn,label='magnitude')
+        return os.path.getsize(showPlot(folder,mode,fmt))
+    try:
+        for n in counts:
+            lngs=rng.uniform(-180,180,n)
+            lats=rng.uniform(-90,90,n)
+            mags=rng.uniform(5.5,9.1,n)
+            line=f"{n:>8} quakes:"
+            for mode in ('scatter','grid','hexbin'):
+                if mode=='scatter' and n>scatter_max:
+                    line+=f"  {mode} {'-':>20}"
+                    continue
+                t1,png=timeit(render,mode,lngs,lats,mags,'png',repeat=1)
+                t2,svg=timeit(render,mode,lngs,lats,mags,'svg',repeat=1)
+                line+=f"  {mode} {t1:5.2f} s png {svg/1e6:5.2f} MB svg"
+            print(line)
+    finally:
+        shutil.rmtree(folder)
+
+def benchCluster(cityDict,sizes=(2000,8000),eps=100.0,min_samples=5):
+    '''
+    Description : times dbscan with the neighbor grid against the same
+                  clustering from the full distance matrix on samples of
+                  the quakes, checks both agree, and times the whole
+                  catalog with and without a time window.
+    '''
+    print("\n*** clustering: distance matrix vs neighbor grid ***")
+    quakes=cachedQuakes()
+    def matrix(store):
+        points=Points.fromDegrees(np.column_stack((store.lat,store.lng)))
+        dist=havDistPairwise(points,points)
+        near=dist<=eps
+        np.fill_diagonal(near,False)
+        i,j=np.nonzero(near)
+        core=near.sum(axis=1)+1>=min_samples
+        edges=core[i]&core[j]
+        roots=components(len(store),i[edges],j[edges])
+        labels=np.full(len(store),-1,dtype=np.int64)
+        labels[core]=np.unique(roots[core],return_inverse=True)[1]
+        for b in np.flatnonzero(~core).tolist():
+            found=np.flatnonzero(near[b]&core)
+            if len(found):
+                labels[b]=labels[found[np.argmin(dist[b,found])]]
+        return labels
+    for n in sizes:
+        store=quakes.take(np.linspace(0,len(quakes)-1,n).astype(np.intp))
+        t1,expected=timeit(matrix,store,repeat=1)
+        t2,got=timeit(dbscan,store,eps,min_samples)
+        if not np.array_equal(got,expected):
+            raise AssertionError(f"clusters differ for {n} quakes")
+        print(f"{n:>6} quakes: matrix {t1:6.2f} s  grid {t2:6.3f} s  "
+              f"{int(got.max())+1} clusters")
+    t,labels=timeit(dbscan,quakes,eps,min_samples,repeat=1)
+    t2,timed=timeit(dbscan,quakes,eps,min_samples,30,repeat=1)
+    print(f"{len(quakes):>6} quakes: grid {t:6.3f} s {int(labels.max())+1} "
+          f"clusters, 30 day window {t2:6.3f} s "
+          f"{int(timed.max())+1} clusters")
+
+def benchIngest(cityDict,appended=(10,100,1000)):
+    '''
+    Description : times ingesting the rows appended to a copy of the
+                  quake file against ingesting the whole file again, with
+                  and without the impact of the quakes, and checks the
+                  hotspots match dbscan over the whole file.
+    '''
+    print("\n*** ingest: whole file vs appended rows ***")
+    with open("earthquakesF23.csv",'rb') as f:
+        lines=f.read().rstrip(b'\n').split(b'\n')
+    folder=tempfile.mkdtemp()
+    path=os.path.join(folder,"quakes.csv")
+    try:
+        for cities in (None,"worldcitiesF23.csv"):
+            for n in appended:
+                cut=len(lines)-n
+                with open(path,'wb') as f:
+                    f.write(b'\n'.join(lines[:cut])+b'\n')
+                cache_dir=tempfile.mkdtemp(dir=folder)
+                Catalog(path,cache_dir,cities=cities).ingest()
+                with open(path,'ab') as f:
+                    f.write(b'\n'.join(lines[cut:])+b'\n')
+                t1,catalog=timeit(lambda:Catalog(path,cache_dir,
+                                                 cities=cities),repeat=1)
+                t2,new=timeit(catalog.ingest,repeat=1)
+                t3,full=timeit(lambda:Catalog(path,tempfile.mkdtemp(
+                                   dir=folder),cities=cities).ingest(),
+                               repeat=1)
+                if not np.array_equal(catalog.hotspots.labels(),
+                                      dbscan(catalog.store)):
+                    raise AssertionError("hotspots differ")
+                # the saved state read back selects as a fresh index and
+                # matches a fresh impact of the whole file
+                saved=Catalog(path,cache_dir,cities=cities)
+                fresh=QuakeIndex(saved.store)
+                for name,bounds in INGEST_CHECKS.items():
+                    got=saved.index.select(**{name:bounds})
+                    if not np.array_equal(got,fresh.select(**{name:bounds})) \
+                       or saved.index.rangeOf(name)!=fresh.rangeOf(name):
+                        raise AssertionError(f"index of {name} differs")
+                if not np.array_equal(saved.hotspots.labels(),
+                                      catalog.hotspots.labels()):
+                    raise AssertionError("saved hotspots differ")
+                if cities:
+                    fresh=impactTable(saved.store,cityDict,1)
+                    for name in fresh.names():
+                        if not np.array_equal(saved.impact[name],
+                                              fresh[name]):
+                            raise AssertionError(f"impact {name} differs")
+                print(f"{'impact' if cities else 'no impact':>9} "
+                      f"{new:>5} new rows: whole file {t3:6.2f} s  "
+                      f"load state {t1:5.2f} s + ingest {t2:5.2f} s  "
+                      f"wrote {catalog.written/1024:7.1f} kB")
+    finally:
+        shutil.rmtree(folder)
+
+def benchMemo(cityDict,maxsize=10000):
+    '''
+    Description : times the impact of a sequence of overlapping
+                  selections, as in repeated sessions, without a cache,
+                  with an ImpactCache and with the cache saved and loaded
+                  again, and checks the tables are the same.
+    '''
+    print("\n*** impact: recomputed vs ImpactCache ***")
+    quakes=cachedQuakes()
+    grid=CityGrid(cityDict)
+    selections=[dict(mag=(6.5,10)),dict(mag=(7,10)),
+                dict(mag=(6.5,10),lat=(0,60)),dict(mag=(6,10),lng=(100,180))]
+    memo=ImpactCache(fileHash("worldcitiesF23.csv"),maxsize)
+    folder=tempfile.mkdtemp()
+    try:
+        for query in selections:
+            store=quakes.take(quakes.mask(**query))
+            t1,expected=timeit(lambda:impactTable(store,cityDict,1,
+                                                  grid=grid),repeat=1)
+            before=memo.stats()
+            t2,got=timeit(lambda:impactTable(store,cityDict,1,grid=grid,
+                                             cache=memo),repeat=1)
+            for name in expected.names():
+                if not np.array_equal(got[name],expected[name]):
+                    raise AssertionError(f"cached {name} differs")
+            stats=memo.stats()
+            print(f"{len(store):>6} quakes: computed {t1:6.2f} s  cached "
+                  f"{t2:6.2f} s  {stats['hits']-before['hits']:>6} hits "
+                  f"{stats['misses']-before['misses']:>6} misses")
+        path=os.path.join(folder,"impact.npz")
+        t3,_=timeit(memo.save,path,repeat=1)
+        t4,loaded=timeit(lambda:ImpactCache(memo.cities,maxsize,path),
+                         repeat=1)
+        t5,_=timeit(lambda:impactTable(quakes.take(quakes.mask(
+                        **selections[0])),cityDict,1,grid=grid,
+                        cache=loaded),repeat=1)
+        print(f"saved {len(memo)} quakes in {t3*1000:.1f} ms, loaded in "
+              f"{t4*1000:.1f} ms, first selection from the loaded cache "
+              f"{t5:6.2f} s, hit rate {loaded.stats()['hit_rate']:.2f}")
+    finally:
+        shutil.rmtree(folder)
+
+def benchProfile(cityDict,calls=100000):
+    '''
+    Description : times an empty block and the findCities of the largest
+                  quake bare, inside a disabled stage and inside a stage
+                  timed with and without the peak memory.
+    '''
+    print("\n*** profiling: overhead of the stage timers ***")
+    points=Points.fromDegrees(cityDict.keys())
+    loc=(-36.122,-72.898)
+    def empty():
+        for i in range(calls):
+            pass
+    def staged():
+        for i in range(calls):
+            with profiling.stage('empty'):
+                pass
+    def search():
+        return findCities(loc,cityDict,250,points)
+    def stagedSearch():
+        with profiling.stage('findCities'):
+            return findCities(loc,cityDict,250,points)
+    t1,_=timeit(empty)
+    t2,_=timeit(search)
+    for label,memory in (('disabled',None),('time',False),
+                         ('time+memory',True)):
+        if memory is not None:
+            profiling.enable(memory)
+        try:
+            t3,_=timeit(staged)
+            t4,got=timeit(stagedSearch)
+        finally:
+            profiling.disable()
+        if got!=search():
+            raise AssertionError("profiled findCities differs")
+        print(f"{label:<12} stage {(t3-t1)/calls*1e6:7.3f} us per block  "
+              f"findCities {t2*1000:6.2f} ms bare, {t4*1000:6.2f} ms "
+              f"in a stage")
+
+def benchMultiLoad(cityDict,files=8,copies=2):
+    '''
+    Description : splits the quake file into several files, each row
+                  written copies times, and times loadCatalog with a
+                  growing number of processes against loadQuakes of the
+                  original file, checking the merged events are the same.
+    '''
+    print("\n*** multi-file loading: loadQuakes vs loadCatalog ***")
+    with open("earthquakesF23.csv") as f:
+        header=f.readline()
+        lines=f.read().rstrip('\n').split('\n')
+    folder=tempfile.mkdtemp()
+    try:
+        for i in range(files):
+            with open(f"{folder}/quakes{i}.csv",'w') as f:
+                f.write(header+'\n'.join(lines[i::files]*copies)+'\n')
+        t1,expected=timeit(loadQuakes,"earthquakesF23.csv",repeat=1)
+        expected=expected.take(uniqueRows(expected))
+        print(f"{len(expected)} quakes, one file: loadQuakes {t1:6.2f} s")
+        for workers in sorted({1,2,4,os.cpu_count() or 1}):
+            t2,got=timeit(lambda:loadCatalog(f"{folder}/*.csv",workers),
+                          repeat=1)
+            # the merged rows come in the order of the files
+            order=np.lexsort((got.lng,got.lat,got.datetime))
+            ref=np.lexsort((expected.lng,expected.lat,expected.datetime))
+            if len(got)!=len(expected) or not np.array_equal(
+                    got.magnitude[order],expected.magnitude[ref]):
+                raise AssertionError("merged catalogs differ")
+            print(f"{files} files x{copies}: {workers} processes "
+                  f"{t2:6.2f} s")
+    finally:
+        shutil.rmtree(folder)
+
+def benchCountries(cityDict,sample=200):
+    '''
+    Description : times the nearest city of every quake searched one
+                  quake at a time, with a findCities over the whole globe
+                  on a sample and with CityGrid.nearest, against the bulk
+                  nearestMany, and checks the cities are the same.
+    '''
+    print("\n*** nearest city of every quake: per quake vs nearestMany ***")
+    quakes=cachedQuakes()
+    grid=CityGrid(cityDict)
+    locs=list(zip(quakes.lat.tolist(),quakes.lng.tolist()))
+    t1,brute=timeit(lambda:[findCities(loc,cityDict,20040,grid.points)[0]
+                            for loc in locs[:sample]],repeat=1)
+    t2,looped=timeit(lambda:[grid.nearest(loc,1)[0] for loc in locs],
+                     repeat=1)
+    t3,(order,distance)=timeit(nearestMany,Points.fromDegrees(locs),
+                               grid.points)
+    if [d for d,o in looped]!=np.round(distance,2).tolist() or \
+       [o for d,o in looped]!=order.tolist():
+        raise AssertionError("nearest cities differ")
+    if [c['distance'] for c in brute]!=[d for d,o in looped[:sample]]:
+        raise AssertionError("findCities differs")
+    t4,table=timeit(lambda:countryTable(joinCountries(quakes,cityDict,
+                                                      grid.points)))
+    print(f"{len(locs)} quakes: findCities {t1/sample*len(locs):7.2f} s "
+          f"(from {sample})  CityGrid.nearest {t2:6.2f} s  nearestMany "
+          f"{t3:6.2f} s  country table {t4:6.2f} s, {len(table)} "
+          f"countries")
+
+def benchExport(cityDict,copies=10):
+    '''
+    Description : times writing the catalog repeated copies times as the
+                  rows of the records with csv and json.dumps, against
+                  the chunked csv, json lines and columnar writers, and
+                  reading the csv back against the memory mapped folder.
+    '''
+    print("\n*** export: per row writers vs chunked columns ***")
+    quakes=QuakeStore.concat([cachedQuakes()]*copies)
+    folder=tempfile.mkdtemp()
+    try:
+        def rowCsv(path):
+            with open(path,'w',newline='') as f:
+                write=csv.writer(f)
+                for loc,data in quakes.items():
+                    write.writerow([*loc,*data.values()])
+        def rowJson(path):
+            with open(path,'w') as f:
+                for loc,data in quakes.items():
+                    f.write(json.dumps({'lat':loc[0],'lng':loc[1],**data},
+                                       default=str)+'\n')
+        def readCsv(path):
+            with open(path,newline='') as f:
+                rows=list(csv.DictReader(f))
+            return np.array([float(row['magnitude']) for row in rows])
+        path=lambda name:os.path.join(folder,name)
+        t1,_=timeit(rowCsv,path('rows.csv'),repeat=1)
+        t2,_=timeit(rowJson,path('rows.jsonl'),repeat=1)
+        t3,_=timeit(exportTable,path('quakes.csv'),quakes,repeat=1)
+        t4,_=timeit(exportTable,path('quakes.jsonl'),quakes,repeat=1)
+        t5,_=timeit(exportTable,path('quakes'),quakes,repeat=1)
+        t6,parsed=timeit(readCsv,path('quakes.csv'),repeat=1)
+        t7,mapped=timeit(readTable,path('quakes'))
+        if not (np.array_equal(mapped.magnitude,quakes.magnitude) and
+                np.array_equal(parsed,quakes.magnitude) and
+                np.array_equal(mapped.datetime,quakes.datetime) and
+                np.array_equal(mapped.types.codes,quakes.types.codes)):
+            raise AssertionError("exported quakes differ")
+        with open(path('quakes.jsonl')) as f:
+            if len(f.readlines())!=len(quakes):
+                raise AssertionError("json lines differ")
+        print(f"{len(quakes)} quakes write csv: rows {t1:6.2f} s  chunked "
+              f"{t3:6.2f} s   json: rows {t2:6.2f} s  chunked {t4:6.2f} s"
+              f"   columns {t5:6.3f} s")
+        print(f"read back: csv {t6:6.2f} s  memory mapped {t7*1000:7.3f} ms")
+    finally:
+        shutil.rmtree(folder)
+
+def benchQuery(cityDict,copies=10):
+    '''
+    Description : times the eager selections against the Query over the
+                  dictionary, the store, its QuakeIndex and the csv file
+                  of the catalog repeated copies times, and checks that
+                  both select the same records.
+    '''
+    print("\n*** selection: eager vs lazy Query ***")
+    qDict=getQuakeData()
+    quakes=QuakeStore.concat([cachedQuakes()]*copies)
+    index=QuakeIndex(quakes)
+    folder=tempfile.mkdtemp()
+    try:
+        path=os.path.join(folder,'quakes.csv')
+        with open("earthquakesF23.csv") as f:
+            header=f.readline()
+            body=f.read()
+        with open(path,'w') as f:
+            f.write(header+body*copies)
+        conditions=dict(type='Ear',lat=(-10,10),lng=(100,150),
+                        date=('01/01/1990','12/31/2005'),mag=(6,7))
+        print(Query(path).where(**conditions).explain())
+        t1,expected=timeit(lambda:select(qDict,**conditions))
+        t2,got=timeit(lambda:Query(qDict).where(**conditions).collect())
+        if got!=expected:
+            raise AssertionError("selections of the dictionary differ")
+        print(f"dictionary {len(got)} of {len(qDict)}: select "
+              f"{t1*1000:7.2f} ms  Query {t2*1000:7.2f} ms")
+        t3,mask=timeit(lambda:quakes.mask(**conditions))
+        t4,fromStore=timeit(lambda:Query(quakes).where(**conditions)
+                                                .collect())
+        t5,fromIndex=timeit(lambda:Query(index).where(**conditions)
+                                               .collect())
+        t6,streamed=timeit(lambda:QuakeStore.concat(list(streamQuakes(
+                               path,**conditions))),repeat=1)
+        t7,pushed=timeit(lambda:Query(path).where(**conditions).collect(),
+                         repeat=1)
+        rows=np.flatnonzero(mask)
+        for store in (fromStore,fromIndex,streamed,pushed):
+            if not (np.array_equal(store.lat,quakes.lat[rows]) and
+                    np.array_equal(store.datetime,quakes.datetime[rows])):
+                raise AssertionError("selections of the store differ")
+        print(f"store {len(rows)} of {len(quakes)}: mask {t3*1000:7.2f} ms"
+              f"  Query {t4*1000:7.2f} ms  Query with index "
+              f"{t5*1000:7.2f} ms")
+        print(f"csv file: parse and mask {t6:6.2f} s  Query pushed into "
+              f"the reader {t7:6.2f} s")
+    finally:
+        shutil.rmtree(folder)
+
+def benchTimeSeries(cityDict,rows=10**6):
+    '''
+    Description : times the rolling event rates and b-values computed one
+                  window at a time against eventRates and rollingBValue
+                  on a synthetic catalog of rows quakes, checks that both
+                  agree and prints the fit of the real catalog.
+    '''
+    print("\n*** time series: window by window vs cumulative sums ***")
+    fmd,fit=gutenbergRichter(cachedQuakes())
+    print(f"catalog: Mc {fit['mc']:g}  b {fit['b']:.3f} ± "
+          f"{fit['b_error']:.3f}  from {fit['n']} quakes")
+    rng=np.random.default_rng(0)
+    start=np.datetime64('1965-01-01','ms')
+    times=np.sort(start+rng.integers(0,52*365*DAY_MS,rows)
+                  .astype('timedelta64[ms]'))
+    mags=np.round(5.5+rng.exponential(1/np.log(10),rows),1)
+    window,step=365,30
+    def looped():
+        counts=[]
+        end=times[0].astype('datetime64[D]').astype('datetime64[ms]')
+        span=np.timedelta64(window//step*step*DAY_MS,'ms')
+        while end<=times[-1]:
+            end=end+np.timedelta64(step*DAY_MS,'ms')
+            counts.append(int(((times>=end-span)&(times<end)).sum()))
+        return np.array(counts)
+    t1,expected=timeit(looped,repeat=1)
+    t2,rates=timeit(eventRates,times,None,window,step)
+    if not np.array_equal(expected,rates['count']):
+        raise AssertionError("event rates differ")
+    events,every=200,50
+    t3,slow=timeit(lambda:[bValue(mags[i:i+events],5.5)['b'] for i in
+                           range(0,rows-events+1,every)],repeat=1)
+    t4,fast=timeit(rollingBValue,times,mags,5.5,events,every)
+    if not np.allclose(slow,fast['b']):
+        raise AssertionError("rolling b-values differ")
+    print(f"{rows} quakes, {len(rates)} windows: looped {t1:6.2f} s  "
+          f"eventRates {t2*1000:7.2f} ms")
+    print(f"{len(fast)} b-value windows: looped {t3:6.2f} s  "
+          f"rollingBValue {t4*1000:7.2f} ms")
+
+BENCHMARKS={'findcities':benchFindCities,'haversine':benchHaversine,
+            'memory':benchMemory,'startup':benchStartup,'dates':benchDates,
+            'streaming':benchStreaming,'select':benchSelect,
+            'index':benchIndex,'aggregate':benchAggregate,
+            'impact':benchImpact,'nearest':benchNearest,
+            'render':benchRender,'cluster':benchCluster,
+            'ingest':benchIngest,'memo':benchMemo,
+            'profile':benchProfile,'multiload':benchMultiLoad,
+            'countries':benchCountries,'export':benchExport,
+            'query':benchQuery,'timeseries':benchTimeSeries}
+
+def main(names):
+    '''
+    Description : runs the benchmarks named on the command line, or all
+                  of them when no name is given.
+    '''
+    cityDict=getCityData()
+    for name in names or BENCHMARKS:
+        BENCHMARKS[name](cityDict)
+
+
+if __name__=="__main__":
+    main(sys.argv[1:])
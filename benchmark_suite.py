@@ -0,0 +1,283 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : benchmark_suite.py
+Purpose : Reproducible timing of the pipeline on synthetic catalogs of
+          10k to 10M rows, written as json so that the runs of different
+          versions can be compared
+Revisions:
+    00 : import the required modules
+    01 : define the stages, runSuite, compare and main
+    02 : the results go to .cache by default, out of the repository
+"""
+### Step 1 : Import the required modules
+import argparse # importing argparse module
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from final_project import findCities,select
+from haversine import Points
+from spatial_index import CityGrid
+from quake_store import QuakeStore,loadCities
+from streaming import streamQuakes,severity
+from cache import readCache,writeCache
+from range_index import QuakeIndex
+from aggregate import aggregate
+from render import drawQuakes
+from synthetic import syntheticQuakes,syntheticCities,parseSize,sizeName
+
+# catalog sizes of a full run
+SIZES=('10k','100k','1M','10M')
+# number of cities of the synthetic table, as in worldcitiesF23.csv
+CITIES=44554
+# folder of the synthetic files, kept between runs
+DATA_DIR=os.path.join(".cache","synthetic")
+# file of the results when --out is not given
+OUT_FILE=os.path.join(".cache","benchmark_results.json")
+# selection timed by the filter stages
+QUERY=dict(type='Earthquake',lat=(-40,40),date=('01/01/1990','12/31/2009'),
+           mag=(6,10))
+# number of quakes whose affected cities are searched
+QUERIES=20
+# largest catalog timed with the select of the dictionaries
+DICT_ROWS=10**6
+# catalogs up to this size are timed 3 times, the best run is kept
+REPEAT_ROWS=10**5
+# bump when the stages or the layout of the results change
+SUITE_VERSION=1
+
+### Step 2 : define the stages
+# every stage takes the context of its catalog and returns a number that
+# only depends on the data, e.g. the rows selected, which is written
+# next to the time so that runs on different data are told apart
+def stageLoad(ctx):
+    ctx['store']=QuakeStore.concat(list(streamQuakes(ctx['path'])))
+    return len(ctx['store'])
+
+def stageLoadCache(ctx):
+    return len(readCache(ctx['path'],QuakeStore,ctx['cache_dir']))
+
+def stageFilterScan(ctx):
+    return int(ctx['store'].mask(**QUERY).sum())
+
+def stageIndexBuild(ctx):
+    ctx['index']=QuakeIndex(ctx['store'])
+    return len(ctx['index'])
+
+def stageFilterIndex(ctx):
+    return len(ctx['index'].select(**QUERY))
+
+def stageSelect(ctx):
+    if 'items' not in ctx:
+        ctx['items']=list(ctx['store'].items())
+    return len(select(ctx['items'],**QUERY))
+
+def stageFindCities(ctx):
+    # the largest quakes, each with the radius of its severity
+    store=ctx['store']
+    rows=np.argsort(-store.magnitude,kind='stable')[:QUERIES]
+    found=0
+    for i in rows.tolist():
+        found+=len(findCities(store.location(i),ctx['cityDict'],
+                              float(severity(store.magnitude[i])),
+                              ctx['points']))
+    return found
+
+def stageFindCitiesGrid(ctx):
+    store=ctx['store']
+    rows=np.argsort(-store.magnitude,kind='stable')[:QUERIES]
+    grid=ctx['grid']
+    return sum(len(grid.findCities(store.location(i),
+                                   float(severity(store.magnitude[i]))))
+               for i in rows.tolist())
+
+def stageAggregate(ctx):
+    return len(aggregate(ctx['store'],'year'))
+
+def stagePlot(ctx):
+    store=ctx['store']
+    fig,ax=plt.subplots()
+    drawQuakes(ax,store.lng,store.lat,store.magnitude)
+    fig.savefig(os.path.join(ctx['out'],'quakes.png'))
+    plt.close(fig)
+    return len(store)
+
+# name, function and largest catalog of every stage, in the order run
+STAGES=[('load',stageLoad,None),
+        ('load_cache',stageLoadCache,None),
+        ('filter_scan',stageFilterScan,None),
+        ('index_build',stageIndexBuild,None),
+        ('filter_index',stageFilterIndex,None),
+        ('select',stageSelect,DICT_ROWS),
+        ('findcities',stageFindCities,None),
+        ('findcities_grid',stageFindCitiesGrid,None),
+        ('aggregate',stageAggregate,None),
+        ('plot',stagePlot,None)]
+
+### Step 3 : define the suite
+def machine():
+    '''
+    Returns a dictionary describing the interpreter, the libraries, the
+    machine and the version of the code
+    '''
+    try:
+        commit=subprocess.run(['git','rev-parse','--short','HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True,text=True,
+                              check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        commit=None
+    return {'python':platform.python_version(),'numpy':np.__version__,
+            'matplotlib':matplotlib.__version__,
+            'platform':platform.platform(),'cpus':os.cpu_count(),
+            'commit':commit}
+
+def runSuite(sizes=SIZES,cities=CITIES,seed=0,data_dir=DATA_DIR,
+             stages=None):
+    '''
+    Description : times every stage on the synthetic catalog of every
+                  size, generating the files first if they are missing.
+
+    Input:
+        sizes : catalog sizes, numbers of rows or names like '10k'
+        cities : number of cities of the synthetic city table
+        seed : seed of the synthetic files
+        data_dir : folder of the synthetic files
+        stages : names of the stages to time, every one if None. The
+                 stages that build the store and the index the others
+                 need are always run
+
+    Returns:
+        dictionary with the 'meta' data of the run and one 'results' row
+        per size and stage
+    '''
+    sizes=[parseSize(s) if isinstance(s,str) else s for s in sizes]
+    meta={'version':SUITE_VERSION,'date':datetime.now().isoformat(
+              timespec='seconds'),'seed':seed,'cities':cities,
+          'query':QUERY,'queries':QUERIES,'machine':machine()}
+    print(f"generating the synthetic files in {data_dir}")
+    cityPath=syntheticCities(cities,data_dir,seed)
+    cityDict=loadCities(cityPath).toDict()
+    points=Points.fromDegrees(cityDict.keys())
+    grid=CityGrid(cityDict)
+    results=[]
+    work=tempfile.mkdtemp()
+    try:
+        for n in sizes:
+            ctx={'path':syntheticQuakes(n,data_dir,seed),'cityDict':cityDict,
+                 'points':points,'grid':grid,'out':work,
+                 'cache_dir':tempfile.mkdtemp(dir=work)}
+            repeat=3 if n<=REPEAT_ROWS else 1
+            print(f"\n*** {sizeName(n)} quakes ***")
+            for name,func,limit in STAGES:
+                needed=name in ('load','index_build')
+                if (stages is not None and name not in stages and not needed) \
+                   or (limit is not None and n>limit):
+                    continue
+                runs=[]
+                for i in range(repeat):
+                    start=perf_counter()
+                    value=func(ctx)
+                    runs.append(perf_counter()-start)
+                results.append({'rows':n,'stage':name,'seconds':min(runs),
+                                'runs':runs,'result':value})
+                print(f"{name:<16}{min(runs):10.4f} s  result {value}")
+                if name=='load':
+                    # the binary cache is written from the streamed store,
+                    # parsing the whole file at once would not fit in
+                    # memory at 10M rows, load_cache times reading it
+                    writeCache(ctx['path'],ctx['store'],ctx['cache_dir'])
+    finally:
+        shutil.rmtree(work)
+    return {'meta':meta,'results':results}
+
+def compare(new,old,threshold=1.25):
+    '''
+    Description : prints the time of every stage of the new run against
+                  the same stage and size of the old one.
+
+    Input:
+        new,old : results of runSuite
+        threshold : ratio of the times above which a stage is reported
+                    as slower
+
+    Returns:
+        list of (rows,stage,ratio) of the slower stages
+    '''
+    before={(r['rows'],r['stage']):r for r in old['results']}
+    slower=[]
+    print(f"\n*** compared with the run of {old['meta']['date']} "
+          f"(commit {old['meta']['machine']['commit']}) ***")
+    for r in new['results']:
+        o=before.get((r['rows'],r['stage']))
+        if o is None:
+            continue
+        ratio=r['seconds']/o['seconds'] if o['seconds'] else float('inf')
+        note=''
+        if o['result']!=r['result']:
+            note='  different result'
+        elif ratio>threshold:
+            note='  SLOWER'
+            slower.append((r['rows'],r['stage'],ratio))
+        print(f"{sizeName(r['rows']):>5} {r['stage']:<16}"
+              f"{o['seconds']:10.4f} s {r['seconds']:10.4f} s "
+              f"{ratio:6.2f}x{note}")
+    return slower
+
+### Step 4 : define the command line
+def main(argv=None):
+    '''
+    Description : runs the suite, writes the results to a json file and
+                  compares them with an earlier run if given.
+
+    Returns:
+        exit status, 1 if a stage got slower than the earlier run
+    '''
+    parser=argparse.ArgumentParser(
+        description="Time the pipeline on synthetic catalogs and write "
+                    "the results as json.")
+    parser.add_argument('--sizes',default=','.join(SIZES),
+                        help="comma separated catalog sizes, e.g. 10k,1M")
+    parser.add_argument('--cities',type=int,default=CITIES,metavar='N',
+                        help="number of synthetic cities")
+    parser.add_argument('--seed',type=int,default=0)
+    parser.add_argument('--data',default=DATA_DIR,metavar='DIR',
+                        help="folder of the synthetic files")
+    parser.add_argument('--stages',help="comma separated stages, of "+
+                        ','.join(name for name,func,limit in STAGES))
+    parser.add_argument('--out',default=OUT_FILE,
+                        metavar='JSON',help="file of the results")
+    parser.add_argument('--compare',metavar='JSON',
+                        help="results of an earlier run")
+    parser.add_argument('--threshold',type=float,default=1.25,
+                        help="ratio of the times reported as slower")
+    args=parser.parse_args(argv)
+    stages=args.stages.split(',') if args.stages else None
+    run=runSuite(args.sizes.split(','),args.cities,args.seed,args.data,
+                 stages)
+    os.makedirs(os.path.dirname(args.out) or '.',exist_ok=True)
+    with open(args.out,'w') as f:
+        json.dump(run,f,indent=2)
+    print(f"\nWrote {len(run['results'])} results to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            old=json.load(f)
+        if old['meta']['seed']!=run['meta']['seed'] or \
+           old['meta']['cities']!=run['meta']['cities']:
+            print("the earlier run used other synthetic files")
+        if compare(run,old,args.threshold):
+            return 1
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : cache.py
+Purpose : Binary cache of the parsed csv files so that a warm start
+          loads the arrays of the stores instead of parsing the text
+Revisions:
+    00 : import the required modules
+    01 : define fileSignature,fileHash,cachedLoad,cachedQuakes and
+         cachedCities functions
+    02 : version 2 for the float64 depth of the QuakeStore
+    03 : signedHash keeps the hash of a file whose size and modification
+         time did not change
+"""
+### Step 1 : Import the required modules
+import hashlib
+import json
+import os
+import numpy as np
+from quake_store import QuakeStore,CityStore,loadQuakes,loadCities
+
+# folder holding the cache files, next to the csv files by default
+CACHE_DIR=".cache"
+# bump when the layout of the cached arrays changes
+CACHE_VERSION=2
+
+### Step 2 : define the signature functions
+def fileSignature(path):
+    '''
+    Input:
+        path : path of the source file
+
+    Returns:
+        dictionary with the size and modification time of the file
+    '''
+    st=os.stat(path)
+    return {'version':CACHE_VERSION,'size':st.st_size,
+            'mtime_ns':st.st_mtime_ns}
+
+def fileHash(path,block=1<<20):
+    '''
+    Returns the sha1 hex digest of the content of the file
+    '''
+    digest=hashlib.sha1()
+    with open(path,'rb') as f:
+        for chunk in iter(lambda:f.read(block),b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def signedHash(path,known=None):
+    '''
+    Description : signature of the file with the sha1 of its content. The
+                  content is only hashed when the size or modification
+                  time differ from those of known, as readCache trusts
+                  them.
+
+    Input:
+        path : path of the file
+        known : dictionary returned by an earlier call, if any
+
+    Returns:
+        dictionary of fileSignature with the sha1 of the content
+    '''
+    signature=fileSignature(path)
+    if known and all(known.get(k)==v for k,v in signature.items()):
+        signature['sha1']=known['sha1']
+    else:
+        signature['sha1']=fileHash(path)
+    return signature
+
+def cacheFile(path,cache_dir=CACHE_DIR):
+    '''
+    Returns the path of the cache file for the source file
+    '''
+    return os.path.join(cache_dir,os.path.basename(path)+'.npz')
+
+### Step 3 : define the cache loaders
+def readCache(path,cls,cache_dir=CACHE_DIR,verify=False):
+    '''
+    Description : loads the store from the cache file if it was written
+                  for the current content of the source file. A file
+                  whose size and modification time are unchanged is
+                  trusted, otherwise (or when verify is True) the hash
+                  of the content has to match.
+
+    Returns:
+        the store, or None when the cache is missing or out of date
+    '''
+    name=cacheFile(path,cache_dir)
+    if not os.path.exists(name):
+        return None
+    try:
+        with np.load(name,allow_pickle=False) as npz:
+            cached=json.loads(str(npz['signature']))
+            current=fileSignature(path)
+            if cached['version']!=current['version'] or \
+               cached['size']!=current['size']:
+                return None
+            if verify or cached['mtime_ns']!=current['mtime_ns']:
+                if cached['sha1']!=fileHash(path):
+                    return None
+            return cls.fromColumns({k:npz[k] for k in npz.files})
+    except (OSError,ValueError,KeyError):
+        # a damaged cache file is rebuilt from the source
+        return None
+
+def writeCache(path,store,cache_dir=CACHE_DIR):
+    '''
+    Description : writes the columns of the store with the signature of
+                  the source file. The file is written under a temporary
+                  name and then renamed so that readers never see a half
+                  written cache.
+    '''
+    os.makedirs(cache_dir,exist_ok=True)
+    signature=fileSignature(path)
+    signature['sha1']=fileHash(path)
+    name=cacheFile(path,cache_dir)
+    tmp=name+'.tmp.npz'
+    np.savez(tmp,signature=np.array(json.dumps(signature)),
+             **store.columns())
+    os.replace(tmp,name)
+
+def cachedLoad(path,loader,cls,cache_dir=CACHE_DIR,verify=False):
+    '''
+    Input:
+        path : path of the source csv file
+        loader : function parsing the csv file into a store
+        cls : class of the store
+        cache_dir : folder of the cache files
+        verify : always compare the hash of the source file
+
+    Returns:
+        the store, from the cache when it is up to date
+    '''
+    store=readCache(path,cls,cache_dir,verify)
+    if store is None:
+        store=loader(path)
+        try:
+            writeCache(path,store,cache_dir)
+        except OSError as e:
+            print(f"could not write the cache for {path}: {e}")
+    return store
+
+def cachedQuakes(path="earthquakesF23.csv",cache_dir=CACHE_DIR,
+                 verify=False):
+    '''
+    Returns the QuakeStore of the file, parsed only when it changed
+    '''
+    return cachedLoad(path,loadQuakes,QuakeStore,cache_dir,verify)
+
+def cachedCities(path="worldcitiesF23.csv",cache_dir=CACHE_DIR,
+                 verify=False):
+    '''
+    Returns the CityStore of the file, parsed only when it changed
+    '''
+    return cachedLoad(path,loadCities,CityStore,cache_dir,verify)
@@ -0,0 +1,434 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : cluster.py
+Purpose : Seismic hotspots and aftershock sequences found by density
+          based clustering (DBSCAN) of the quake locations on the
+          haversine distance, optionally within a time window, with a
+          grid neighbor index instead of comparing every pair of quakes
+Revisions:
+    00 : import the required modules
+    01 : define neighborPairs,dbscan and clusterSummary
+    02 : neighborPairs for given rows only and the Hotspots class
+         updating the clusters as quakes are appended
+    03 : Hotspots.update merges the clusters among the roots of the new
+         edges instead of over every quake
+    04 : neighborPairs bins the quakes in a ChordGrid
+    05 : Hotspots keeps the unit vectors and the cells of the quakes, so
+         that an update bins and searches around the new quakes only,
+         and the clusters as a forest of parents
+"""
+### Step 1 : Import the required modules
+from math import sin
+import numpy as np
+from aggregate import groupBy,AggTable
+from haversine import Points,earthRadius
+from quake_store import QuakeStore,ArrayBuffer
+from range_index import SortedIndex
+from spatial_index import ChordGrid
+
+# default neighborhood radius in km and number of quakes of a core quake
+EPS=100.0
+MIN_SAMPLES=5
+# largest number of cells along an axis of the neighbor grid, so that
+# the cell codes fit in 64 bits
+MAX_CELLS=1<<20
+
+### Step 2 : define the neighbor search
+def closePairs(xyz,i,j,eps,radius,times=None,eps_days=None):
+    '''
+    Description : keeps the candidate pairs of different points within
+                  eps of each other, and within eps_days with times
+
+    Input:
+        xyz : unit vectors of the points
+        i,j : arrays of the candidate pairs
+        eps,times,eps_days : as in neighborPairs
+        radius : radius of earth in the unit of eps
+
+    Returns:
+        (i,j,distance) arrays of the pairs kept
+    '''
+    keep=i!=j
+    i,j=i[keep],j[keep]
+    d=xyz[i]-xyz[j]
+    # the haversine distance from the chord as in havDistMany
+    a=np.einsum('ij,ij->i',d,d)*0.25
+    d=2*radius*np.arcsin(np.sqrt(np.minimum(a,1.0)))
+    keep=d<=eps
+    if times is not None and eps_days is not None:
+        gap=np.abs(times[i]-times[j])
+        keep&=gap<=np.timedelta64(int(eps_days*86400000),'ms')
+    return i[keep],j[keep],d[keep]
+
+def neighborPairs(points,eps,times=None,eps_days=None,unit="km",
+                  rows=None):
+    '''
+    Description : every pair of points within eps of each other. The
+                  points are binned on a 3D grid of their unit vectors
+                  with cells as wide as the chord of eps, so only the 27
+                  cells around every point are compared.
+
+    Input:
+        points : Points of the quakes
+        eps : largest distance between neighbors, included
+        times : optional datetime64 array of the quakes
+        eps_days : largest number of days between neighbors, included,
+                   only with times
+        unit : "km" for kilometers, otherwise miles
+        rows : optional array of the points whose neighbors are wanted,
+               every point if None
+
+    Returns:
+        (i,j,distance) arrays with both (i,j) and (j,i) for every pair of
+        different points, sorted by i then j, with i among rows when
+        given
+    '''
+    n=len(points)
+    radius=earthRadius(unit)
+    # chord between two points eps apart on the unit sphere
+    chord=2*sin(min(eps/radius,np.pi)/2)
+    if n==0:
+        empty=np.zeros(0,dtype=np.intp)
+        return empty,empty,np.zeros(0)
+    if chord<=2.0/MAX_CELLS:
+        raise ValueError(f"eps <{eps}> too small for the neighbor grid")
+    grid=ChordGrid(points.xyz,chord)
+    rows=np.arange(n) if rows is None else np.asarray(rows,dtype=np.intp)
+    found_i,found_j,found_d=[],[],[]
+    # one cell around every point at a time, to keep the pairs small
+    for offset in grid.offsets.tolist():
+        lo,hi=grid.bounds(grid.codes[rows]+offset)
+        count=hi-lo
+        total=int(count.sum())
+        if total==0:
+            continue
+        i=np.repeat(rows,count)
+        # position of every pair inside the range of its cell
+        inside=np.arange(total)-np.repeat(np.cumsum(count)-count,count)
+        j=grid.order[np.repeat(lo,count)+inside]
+        i,j,d=closePairs(points.xyz,i,j,eps,radius,times,eps_days)
+        found_i.append(i)
+        found_j.append(j)
+        found_d.append(d)
+    i=np.concatenate(found_i+[np.zeros(0,dtype=np.intp)])
+    j=np.concatenate(found_j+[np.zeros(0,dtype=np.intp)])
+    d=np.concatenate(found_d+[np.zeros(0)])
+    order=np.lexsort((j,i))
+    return i[order],j[order],d[order]
+
+### Step 3 : define the clustering
+def components(n,i,j):
+    '''
+    Description : connected components of a graph by propagating the
+                  smallest label along the edges with pointer jumping.
+
+    Input:
+        n : number of nodes
+        i,j : arrays of the edges
+
+    Returns:
+        array with the smallest node of the component of every node
+    '''
+    labels=np.arange(n)
+    while True:
+        before=labels.copy()
+        np.minimum.at(labels,i,labels[j])
+        np.minimum.at(labels,j,labels[i])
+        # jump to the label of the label until it settles
+        while True:
+            jumped=labels[labels]
+            if np.array_equal(jumped,labels):
+                break
+            labels=jumped
+        if np.array_equal(labels,before):
+            return labels
+
+def toStore(quakes):
+    '''
+    Returns the quakes as a QuakeStore, from a store, a dictionary or a
+    list of (location,data) tuples
+    '''
+    return quakes if isinstance(quakes,QuakeStore) else \
+           QuakeStore.fromItems(quakes)
+
+def dbscan(quakes,eps=EPS,min_samples=MIN_SAMPLES,eps_days=None):
+    '''
+    Description : DBSCAN of the quakes on the haversine distance. A quake
+                  with at least min_samples quakes (itself included)
+                  within eps km is a core quake, core quakes within eps
+                  of each other share a cluster and the other quakes
+                  join the cluster of their nearest core quake within
+                  eps, or are noise. With eps_days the neighbors must
+                  also be at most eps_days apart, which separates the
+                  aftershock sequences of a hotspot.
+
+    Input:
+        quakes : QuakeStore, dictionary of quakes data or list of
+                 (location,data) tuples such as mag_selected
+        eps : neighborhood radius in kilometers
+        min_samples : number of quakes in the neighborhood of a core quake
+        eps_days : optional time window in days
+
+    Returns:
+        int64 array of the cluster of every quake, numbered from 0 in the
+        order of their first quake, -1 for noise
+    '''
+    quakes=toStore(quakes)
+    n=len(quakes)
+    points=Points.fromDegrees(np.column_stack((quakes.lat,quakes.lng)))
+    i,j,d=neighborPairs(points,eps,quakes.datetime,eps_days)
+    core=np.bincount(i,minlength=n)+1>=min_samples
+    edges=core[i]&core[j]
+    roots=components(n,i[edges],j[edges])
+    labels=np.full(n,-1,dtype=np.int64)
+    # clusters numbered by their smallest quake, which is the root
+    found,number=np.unique(roots[core],return_inverse=True)
+    labels[core]=number.reshape(-1)
+    # border quakes take the cluster of their nearest core neighbor
+    border=~core[i]&core[j]
+    bi,bj,bd=i[border],j[border],d[border]
+    nearest=np.lexsort((bd,bi))
+    bi,bj=bi[nearest],bj[nearest]
+    first=np.r_[True,bi[1:]!=bi[:-1]] if len(bi) else np.zeros(0,dtype=bool)
+    labels[bi[first]]=labels[bj[first]]
+    return labels
+
+def clusterSummary(quakes,labels):
+    '''
+    Description : one row per cluster with its number of quakes, the
+                  centroid of its locations, its largest magnitude and
+                  the first and last date of its quakes.
+
+    Input:
+        quakes : QuakeStore, dictionary of quakes data or list of
+                 (location,data) tuples, as given to dbscan
+        labels : clusters returned by dbscan
+
+    Returns:
+        AggTable with the columns cluster, count, lat, lng, magnitude_max,
+        start, end and days, largest cluster first
+    '''
+    quakes=toStore(quakes)
+    labels=np.asarray(labels)
+    keep=labels>=0
+    points=Points.fromDegrees(np.column_stack((quakes.lat[keep],
+                                               quakes.lng[keep])))
+    x,y,z=points.xyz.T
+    ms=quakes.datetime[keep].astype(np.int64).astype(np.float64)
+    groups=groupBy({'cluster':labels[keep]},
+                   {'x':x,'y':y,'z':z,'magnitude':quakes.magnitude[keep],
+                    'time':ms},quantiles=())
+    # the centroid is the mean of the unit vectors brought back onto the
+    # sphere, so clusters across the antimeridian stay in place
+    lat=np.degrees(np.arctan2(groups['z_sum'],
+                              np.hypot(groups['x_sum'],groups['y_sum'])))
+    lng=np.degrees(np.arctan2(groups['y_sum'],groups['x_sum']))
+    start=groups['time_min'].astype(np.int64).astype('datetime64[ms]')
+    end=groups['time_max'].astype(np.int64).astype('datetime64[ms]')
+    order=np.argsort(-groups['count'],kind='stable')
+    columns={'cluster':groups['cluster'],'count':groups['count'],
+             'lat':lat,'lng':lng,'magnitude_max':groups['magnitude_max'],
+             'start':start,'end':end,
+             'days':(end-start).astype(np.float64)/86400000}
+    return AggTable({name:values[order] for name,values in columns.items()},
+                    ['cluster'])
+
+### Step 4 : define the incremental clustering
+class Hotspots:
+    '''
+    Description : the clusters of dbscan kept up to date as quakes are
+                  appended. The neighbor counts only grow, so a core
+                  quake stays core: every update looks for the neighbors
+                  of the new quakes and of the quakes that became core,
+                  merges the clusters they join and moves the border
+                  quakes to a nearer core quake. The unit vectors and the
+                  cells of a ChordGrid around the sphere are kept for
+                  every quake, so an update bins the new quakes only and
+                  searches the cells around them. The labels are the
+                  same as those of dbscan over all the quakes.
+    '''
+    def __init__(self,eps=EPS,min_samples=MIN_SAMPLES,eps_days=None):
+        self.eps=eps
+        self.min_samples=min_samples
+        self.eps_days=eps_days
+        chord=2*sin(min(eps/earthRadius("km"),np.pi)/2)
+        if chord<=2.0/MAX_CELLS:
+            raise ValueError(f"eps <{eps}> too small for the neighbor grid")
+        # cells of the grid, the quakes are binned into them as they come
+        self.grid=ChordGrid(np.zeros((0,3)),chord,sphere=True)
+        # unit vector and cell of every quake, the quakes by cell
+        self.xyz=ArrayBuffer(np.zeros((0,3)))
+        self.codes=ArrayBuffer(np.zeros(0,dtype=np.int64))
+        self.cells=SortedIndex(self.codes.values)
+        # neighbors within eps of every quake, itself included
+        self.counts=ArrayBuffer(np.zeros(0,dtype=np.int64))
+        # parent of every core quake in the tree of its cluster, the root
+        # being the smallest core quake of the cluster, the quake itself
+        # otherwise
+        self.parents=ArrayBuffer(np.zeros(0,dtype=np.int64))
+        # nearest core quake within eps and its distance, the quake
+        # itself when core and -1 without any
+        self.nearest=ArrayBuffer(np.zeros(0,dtype=np.int64))
+        self.distance=ArrayBuffer(np.zeros(0))
+
+    def __len__(self):
+        return len(self.counts)
+
+    def state(self):
+        '''
+        Returns the arrays of the clustering, for fromState
+        '''
+        return {'xyz':self.xyz.values,'counts':self.counts.values,
+                'parents':self.parents.values,
+                'nearest':self.nearest.values,
+                'distance':self.distance.values,
+                'cells':self.cells.order.values,
+                'cells_runs':self.cells.stops()}
+
+    @classmethod
+    def fromState(cls,state,eps=EPS,min_samples=MIN_SAMPLES,eps_days=None):
+        '''
+        Input:
+            state : mapping of name to array as given by state()
+        '''
+        hotspots=cls(eps,min_samples,eps_days)
+        for name in ('xyz','counts','parents','nearest','distance'):
+            setattr(hotspots,name,ArrayBuffer(state[name]))
+        hotspots.codes=ArrayBuffer(hotspots.grid.cellOf(hotspots.xyz.values))
+        hotspots.cells=SortedIndex.fromOrder(hotspots.codes.values,
+                                             state['cells'],
+                                             state['cells_runs'])
+        return hotspots
+
+    def neighbors(self,rows,times):
+        '''
+        Description : the quakes within eps of the rows, from the cells
+                      around the cells of the rows
+
+        Input:
+            rows : array of quakes
+            times : datetime64 array of every quake
+
+        Returns:
+            (i,j,distance) arrays as neighborPairs with rows
+        '''
+        radius=earthRadius("km")
+        codes=self.codes.values[rows]
+        found_i,found_j,found_d=[],[],[]
+        for offset in self.grid.offsets.tolist():
+            k,j=self.cells.matches(codes+offset)
+            i,j,d=closePairs(self.xyz.values,rows[k],j,self.eps,radius,
+                             times,self.eps_days)
+            found_i.append(i)
+            found_j.append(j)
+            found_d.append(d)
+        i=np.concatenate(found_i+[np.zeros(0,dtype=np.intp)])
+        j=np.concatenate(found_j+[np.zeros(0,dtype=np.intp)])
+        d=np.concatenate(found_d+[np.zeros(0)])
+        order=np.lexsort((j,i))
+        return i[order],j[order],d[order]
+
+    def find(self,rows):
+        '''
+        Returns the roots of the clusters of core quakes, the rows are
+        made to point at their root
+        '''
+        parents=self.parents.values
+        top=parents[rows]
+        while True:
+            up=parents[top]
+            if np.array_equal(up,top):
+                break
+            top=up
+        parents[rows]=top
+        return top
+
+    def update(self,quakes):
+        '''
+        Input:
+            quakes : QuakeStore of the quakes already clustered followed
+                     by the new ones
+
+        Returns:
+            (rows,cells) the quakes clustered before whose count, parent
+            or nearest core quake may have changed, and the first
+            position of the order of the cells that changed
+        '''
+        first,n=len(self),len(quakes)
+        if n==first:
+            return np.zeros(0,dtype=np.intp),len(self.cells)
+        new=np.arange(first,n)
+        xyz=Points.fromDegrees(np.column_stack((quakes.lat[first:],
+                                                quakes.lng[first:]))).xyz
+        self.xyz.extend(xyz)
+        codes=self.codes.extend(self.grid.cellOf(xyz))
+        cells=self.cells.extend(codes[first:],first)
+        i,j,d=self.neighbors(new,quakes.datetime)
+        # the quakes whose count grows, and whether they were core
+        counts=self.counts.extend(np.ones(n-first,dtype=np.int64))
+        touched=np.unique(np.concatenate((new,j)))
+        was=counts[touched]>=self.min_samples
+        was[touched>=first]=False
+        old=j<first
+        np.add.at(counts,i,1)
+        np.add.at(counts,j[old],1)
+        newly=touched[(counts[touched]>=self.min_samples)&~was]
+        ci,cj,cd=self.neighbors(newly,quakes.datetime)
+        # clusters joined by the quakes that became core, the roots of the
+        # edges are linked to the smallest root of their component
+        parents=self.parents.extend(new)
+        edges=counts[cj]>=self.min_samples
+        a,b=self.find(ci[edges]),self.find(cj[edges])
+        ends=np.unique(np.concatenate((a,b)))
+        smallest=ends[components(len(ends),np.searchsorted(ends,a),
+                                 np.searchsorted(ends,b))]
+        moved=ends!=smallest
+        parents[ends[moved]]=smallest[moved]
+        # nearest core quake of the quakes that are not core, from the new
+        # quakes to any core quake and from the new core quakes to any
+        # quake that is not core
+        nearest=self.nearest.extend(np.full(n-first,-1))
+        distance=self.distance.extend(np.full(n-first,np.inf))
+        nearest[newly]=newly
+        distance[newly]=0.0
+        border=(counts[i]<self.min_samples)&(counts[j]>=self.min_samples)
+        bi=np.concatenate((i[border],cj[~edges]))
+        bj=np.concatenate((j[border],ci[~edges]))
+        bd=np.concatenate((d[border],cd[~edges]))
+        # the current choice competes with the candidates, the nearest
+        # wins and the smallest quake among equal distances
+        kept=np.unique(bi)
+        kept=kept[(nearest[kept]>=0)&(counts[kept]<self.min_samples)]
+        bi=np.concatenate((bi,kept))
+        bj=np.concatenate((bj,nearest[kept]))
+        bd=np.concatenate((bd,distance[kept]))
+        order=np.lexsort((bj,bd,bi))
+        bi,bj,bd=bi[order],bj[order],bd[order]
+        first_of=np.r_[True,bi[1:]!=bi[:-1]] if len(bi) else \
+                 np.zeros(0,dtype=bool)
+        nearest[bi[first_of]]=bj[first_of]
+        distance[bi[first_of]]=bd[first_of]
+        rows=np.unique(np.concatenate((j[old],newly,ci[edges],cj[edges],
+                                       ends,bi[first_of])))
+        return rows[rows<first],cells
+
+    def labels(self):
+        '''
+        Returns the cluster of every quake numbered as dbscan does, -1
+        for noise
+        '''
+        counts=self.counts.values
+        core=counts>=self.min_samples
+        roots=self.parents.values
+        while True:
+            up=roots[roots]
+            if np.array_equal(up,roots):
+                break
+            roots=up
+        labels=np.full(len(self),-1,dtype=np.int64)
+        found,number=np.unique(roots[core],return_inverse=True)
+        labels[core]=number.reshape(-1)
+        nearest=self.nearest.values
+        border=~core&(nearest>=0)
+        labels[border]=labels[nearest[border]]
+        return labels
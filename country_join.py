@@ -0,0 +1,208 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : country_join.py
+Purpose : Tagging every quake with its nearest city, the country and the
+          distance in one vectorized pass over a grid of the cities, and
+          the number and magnitudes of the quakes of every country
+Revisions:
+    00 : import the required modules
+    01 : define chordKm,nearestMany,nearestOfCell,joinCountries and
+         countryTable
+    02 : nearestMany bins the cities in a ChordGrid
+"""
+### Step 1 : Import the required modules
+from math import sin
+import numpy as np
+from aggregate import groupBy,AggTable
+from haversine import Points,earthRadius
+from quake_store import QuakeStore
+from spatial_index import ChordGrid
+
+# width in km of the grid cells of the first search, doubled for the
+# quakes whose nearest city may lie outside the cells searched
+START_KM=100.0
+# largest number of (quake,city) pairs compared at a time
+MAX_PAIRS=4000000
+
+### Step 2 : define the nearest city search
+def chordKm(a,radius):
+    '''
+    Returns the haversine distance of squared half chords a, as in
+    havDistMany
+    '''
+    return 2*radius*np.arcsin(np.sqrt(np.clip(a,0.0,1.0)))
+
+def nearestMany(points,cities,start_km=START_KM,unit="km",
+                max_pairs=MAX_PAIRS):
+    '''
+    Description : the nearest city of every point. The cities are binned
+                  on a 3D grid of their unit vectors. The points of a
+                  cell are compared at once with the cities of the 27
+                  cells around it, one matrix product per cell. A city
+                  nearer than the width of a cell is the nearest one, the
+                  other points are searched again on a grid of cells
+                  twice as wide.
+
+    Input:
+        points : Points of the quakes
+        cities : Points of the cities
+        start_km : width of the cells of the first grid
+        unit : "km" for kilometers, otherwise miles
+        max_pairs : largest number of (point,city) pairs compared at a
+                    time
+
+    Returns:
+        (order,distance) arrays, the position of the nearest city of
+        every point and its distance. Distances equal to 2 decimals are
+        broken by the position of the city, as in CityGrid.nearest.
+    '''
+    n=len(points)
+    order=np.full(n,-1,dtype=np.intp)
+    distance=np.full(n,np.inf)
+    if n==0 or len(cities)==0:
+        return order,distance
+    radius=earthRadius(unit)
+    todo=np.arange(n)
+    chord=2*sin(min(start_km/radius,np.pi)/2)
+    while len(todo):
+        # every point and city share a cell once the cells are as wide
+        # as the sphere
+        last=chord>=2.0
+        grid=ChordGrid(cities.xyz,chord)
+        # the points grouped by cell and the city ranges of the 27 cells
+        # around every cell
+        groups,inverse=np.unique(grid.cellOf(points.xyz[todo]),
+                                 return_inverse=True)
+        byGroup=np.argsort(inverse,kind='stable')
+        bounds=np.cumsum(np.bincount(inverse.ravel(),
+                                     minlength=len(groups)))
+        lo,hi=grid.bounds(groups[:,None]+grid.offsets)
+        for g in range(len(groups)):
+            ids=[grid.order[l:h] for l,h in zip(lo[g].tolist(),
+                                                hi[g].tolist())
+                 if h>l]
+            if not ids:
+                continue
+            ids=np.concatenate(ids)
+            rows=todo[byGroup[(bounds[g-1] if g else 0):bounds[g]]]
+            step=max(1,max_pairs//len(ids))
+            for k in range(0,len(rows),step):
+                part=rows[k:k+step]
+                nearestOfCell(points.xyz[part],cities.xyz[ids],ids,radius,
+                              order,distance,part)
+        if last:
+            break
+        # a city outside the 27 cells is at least a cell width away, the
+        # rounding step keeps a tie with such a city from being missed
+        width=2*radius*np.arcsin(chord/2)
+        todo=todo[np.round(distance[todo],2)+0.01>=width]
+        chord=min(chord*2,2.0)
+    return order,distance
+
+def nearestOfCell(xyz,cxyz,ids,radius,order,distance,rows):
+    '''
+    Description : writes the nearest of the candidate cities of every
+                  point to order and distance at rows.
+
+    Input:
+        xyz : unit vectors of the points
+        cxyz : unit vectors of the candidate cities
+        ids : positions of the candidate cities
+        radius : radius of the earth
+        order,distance : arrays of the results
+        rows : positions of the points in the results
+    '''
+    # the nearest city has the largest dot product
+    dots=xyz@cxyz.T
+    top=chordKm((1.0-dots.max(axis=1))*0.5,radius)
+    # cities that may round to the distance of the nearest one, a little
+    # margin covers the rounding of the dot products
+    limit=np.sin(np.minimum((np.round(top,2)+0.006)/(2*radius),np.pi/2))**2
+    r,c=np.nonzero((1.0-dots)*0.5<=limit[:,None])
+    # their distances from the chords as in havDistMany, the first city
+    # at the smallest rounded distance
+    d=xyz[r]-cxyz[c]
+    d=chordKm(np.einsum('ij,ij->i',d,d)*0.25,radius)
+    best=np.lexsort((ids[c],np.round(d,2),r))
+    first=np.ones(len(best),dtype=bool)
+    first[1:]=r[best][1:]!=r[best][:-1]
+    best=best[first]
+    better=d[best]<distance[rows[r[best]]]
+    best=best[better]
+    order[rows[r[best]]]=ids[c[best]]
+    distance[rows[r[best]]]=d[best]
+
+### Step 3 : define the join and the country table
+def joinCountries(quakes,cityDict,points=None):
+    '''
+    Description : tags every quake with its nearest city, the country
+                  and iso3 code of the city and the distance to it.
+
+    Input:
+        quakes : QuakeStore, dictionary of quakes data or list of
+                 (location,data) tuples such as mag_selected
+        cityDict : Dictionary of cities data (from getCityData)
+        points : optional Points of the cityDict keys, converted if not
+                 given
+
+    Returns:
+        AggTable with one row per quake in the order of the selection:
+        lat, lng, datetime, magnitude, depth, city, country, iso3 and
+        distance (km)
+    '''
+    if not isinstance(quakes,QuakeStore):
+        quakes=QuakeStore.fromItems(quakes)
+    if points is None:
+        points=Points.fromDegrees(cityDict.keys())
+    cities=list(cityDict.values())
+    order,distance=nearestMany(Points.fromDegrees(
+        np.column_stack((quakes.lat,quakes.lng))),points)
+    # the empty names of the last entry for quakes without any city
+    names={field:np.array([data[field] for data in cities]+[''],
+                          dtype=object)
+           for field in ('city','country','iso3')}
+    return AggTable({'lat':quakes.lat,'lng':quakes.lng,
+                     'datetime':quakes.datetime,
+                     'magnitude':quakes.magnitude,'depth':quakes.depth,
+                     'city':names['city'][order],
+                     'country':names['country'][order],
+                     'iso3':names['iso3'][order],
+                     'distance':distance},('lat','lng'))
+
+def countryTable(joined):
+    '''
+    Description : one row per country with the number of quakes nearest
+                  to its cities, their magnitudes and distances.
+
+    Input:
+        joined : AggTable of joinCountries
+
+    Returns:
+        AggTable with the columns country, iso3, count, magnitude_mean,
+        magnitude_max, depth_mean, distance_mean and distance_max, the
+        country with the most quakes first
+    '''
+    if len(joined)==0:
+        return AggTable({name:np.zeros(0) for name in
+                         ('country','iso3','count','magnitude_mean',
+                          'magnitude_max','depth_mean','distance_mean',
+                          'distance_max')},['country'])
+    groups=groupBy({'country':joined['country']},
+                   {'magnitude':joined['magnitude'],
+                    'depth':joined['depth'],
+                    'distance':joined['distance']},quantiles=())
+    # iso3 code of the first quake of every country
+    countries,first=np.unique(joined['country'],return_index=True)
+    iso3=dict(zip(countries.tolist(),joined['iso3'][first].tolist()))
+    order=np.argsort(-groups['count'],kind='stable')
+    columns={'country':groups['country'],
+             'iso3':np.array([iso3[c] for c in groups['country'].tolist()],
+                             dtype=object),
+             'count':groups['count'],
+             'magnitude_mean':groups['magnitude_mean'],
+             'magnitude_max':groups['magnitude_max'],
+             'depth_mean':groups['depth_mean'],
+             'distance_mean':groups['distance_mean'],
+             'distance_max':groups['distance_max']}
+    return AggTable({name:values[order] for name,values in columns.items()},
+                    ['country'])
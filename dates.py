@@ -0,0 +1,187 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : dates.py
+Purpose : Parsing the Date and Time fields of the earthquake data in
+          bulk, one group per format, with a report of the formats seen
+          and of the rows that could not be parsed
+Revisions:
+    00 : import the required modules
+    01 : define the fixed width slicers and parseDateTimes
+"""
+### Step 1 : Import the required modules
+from datetime import datetime as dt # importing datetime module
+import numpy as np
+
+# the two layouts of the Date and Time fields in the file
+MDY='%m/%d/%Y %H:%M:%S'
+ISO='%Y-%m-%dT%H:%M:%S.%fZ'
+
+### Step 2 : define the fixed width slicers
+def toBytes(values,width):
+    '''
+    Input:
+        values : list of strings
+        width : number of characters kept
+
+    Returns:
+        uint8 array of shape (n,width), shorter strings padded with 0
+    '''
+    encoded=[v.encode('latin-1','replace') for v in values]
+    return np.array(encoded,dtype=f'S{width}').view(np.uint8)\
+             .reshape(len(values),width)
+
+def number(chars,start,stop):
+    '''
+    Input:
+        chars : uint8 array of shape (n,width)
+        start,stop : columns of the digits
+
+    Returns:
+        (values,ok) : the integer value of the digits and whether every
+                      character was a digit
+    '''
+    digits=chars[:,start:stop].astype(np.int64)-ord('0')
+    ok=np.all((digits>=0)&(digits<=9),axis=1)
+    values=np.zeros(len(chars),dtype=np.int64)
+    for k in range(stop-start):
+        values=values*10+digits[:,k]
+    return values,ok
+
+def separators(chars,positions):
+    '''
+    Input:
+        chars : uint8 array of shape (n,width)
+        positions : dictionary of column to the expected character
+
+    Returns:
+        boolean array, True where every separator is in place
+    '''
+    ok=np.ones(len(chars),dtype=bool)
+    for col,sep in positions.items():
+        ok&=chars[:,col]==ord(sep)
+    return ok
+
+def compose(year,month,day,hour,minute,second,milli):
+    '''
+    Description : builds datetime64[ms] values from the fields and
+                  checks that every field is within its range.
+
+    Returns:
+        (values,ok) : the datetime64[ms] array and the valid rows
+    '''
+    ok=(month>=1)&(month<=12)&(day>=1)&(day<=31)&(hour<=23)& \
+       (minute<=59)&(second<=59)
+    months=(year-1970).astype('datetime64[Y]').astype('datetime64[M]')+\
+           np.clip(month-1,0,11)
+    days=months.astype('datetime64[D]')+(day-1)
+    # a day past the end of the month rolls into the next month
+    ok&=days.astype('datetime64[M]')==months
+    values=days.astype('datetime64[ms]')+ \
+           ((hour*60+minute)*60+second)*1000+milli
+    return values,ok
+
+def parseMDY(dates,times):
+    '''
+    Description : parses 'mm/dd/yyyy' dates and 'HH:MM:SS' times
+
+    Returns:
+        (values,ok) : the datetime64[ms] array and the valid rows
+    '''
+    d=toBytes(dates,10)
+    t=toBytes(times,8)
+    month,ok1=number(d,0,2)
+    day,ok2=number(d,3,5)
+    year,ok3=number(d,6,10)
+    hour,ok4=number(t,0,2)
+    minute,ok5=number(t,3,5)
+    second,ok6=number(t,6,8)
+    values,ok=compose(year,month,day,hour,minute,second,0)
+    ok&=ok1&ok2&ok3&ok4&ok5&ok6
+    ok&=separators(d,{2:'/',5:'/'})&separators(t,{2:':',5:':'})
+    return values,ok
+
+def parseISO(dates):
+    '''
+    Description : parses 'yyyy-mm-ddTHH:MM:SS.fffZ' dates
+
+    Returns:
+        (values,ok) : the datetime64[ms] array and the valid rows
+    '''
+    d=toBytes(dates,24)
+    year,ok1=number(d,0,4)
+    month,ok2=number(d,5,7)
+    day,ok3=number(d,8,10)
+    hour,ok4=number(d,11,13)
+    minute,ok5=number(d,14,16)
+    second,ok6=number(d,17,19)
+    milli,ok7=number(d,20,23)
+    values,ok=compose(year,month,day,hour,minute,second,milli)
+    ok&=ok1&ok2&ok3&ok4&ok5&ok6&ok7
+    ok&=separators(d,{4:'-',7:'-',10:'T',13:':',16:':',19:'.',23:'Z'})
+    return values,ok
+
+### Step 3 : define the parseDateTimes function
+def parseOne(date,time):
+    '''
+    Description : slow path for a row in neither fixed width layout,
+                  e.g. without the leading zeros.
+
+    Returns:
+        (datetime,format) or (None,None) if no format matches
+    '''
+    for text,fmt in ((f'{date} {time}',MDY),(date,ISO)):
+        try:
+            return dt.strptime(text,fmt),fmt
+        except ValueError:
+            pass
+    return None,None
+
+def parseDateTimes(dates,times):
+    '''
+    Description : detects the format of every row from its length and
+                  separators, parses each group of rows at once with
+                  the fixed width slicers and sends the remaining rows
+                  through strptime.
+
+    Input:
+        dates : list of the 'Date' fields
+        times : list of the 'Time' fields
+
+    Returns:
+        (values,report) : datetime64[ms] array with NaT for the rejected
+                          rows, and a dictionary with the number of rows
+                          of each format under 'formats' and the list of
+                          (row,date,time) that could not be parsed under
+                          'rejected'
+    '''
+    n=len(dates)
+    values=np.full(n,np.datetime64('NaT'),dtype='datetime64[ms]')
+    report={'formats':{MDY:0,ISO:0},'rejected':[]}
+    dlen=np.array([len(d) for d in dates],dtype=np.int64)
+    tlen=np.array([len(t) for t in times],dtype=np.int64)
+    done=np.zeros(n,dtype=bool)
+    # group of each layout, detected up front
+    for fmt,rows in ((MDY,np.flatnonzero((dlen==10)&
+                                        ((tlen==8)|(tlen==7)))),
+                     (ISO,np.flatnonzero(dlen==24))):
+        if len(rows)==0:
+            continue
+        ids=rows.tolist()
+        if fmt==MDY:
+            # times before 10 o'clock may come without the leading zero
+            parsed,ok=parseMDY([dates[i] for i in ids],
+                               [times[i].rjust(8,'0') for i in ids])
+        else:
+            parsed,ok=parseISO([dates[i] for i in ids])
+        values[rows[ok]]=parsed[ok]
+        done[rows[ok]]=True
+        report['formats'][fmt]+=int(np.count_nonzero(ok))
+    # everything else is tried one row at a time
+    for i in np.flatnonzero(~done).tolist():
+        parsed,fmt=parseOne(dates[i],times[i])
+        if parsed is None:
+            report['rejected'].append((i,dates[i],times[i]))
+        else:
+            values[i]=np.datetime64(parsed,'ms')
+            report['formats'][fmt]+=1
+    return values,report
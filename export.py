@@ -0,0 +1,535 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : export.py
+Purpose : Writing the selections, the per-year aggregates and the impact
+          and country tables to columnar files, csv or json lines, a
+          chunk of rows at a time, and reading the columnar files back
+          memory mapped
+Revisions:
+    00 : import the required modules
+    01 : define tableChunks,ColumnWriter,readColumns,writeArrow,
+         readArrow,writeCsv,writeJsonLines,exportTable and readTable
+    02 : tableChunks takes a list of stores or tables, writeArrow
+         removes its temporary file when it fails
+"""
+### Step 1 : Import the required modules
+import csv # importing csv module
+import json
+import os
+import shutil
+import numpy as np
+from aggregate import AggTable
+from quake_store import QuakeStore,Categorical,StringColumn
+try:
+    # parquet and arrow files need pyarrow, the folder of columns only
+    # numpy
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa=pq=None
+
+# rows converted and written at a time
+CHUNK_ROWS=100000
+# file of the column names, types and number of rows of a folder
+SCHEMA="schema.json"
+# bump when the layout of the folder changes
+EXPORT_VERSION=1
+# type of the codes of the categorical columns on disk
+CODE_DTYPE=np.dtype('<i2')
+# key of the kind and keys of the table in the arrow schema metadata
+ARROW_META=b'earthquake'
+# columns of a QuakeStore, in the order written
+QUAKE_COLUMNS=('lat','lng','magnitude','depth','datetime','type',
+               'magnitude_type')
+
+### Step 2 : define the chunks of a table
+def tableColumns(table):
+    '''
+    Description : the columns of a QuakeStore, AggTable, dictionary of
+                  quakes data or list of (location,data) tuples such as
+                  mag_selected.
+
+    Returns:
+        (kind,keys,columns) the kind 'quakes' or 'table', the key columns
+        and a dictionary of name to array, Categorical or object array of
+        strings
+    '''
+    if isinstance(table,AggTable):
+        return 'table',table.keys,dict(table.columns)
+    if not isinstance(table,QuakeStore):
+        table=QuakeStore.fromItems(table)
+    return 'quakes',['lat','lng'],dict(zip(QUAKE_COLUMNS,(
+        table.lat,table.lng,table.magnitude,table.depth,table.datetime,
+        table.types,table.magtypes)))
+
+def sliceColumn(values,start,stop):
+    '''
+    Returns the rows start to stop of an array or Categorical
+    '''
+    if isinstance(values,Categorical):
+        return Categorical(values.codes[start:stop],values.categories)
+    return values[start:stop]
+
+def tableChunks(table,chunk_rows=CHUNK_ROWS):
+    '''
+    Description : cuts a table into chunks of at most chunk_rows rows.
+
+    Input:
+        table : anything tableColumns takes, or an iterable of them such
+                as the QuakeStore chunks of streamQuakes, also as a list
+        chunk_rows : largest number of rows of a chunk
+
+    Returns:
+        yields (kind,keys,columns) as tableColumns, at least one chunk
+        even for an empty table so that its columns are known
+    '''
+    if isinstance(table,list) and table and \
+       isinstance(table[0],(QuakeStore,AggTable)):
+        # a list of chunks, not of (location,data) tuples
+        pass
+    elif isinstance(table,(QuakeStore,AggTable,dict,list)):
+        table=[table]
+    for part in table:
+        kind,keys,columns=tableColumns(part)
+        n=len(next(iter(columns.values()))) if columns else 0
+        for start in range(0,max(n,1),chunk_rows):
+            yield kind,keys,{name:sliceColumn(values,start,start+chunk_rows)
+                             for name,values in columns.items()}
+
+def isText(values):
+    '''
+    Returns True for an array of strings
+    '''
+    return values.dtype.kind in 'OUS'
+
+def decodeStrings(column):
+    '''
+    Returns the strings of a StringColumn as an object array
+    '''
+    offsets=column.offsets.tolist()
+    text=column.data.tobytes().decode('utf-8') if len(column.data) else ''
+    if text.isascii():
+        # one character per byte, the offsets slice the text directly
+        values=[text[a:b] for a,b in zip(offsets,offsets[1:])]
+    else:
+        values=[column[i] for i in range(len(column))]
+    return np.array(values,dtype=object)
+
+def buildTable(kind,keys,columns):
+    '''
+    Returns the QuakeStore or AggTable of the columns read back
+    '''
+    if kind=='quakes':
+        return QuakeStore(*(columns[name] for name in QUAKE_COLUMNS))
+    return AggTable({name:decodeStrings(values)
+                     if isinstance(values,StringColumn) else values
+                     for name,values in columns.items()},keys)
+
+### Step 3 : define the folder of columns
+class ColumnWriter:
+    '''
+    Description : writes a table to a folder holding one raw file per
+                  column and schema.json, a chunk at a time. The numbers
+                  and datetimes are kept in their numpy types, the
+                  categorical columns as int16 codes and the other
+                  strings as one utf-8 buffer with the offsets of every
+                  string, so that every file can be memory mapped.
+    '''
+    def __init__(self,path):
+        '''
+        Input:
+            path : the folder, replaced when the writer is closed
+        '''
+        self.path=path
+        self.tmp=path+'.tmp'
+        if os.path.isdir(self.tmp):
+            shutil.rmtree(self.tmp)
+        os.makedirs(self.tmp)
+        self.schema=None
+        self.files={}
+        self.rows=0
+        # position of every category and end of every string buffer
+        self.position={}
+        self.ends={}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,kind,value,traceback):
+        if kind is None:
+            self.close()
+        else:
+            # a folder interrupted while written is never left behind
+            for f in self.files.values():
+                f.close()
+            shutil.rmtree(self.tmp,ignore_errors=True)
+
+    def open(self,name):
+        self.files[name]=open(os.path.join(self.tmp,name),'wb')
+
+    def start(self,kind,keys,columns):
+        '''
+        Description : the schema and the files from the first chunk
+        '''
+        described=[]
+        for name,values in columns.items():
+            if isinstance(values,Categorical):
+                described.append({'name':name,'encoding':'category',
+                                  'dtype':CODE_DTYPE.str,'categories':[]})
+                self.position[name]={}
+            elif isText(values):
+                described.append({'name':name,'encoding':'string'})
+                self.open(name+'.offsets')
+                self.files[name+'.offsets'].write(
+                    np.zeros(1,dtype='<i8').tobytes())
+                self.ends[name]=0
+            else:
+                described.append({'name':name,'encoding':'plain',
+                                  'dtype':values.dtype.newbyteorder('<')
+                                                      .str})
+            self.open(name)
+        self.schema={'version':EXPORT_VERSION,'kind':kind,'keys':keys,
+                     'rows':0,'columns':described}
+
+    def write(self,kind,keys,columns):
+        '''
+        Input:
+            kind,keys,columns : a chunk of tableChunks
+        '''
+        if self.schema is None:
+            self.start(kind,keys,columns)
+        names=[c['name'] for c in self.schema['columns']]
+        n=len(next(iter(columns.values()))) if columns else 0
+        if list(columns)!=names:
+            raise ValueError(f"columns {list(columns)} differ from the "
+                             f"columns {names} written before")
+        for c in self.schema['columns']:
+            name=c['name']
+            values=columns[name]
+            if c['encoding']=='category':
+                # the codes of every chunk into the categories of the file
+                position=self.position[name]
+                for category in values.categories:
+                    if category not in position:
+                        position[category]=len(position)
+                        c['categories'].append(category)
+                if len(position)>np.iinfo(CODE_DTYPE).max:
+                    raise ValueError(f"too many categories in <{name}>")
+                recode=np.array([position[category] for category in
+                                 values.categories],dtype=CODE_DTYPE)
+                data=recode[values.codes] if len(recode) else \
+                     np.zeros(len(values),dtype=CODE_DTYPE)
+            elif c['encoding']=='string':
+                encoded=[str(v).encode('utf-8') for v in values.tolist()]
+                ends=np.cumsum(np.fromiter(map(len,encoded),dtype=np.int64,
+                                           count=len(encoded)))
+                self.files[name+'.offsets'].write(
+                    (ends+self.ends[name]).astype('<i8').tobytes())
+                if len(ends):
+                    self.ends[name]+=int(ends[-1])
+                self.files[name].write(b''.join(encoded))
+                continue
+            else:
+                data=np.ascontiguousarray(values,dtype=c['dtype'])
+            # the bytes of the array, written without a copy
+            self.files[name].write(data.view(np.uint8))
+        self.rows+=n
+
+    def close(self):
+        '''
+        Description : writes schema.json and moves the folder in place
+        '''
+        for f in self.files.values():
+            f.close()
+        self.files={}
+        if self.schema is None:
+            shutil.rmtree(self.tmp)
+            raise ValueError(f"no table written to <{self.path}>")
+        self.schema['rows']=self.rows
+        with open(os.path.join(self.tmp,SCHEMA),'w') as f:
+            json.dump(self.schema,f,indent=1)
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp,self.path)
+
+def writeColumns(path,table,chunk_rows=CHUNK_ROWS):
+    '''
+    Description : writes the table to a folder of columns (ColumnWriter).
+
+    Returns:
+        the number of rows written
+    '''
+    with ColumnWriter(path) as writer:
+        for chunk in tableChunks(table,chunk_rows):
+            writer.write(*chunk)
+    return writer.rows
+
+def readColumns(path,mmap=True):
+    '''
+    Description : the columns of a folder written by ColumnWriter.
+
+    Input:
+        path : the folder
+        mmap : map the files into memory instead of reading them, the
+               pages are only read when the values are used
+
+    Returns:
+        (schema,columns) the content of schema.json and a dictionary of
+        name to array, Categorical or StringColumn
+    '''
+    with open(os.path.join(path,SCHEMA)) as f:
+        schema=json.load(f)
+    if schema.get('version')!=EXPORT_VERSION:
+        raise ValueError(f"<{path}> was written by another version")
+    def array(name,dtype,count):
+        name=os.path.join(path,name)
+        if count==0:
+            # an empty file can not be mapped
+            return np.zeros(0,dtype=dtype)
+        if mmap:
+            return np.memmap(name,dtype=dtype,mode='r',shape=(count,))
+        return np.fromfile(name,dtype=dtype,count=count)
+    n=schema['rows']
+    columns={}
+    for c in schema['columns']:
+        name=c['name']
+        if c['encoding']=='category':
+            columns[name]=Categorical(array(name,c['dtype'],n),
+                                      c['categories'])
+        elif c['encoding']=='string':
+            offsets=array(name+'.offsets','<i8',n+1)
+            columns[name]=StringColumn(array(name,np.uint8,
+                                             int(offsets[-1]) if n else 0),
+                                       offsets)
+        else:
+            columns[name]=array(name,c['dtype'],n)
+    return schema,columns
+
+### Step 4 : define the parquet and arrow files
+def arrowBatch(columns):
+    '''
+    Returns the pyarrow RecordBatch of a chunk of tableChunks, the
+    categorical columns as plain strings so that every batch has the
+    same types
+    '''
+    arrays=[]
+    for values in columns.values():
+        if isinstance(values,Categorical):
+            values=np.array(values.categories,dtype=object)[values.codes]
+        if isText(values):
+            arrays.append(pa.array([str(v) for v in values.tolist()],
+                                   type=pa.string()))
+        else:
+            arrays.append(pa.array(values))
+    return pa.RecordBatch.from_arrays(arrays,names=list(columns))
+
+def writeArrow(path,table,chunk_rows=CHUNK_ROWS):
+    '''
+    Description : writes the table to a parquet file, one row group per
+                  chunk, or to an arrow ipc file when the path does not
+                  end with .parquet. Needs pyarrow.
+
+    Returns:
+        the number of rows written
+    '''
+    if pa is None:
+        raise ImportError("pyarrow is needed for parquet and arrow files, "
+                          "write a folder of columns instead")
+    parquet=path.endswith('.parquet')
+    tmp=path+'.tmp'
+    writer=None
+    rows=0
+    try:
+        for kind,keys,columns in tableChunks(table,chunk_rows):
+            batch=arrowBatch(columns)
+            if writer is None:
+                schema=batch.schema.with_metadata(
+                    {ARROW_META:json.dumps({'kind':kind,'keys':keys})})
+                writer=pq.ParquetWriter(tmp,schema) if parquet else \
+                       pa.ipc.new_file(tmp,schema)
+            batch=pa.RecordBatch.from_arrays(batch.columns,
+                                             schema=writer.schema)
+            if parquet:
+                writer.write_table(pa.Table.from_batches([batch]))
+            else:
+                writer.write_batch(batch)
+            rows+=batch.num_rows
+    except BaseException:
+        # a file interrupted while written is never left behind
+        try:
+            if writer is not None:
+                writer.close()
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+    writer.close()
+    os.replace(tmp,path)
+    return rows
+
+def readArrow(path):
+    '''
+    Description : reads a file of writeArrow. The arrow ipc file is
+                  memory mapped and its numbers are used without a copy,
+                  the parquet file is decoded.
+
+    Returns:
+        QuakeStore or AggTable as written
+    '''
+    if pa is None:
+        raise ImportError("pyarrow is needed for parquet and arrow files")
+    if path.endswith('.parquet'):
+        table=pq.read_table(path,memory_map=True)
+    else:
+        table=pa.ipc.open_file(pa.memory_map(path,'r')).read_all()
+    meta=json.loads(table.schema.metadata[ARROW_META])
+    columns={}
+    for name in table.column_names:
+        values=table.column(name)
+        if pa.types.is_string(values.type):
+            values=np.array(values.to_pylist(),dtype=object)
+            if meta['kind']=='quakes':
+                values=Categorical.fromList(values)
+        else:
+            values=values.to_numpy()
+        columns[name]=values
+    return buildTable(meta['kind'],meta['keys'],columns)
+
+### Step 5 : define the text files
+def csvValues(values):
+    '''
+    Returns the values of a column as a list for the csv writer
+    '''
+    if isinstance(values,Categorical):
+        return np.array(values.categories,dtype=object)[values.codes]\
+                 .tolist()
+    if values.dtype.kind=='M':
+        return np.datetime_as_string(values,unit='ms').tolist()
+    if values.dtype==np.float32:
+        # the shortest text of the float32 value, not of its float64
+        return values.astype(str).tolist()
+    return values.tolist()
+
+def writeCsv(path,table,chunk_rows=CHUNK_ROWS):
+    '''
+    Description : writes the table to a csv file with a header row, a
+                  chunk of rows at a time.
+
+    Returns:
+        the number of rows written
+    '''
+    rows=0
+    with open(path,'w',newline='') as f:
+        write=csv.writer(f)
+        for i,(kind,keys,columns) in enumerate(tableChunks(table,
+                                                           chunk_rows)):
+            if i==0:
+                write.writerow(list(columns))
+            lists=[csvValues(values) for values in columns.values()]
+            write.writerows(zip(*lists))
+            rows+=len(lists[0]) if lists else 0
+    return rows
+
+def jsonValues(values):
+    '''
+    Returns the values of a column as a list of json texts, null for the
+    missing values
+    '''
+    if isinstance(values,Categorical):
+        # every category encoded once
+        names=np.array([json.dumps(c) for c in values.categories]+['null'],
+                       dtype=object)
+        return names[values.codes].tolist()
+    if isText(values):
+        return [json.dumps(str(v)) for v in values.tolist()]
+    if values.dtype.kind=='b':
+        return np.where(values,'true','false').tolist()
+    if values.dtype.kind=='M':
+        text=np.char.add(np.char.add('"',np.datetime_as_string(
+            values,unit='ms')),'"').astype(object)
+        text[np.isnat(values)]='null'
+        return text.tolist()
+    text=values.astype(str)
+    if values.dtype.kind=='f':
+        # NaN and infinity are not json
+        text=text.astype(object)
+        text[~np.isfinite(values)]='null'
+    return text.tolist()
+
+def writeJsonLines(path,table,chunk_rows=CHUNK_ROWS):
+    '''
+    Description : writes the table as json lines, one object per row. The
+                  values are converted a column at a time and every line
+                  is filled into a template of the column names, json.dumps
+                  is only called for the strings.
+
+    Returns:
+        the number of rows written
+    '''
+    rows=0
+    with open(path,'w') as f:
+        template=None
+        for kind,keys,columns in tableChunks(table,chunk_rows):
+            if template is None:
+                template='{'+','.join(json.dumps(name).replace('%','%%')+
+                                      ':%s' for name in columns)+'}\n'
+            lists=[jsonValues(values) for values in columns.values()]
+            f.writelines(map(template.__mod__,zip(*lists)))
+            rows+=len(lists[0]) if lists else 0
+    return rows
+
+### Step 6 : define the entry points
+# format names and their writers
+FORMATS={'columns':writeColumns,'parquet':writeArrow,'arrow':writeArrow,
+         'csv':writeCsv,'jsonl':writeJsonLines}
+# file name suffix of every format
+SUFFIXES={'columns':'','parquet':'.parquet','arrow':'.arrow',
+          'csv':'.csv','jsonl':'.jsonl'}
+
+def formatOf(path):
+    '''
+    Returns the format of a path from its suffix, a folder of columns
+    without a known suffix
+    '''
+    for name,suffix in SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return name
+    if path.endswith('.feather'):
+        return 'arrow'
+    return 'columns'
+
+def exportTable(path,table,format=None,chunk_rows=CHUNK_ROWS):
+    '''
+    Description : writes a selection or a result table to a file.
+
+    Input:
+        path : the file, or the folder of a folder of columns
+        table : QuakeStore, AggTable, dictionary of quakes data, list of
+                (location,data) tuples such as mag_selected, or an
+                iterable of them such as streamQuakes
+        format : one of FORMATS, from the suffix of the path if None
+        chunk_rows : rows converted and written at a time
+
+    Returns:
+        the number of rows written
+    '''
+    format=format or formatOf(path)
+    if format not in FORMATS:
+        raise ValueError(f"unknown format <{format}>, one of "
+                         f"{', '.join(FORMATS)}")
+    return FORMATS[format](path,table,chunk_rows)
+
+def readTable(path,mmap=True):
+    '''
+    Description : reads back a folder of columns, parquet or arrow file.
+                  The numbers of a folder are memory mapped, so a large
+                  selection is opened at once and only the pages used
+                  are read.
+
+    Returns:
+        QuakeStore or AggTable as written
+    '''
+    if formatOf(path) in ('parquet','arrow'):
+        return readArrow(path)
+    schema,columns=readColumns(path,mmap)
+    return buildTable(schema['kind'],schema['keys'],columns)
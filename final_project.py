@@ -11,16 +11,81 @@ Revisions:
     03 : Prompt the user for selecting the various range of categories 
          for analyzing the data
     04 : plot the graphs for the selected data
+    05 : wrap the interactive session in main so that the functions
+         can be imported without prompting the user
+    06 : findCities computes the distances with the vectorized
+         havDistMany
+    07 : main loads the data through the binary cache of the csv files
+    08 : getQuakeData parses the dates in bulk with parseDateTimes
+    09 : select function and command line options for scripted runs,
+         the prompts and the plots split into functions
+    10 : the per-year plots are fed from the aggregate table
+    11 : --impact option writing the impact analysis of every selected
+         quake
+    12 : nearestCities function, the closest city of reportLargest comes
+         from a k nearest search instead of a 5000 km findCities
+    13 : the scatter switches to a density grid for large selections and
+         the plots can be written to image files with --save
+    14 : --clusters option finding the hotspots of the selection with
+         dbscan and marking them on the scatter plot
+    15 : the impact of the quakes is kept in an ImpactCache saved with
+         the binary cache between sessions
+    16 : --profile option timing every stage of the session, the body
+         of main moved to runSession
+    17 : --quakes option loading a catalog split over several files in
+         parallel, getQuakeData takes the path of the file
+    18 : --countries option tagging every quake with the country of its
+         nearest city, the per-country table and plotCountries
+    19 : --export option writing the selection and the result tables
+         to columnar, csv or json lines files
+    20 : the selections of promptSelection and of the command line
+         are lazy Query objects run once, --explain prints the plan
+    21 : --timeseries option with the Gutenberg-Richter b-value, the
+         magnitude of completeness and the rolling event rates, and the
+         plotMagnitudeFrequency and plotRates functions
+    22 : runSession builds the CityGrid once and shares it with
+         reportLargest, the impact and the country join
+    23 : the selections run on the QuakeStore of the catalog, one row
+         per location, the records are made from the selected rows only
+    24 : the QuakeIndex of the catalog is built once at load, select
+         takes it and the session selects and gives the range hints
+         from it
+    25 : PROFILED lists the functions the session reaches, by the module
+         they are looked up in, and they are put back after the session
+    26 : --timeseries reports a selection too small for a b-value
+    27 : --quakes keeps every distinct event of the catalog, also at a
+         location of another event
     
     
 """
 ### Step 1 : Import the required modules
 from datetime import datetime as dt # importing datetime module
+import argparse # importing argparse module
 import csv # importing csv module
+import os # importing os module
 # importing various functions from math module
 from math import radians,cos,sin,asin,sqrt 
 # importing matplotlib library 
 import matplotlib.pyplot as plt
+# importing numpy and the vectorized haversine functions
+import numpy as np
+from haversine import Points,havDistMany
+from spatial_index import CityGrid
+from dates import parseDateTimes
+from quake_store import QuakeStore,matchTypes,toDay
+from aggregate import aggregate
+from render import drawQuakes,drawClusters,useHeadless,showPlot
+from cluster import dbscan,clusterSummary,EPS,MIN_SAMPLES
+from impact import impactTable,ImpactCache
+from multi_load import loadCatalog
+from country_join import joinCountries,countryTable
+from export import exportTable,FORMATS,SUFFIXES
+from query import Query
+from range_index import QuakeIndex
+from timeseries import timeSeries,gutenbergRichter,eventRates,\
+                       rollingBValue,WINDOW_DAYS,STEP_DAYS
+import profiling
+from profiling import stage
 
 ### Step 2 : define getCityData,coord2rad,havDist,findCities,
 ###          getQuakeData functions
@@ -87,7 +152,7 @@ def havDist(loc1,loc2,unit="km"):
     # calculate the result
     return (c*r)
     
-def findCities(loc,cityDict,r):
+def findCities(loc,cityDict,r,points=None):
     '''
     Description : accepts a target location, dictionary of cities,
                   and radius value as input and returns a list of cities 
@@ -96,167 +161,273 @@ def findCities(loc,cityDict,r):
     loc : coordinates in degrees (tuple:lat,lng)
     cityDict : Dictionary of cities data
     r : radius value
+    points : optional Points of the cityDict keys (Points.fromDegrees),
+             converted on every call if not given
     
     Returns:
     close_cities : return a list of close cities to the given location.
 
     '''
+    if points is None:
+        points=Points.fromDegrees(cityDict.keys())
+    # Compute the haversine distance between 
+    # the specified location and every city at once
+    distances=havDistMany(loc,points)
+    # positions of the cities within the designated radius
+    hits=np.flatnonzero(distances<r)
+    cities=list(cityDict.values())
     close_cities=[]
-    for co,data in cityDict.items():
-        # Compute the haversine distance between 
-        # the specified location and the city
-        distance=havDist(loc,co)
-        # To verify whether the city falls within the designated radius.
-        if distance<r:
-            # Append city details to the result list
-            close_cities.append({'city':data['city'],
-                    'country':data['country'],'pop':data['pop'],
-                    'distance':round(distance,2)})
-            # sort the data based on the distance
-            close_cities.sort(key=lambda x:x['distance'])
+    for i,distance in zip(hits.tolist(),distances[hits].tolist()):
+        data=cities[i]
+        # Append city details to the result list
+        close_cities.append({'city':data['city'],
+                'country':data['country'],'pop':data['pop'],
+                'distance':round(distance,2)})
+    # sort the data based on the distance
+    close_cities.sort(key=lambda x:x['distance'])
     return close_cities
 
-def getQuakeData():
+def nearestCities(loc,cityDict,k=1,grid=None):
+    '''
+    Description : accepts a target location and dictionary of cities and
+                  returns the k nearest cities, whatever their distance
+
+    Input :
+    loc : coordinates in degrees (tuple:lat,lng)
+    cityDict : Dictionary of cities data
+    k : number of cities, the default is 1
+    grid : optional CityGrid of cityDict, built on every call if not given
+
+    Returns:
+    close_cities : list of the k nearest cities in the format of
+                   findCities, empty only without any city
+    '''
+    if grid is None:
+        grid=CityGrid(cityDict)
+    return grid.nearestCities(loc,k)
+
+def getQuakeData(path="earthquakesF23.csv"):
     '''
     Description: reading the data from a csv file and returing the data 
                  in a dictionary.
+    Input:
+        path : path of the earthquake csv file, loadCatalog reads a
+               catalog split over several files
     Returns : a dictionary with location as key and the rest of the 
               data as a dictionary.
     '''
-    with open("earthquakesF23.csv") as f:
+    with open(path) as f:
         #  Convert a everyline into  dictinaries
         read=csv.DictReader(f)
         data=[line for line in read]
-        quake_data={}
-        for item in data:
-            # Extract latitude and longitude values and 
-            # create a tuple representing the location
-            
-            lat=float(item.pop('Latitude'))
-            lng=float(item.pop('Longitude'))
-            location=(lat,lng)
-            # Converted  Magnitude to float
-            item['Magnitude']=float(item['Magnitude'])
-            try:
-                # Extract date and time, then create a datetime object
-                datetime=dt.strptime(f'{item["Date"]} {item["Time"]}',
-                                      '%m/%d/%Y %H:%M:%S')
-                del item['Date'] # deleting the data
-                del item['Time'] # deleting the data
-                item['datetime']=datetime
-                quake_data[location]=item
-                # extract date and time for bad values
-                # then convert to datetime object
-            except:
-                datetime=dt.strptime(f'{item["Date"]}',
-                                     "%Y-%m-%dT%H:%M:%S.%fZ")
-                del item['Date']
-                del item['Time']
-                item['datetime']=datetime
-                quake_data[location]=item
+    # parse the date and time of every row at once, one group per format
+    times,report=parseDateTimes([item['Date'] for item in data],
+                                [item['Time'] for item in data])
+    times=times.astype(object).tolist()
+    # rows in neither format are reported and left out
+    for row,date,time in report['rejected']:
+        print(f"Skipped row {row+2}, unknown date/time <{date},{time}>")
+    rejected={row for row,date,time in report['rejected']}
+    quake_data={}
+    for row,(item,datetime) in enumerate(zip(data,times)):
+        if row in rejected:
+            continue
+        # Extract latitude and longitude values and 
+        # create a tuple representing the location
+        lat=float(item.pop('Latitude'))
+        lng=float(item.pop('Longitude'))
+        location=(lat,lng)
+        # Converted  Magnitude to float
+        item['Magnitude']=float(item['Magnitude'])
+        del item['Date'] # deleting the data
+        del item['Time'] # deleting the data
+        item['datetime']=datetime
+        quake_data[location]=item
                 
     return quake_data # return data as a dictionary
         
-### Step 3 :  Announce and call the getCityData and getQuakeData functions
-# announce 
-print("\n*** Earthquake Data ***")
-# calling getCityData and getQuakeData functions
-cityDict=getCityData()
-qDict=getQuakeData()
+### Step 3 : define the select function for scripted selections
+def select(quakes,type=None,lat=None,lng=None,date=None,mag=None):
+    '''
+    Description : selects the earthquakes meeting every given condition
+                  in a single pass over the data, a condition left as
+                  None selects every record.
 
-# print the length of the data
-print(f"\nAcquired data {len(cityDict)} cities.")
-print(f"Acquired data {len(qDict)} earthquakes.")
+    Input:
+        quakes : dictionary of quakes data (from getQuakeData), a list
+                 of (location,data) tuples, or a QuakeIndex whose sorted
+                 indexes give the rows without a scan
+        type : tremor type, its first three characters or a list of types
+        lat,lng,mag : (min,max) ranges, both ends included
+        date : (min,max) dates, both days included, as date or datetime
+               objects or 'mm/dd/yyyy' text
+
+    Returns:
+        list of (location,data) tuples of the selected records
+    '''
+    if isinstance(quakes,QuakeIndex):
+        rows=quakes.select(type,lat,lng,date,mag)
+        return list(quakes.store.take(rows).items())
+    items=quakes.items() if isinstance(quakes,dict) else quakes
+    # every condition as a (min,max) pair, open ended if not given
+    inf=float('inf')
+    lat_min,lat_max=(min(lat),max(lat)) if lat is not None else (-inf,inf)
+    lng_min,lng_max=(min(lng),max(lng)) if lng is not None else (-inf,inf)
+    mag_min,mag_max=(min(mag),max(mag)) if mag is not None else (-inf,inf)
+    date_min,date_max=dt.min.date(),dt.max.date()
+    if date is not None:
+        date_min,date_max=sorted(toDay(d).astype(object) for d in date)
+    types=None
+    if type is not None:
+        items=list(items)
+        ty_list=sorted(set(data['Type'] for loc,data in items))
+        types=set(matchTypes(type,ty_list))
+    return [(loc,data) for loc,data in items
+            if (types is None or data['Type'] in types)
+            and lat_min<=loc[0]<=lat_max and lng_min<=loc[1]<=lng_max
+            and date_min<=data['datetime'].date()<=date_max
+            and mag_min<=data['Magnitude']<=mag_max]
+
+def typeNames(quakes):
+    '''
+    Returns the set of the tremor types of a dictionary of quakes data, a
+    QuakeStore or a QuakeIndex
+    '''
+    if isinstance(quakes,QuakeIndex):
+        return set(quakes.store.types.categories[c]
+                   for c,rows in quakes.types.items() if len(rows))
+    if isinstance(quakes,QuakeStore):
+        return set(quakes.types.categories[c]
+                   for c in np.unique(quakes.types.codes).tolist())
+    return set(data['Type'] for loc,data in quakes.items())
 
 ### Step 4 : Prompt the user for selecting the various range of categories 
 ###               for analyzing the data
+def promptSelection(quakes):
+    '''
+    Description: prompts the user for the type, latitude, longitude,
+                 date and magnitude ranges one after the other.
+    Input : quakes : dictionary of quakes data, QuakeStore or QuakeIndex,
+                     the range hints and the selections of an index are
+                     read from its sorted columns
+    Returns : (mag_selected,title) the list of (location,data) tuples
+              of the selected records and the title of the plots
+    Every step adds its condition to a Query, which only selects the
+    records when the count and the range of the next step are needed.
+    '''
 
-# prompt the user for the selection if yes 
-# select the type else proceed for latitude
-sel=input("\nRespond with 'yes' for selection?")
-#ty_list for getting all the types as a list
-ty_list=set(data['Type'] for loc,data in qDict.items())
-# checking the user input, if yes go for the selection
-# else select the entire data anad move to next item
-if sel=="yes":
-    print("\nSELECT tremor type : ")
-    print("Choices are... : Earthquake,Explosion,Nuclear Explosion,Rock Burst")
-    # prompt the user for the type of the data
-    while True:
-        
-        ty=input("Enter tremor type (also accpets first three characters) :")
-        # check for user input if nothing is given select the entire data
-        if ty=="":
-            ty_selected=list(map(lambda x:x,qDict.items()))
-            print("Accepted..")
-            tys=f"{ty_list}"
-            print(f"{ty_list}")
-            # print the no of records selected
-            print(f"Selected {len(ty_selected)} records")
-            break
-        else:
-        # if user input is not empty check for the type in ty_list
-            for i in ty_list:
-                if ty in i[:3]:
-                    ty = i  
-        # check if the user input is in list of types
-        
-        # if yes proceed else prompt the user for correct response
-        if ty in ty_list:
-            # select the records with user input type
-            ty_selected=list(filter(lambda x:x[1]['Type']==ty,qDict.items()))
-            tys=f"{ty}"
-            print("Accepted..")
-            print(tys)
-            # print the no of records selected
-            print(f"Selected {len(ty_selected)} records")
-            # prompt the user to move to next selection
-            res=input("\nRespond with 'yes' if Want to move to latitude?")
-            # if yes break the loop else continue
-            if res=="yes":
+    # prompt the user for the selection if yes 
+    # select the type else proceed for latitude
+    sel=input("\nRespond with 'yes' for selection?")
+    #ty_list for getting all the types as a list
+    ty_list=typeNames(quakes)
+    # checking the user input, if yes go for the selection
+    # else select the entire data anad move to next item
+    if sel=="yes":
+        print("\nSELECT tremor type : ")
+        print("Choices are... : Earthquake,Explosion,Nuclear Explosion,Rock Burst")
+        # prompt the user for the type of the data
+        while True:
+
+            ty=input("Enter tremor type (also accpets first three characters) :")
+            # check for user input if nothing is given select the entire data
+            if ty=="":
+                ty_selected=Query(quakes)
+                print("Accepted..")
+                tys=f"{ty_list}"
+                print(f"{ty_list}")
+                # print the no of records selected
+                print(f"Selected {len(ty_selected)} records")
                 break
             else:
-                continue
-        
-        else:
-            # prompt the user for correct response
-            print("Please enter the correct choice")
-# if the type of selection is not yes select the entire data
-# and move to next item
-else:
-    ty_selected=list(map(lambda x:x,qDict.items()))
-    tys=f"{ty_list}"
-    print("Accepted..")
-    print(f"{ty_list}")
-    # print the no of records selected
-    print(f"Selected {len(ty_selected)} records")
-    
-        
-    
-# list of latitudes from the previous selceted records 
-lat_list=sorted([lat for (lat,lng),data in ty_selected])
-print("\nSELECT latitude : Enter two values seperated by comma")
-print(f"range is {min(lat_list)} through {max(lat_list)}")
-  
-while True:
-    try:
-        # split the 2 latitudes and assign to lat1,lat2
-        # if nothing is given or single value is is given
-        # select the entire data
-        lat1,lat2=input("Enter minimum/maximum latitude values:").split(",")
-        # converting to floating numbers
-        lat1,lat2=float(lat1),float(lat2)
-        lat_min,lat_max=min(lat1,lat2),max(lat1,lat2)
-        # checking the given inputs are in the range of latitude list
-        # if yes select the data records
-        # else prompt the user again for the response
-        if min(lat_list)<lat_min and lat_max<max(lat_list):
-            # list of selected records with in the range 
-            # from the previous selected data
-            lat_selected=[((lat,lng),data) for (lat,lng),data in ty_selected
-                      if lat_min<=lat<=lat_max]
+            # if user input is not empty check for the type in ty_list
+                for i in ty_list:
+                    if ty in i[:3]:
+                        ty = i  
+            # check if the user input is in list of types
+
+            # if yes proceed else prompt the user for correct response
+            if ty in ty_list:
+                # select the records with user input type
+                with stage('select type'):
+                    ty_selected=Query(quakes).where(type=ty)
+                    # where only adds the condition, the records are
+                    # selected here
+                    ty_selected.collect()
+                tys=f"{ty}"
+                print("Accepted..")
+                print(tys)
+                # print the no of records selected
+                print(f"Selected {len(ty_selected)} records")
+                # prompt the user to move to next selection
+                res=input("\nRespond with 'yes' if Want to move to latitude?")
+                # if yes break the loop else continue
+                if res=="yes":
+                    break
+                else:
+                    continue
+
+            else:
+                # prompt the user for correct response
+                print("Please enter the correct choice")
+    # if the type of selection is not yes select the entire data
+    # and move to next item
+    else:
+        ty_selected=Query(quakes)
+        tys=f"{ty_list}"
+        print("Accepted..")
+        print(f"{ty_list}")
+        # print the no of records selected
+        print(f"Selected {len(ty_selected)} records")
+
+
+
+    # range of latitudes from the previous selceted records 
+    lat_lo,lat_hi=ty_selected.rangeOf('lat')
+    print("\nSELECT latitude : Enter two values seperated by comma")
+    print(f"range is {lat_lo} through {lat_hi}")
+
+    while True:
+        try:
+            # split the 2 latitudes and assign to lat1,lat2
+            # if nothing is given or single value is is given
+            # select the entire data
+            lat1,lat2=input("Enter minimum/maximum latitude values:").split(",")
+            # converting to floating numbers
+            lat1,lat2=float(lat1),float(lat2)
+            lat_min,lat_max=min(lat1,lat2),max(lat1,lat2)
+            # checking the given inputs are in the range of latitude list
+            # if yes select the data records
+            # else prompt the user again for the response
+            if lat_lo<lat_min and lat_max<lat_hi:
+                # list of selected records with in the range 
+                # from the previous selected data
+                with stage('select latitude'):
+                    lat_selected=ty_selected.where(lat=(lat_min,lat_max))
+                    lat_selected.collect()
+                print("Accepted...")
+                print({'min':lat_min,'max':lat_max})
+                # print the no of records selected
+                print(f"Selected {len(lat_selected)} records")
+                # prompt the user for moving to next item
+                res=input("\nRespond with 'yes' if Want to move to longitude?")
+                # if yes break the loop
+                # else prompt the user for latitude values
+                if res=="yes":
+                    break
+                else:
+                    continue
+            else:
+                # print the vales are not in range 
+                # if the above if statement is failed
+                print("one or more values out of range <(lat1,lat2)>")
+        # if the above try mthod fails select entire data 
+        # from the previous selected data      
+        except:
+            # selecting the all records from the previous selected data
+            lat_selected=ty_selected
             print("Accepted...")
-            print({'min':lat_min,'max':lat_max})
+            print({'min':lat_lo,'max':lat_hi})
             # print the no of records selected
             print(f"Selected {len(lat_selected)} records")
             # prompt the user for moving to next item
@@ -267,109 +438,112 @@ while True:
                 break
             else:
                 continue
-        else:
-            # print the vales are not in range 
-            # if the above if statement is failed
-            print("one or more values out of range <(lat1,lat2)>")
-    # if the above try mthod fails select entire data 
-    # from the previous selected data      
-    except:
-        # selecting the all records from the previous selected data
-        lat_selected=[((lat,lng),data) for (lat,lng),data in ty_selected]
-        print("Accepted...")
-        print({'min':min(lat_list),'max':max(lat_list)})
-        # print the no of records selected
-        print(f"Selected {len(lat_selected)} records")
-        # prompt the user for moving to next item
-        res=input("\nRespond with 'yes' if Want to move to longitude?")
-        # if yes break the loop
-        # else prompt the user for latitude values
-        if res=="yes":
-            break
-        else:
-            continue
 
-# list of longitudes from the previous selceted records 
-lng_list=sorted([lng for (lat,lng),data in lat_selected])
-print("\nSELECT longitude : Enter two values seperated by comma")
-print(f"range is {min(lng_list)} through {max(lng_list)}")
-while True: 
-    try:
-        # split the 2 longitudes and assign to lng1,lng2
-        # if nothing is given or single value is is given
-        # select the entire data
-        lng1,lng2=input("Enter minimum/maximum longitude values:").split(",")
-        # converting to floating numbers
-        lng1,lng2=float(lng1),float(lng2)
-        lng_min,lng_max=min(lng1,lng2),max(lng1,lng2)
-        # checking the given inputs are in the range of longitude list
-        # if yes select the data records
-        # else prompt the user again for the response
-        if min(lng_list)<lng_min and lng_max<max(lng_list):
-            # list of selected records with in the range 
-            # from the previous selected data
-            lng_selected=[((lat,lng),data) for (lat,lng),data in lat_selected
-                      if lng_min<=lng<=lng_max]
+    # range of longitudes from the previous selceted records 
+    lng_lo,lng_hi=lat_selected.rangeOf('lng')
+    print("\nSELECT longitude : Enter two values seperated by comma")
+    print(f"range is {lng_lo} through {lng_hi}")
+    while True: 
+        try:
+            # split the 2 longitudes and assign to lng1,lng2
+            # if nothing is given or single value is is given
+            # select the entire data
+            lng1,lng2=input("Enter minimum/maximum longitude values:").split(",")
+            # converting to floating numbers
+            lng1,lng2=float(lng1),float(lng2)
+            lng_min,lng_max=min(lng1,lng2),max(lng1,lng2)
+            # checking the given inputs are in the range of longitude list
+            # if yes select the data records
+            # else prompt the user again for the response
+            if lng_lo<lng_min and lng_max<lng_hi:
+                # list of selected records with in the range 
+                # from the previous selected data
+                with stage('select longitude'):
+                    lng_selected=lat_selected.where(lng=(lng_min,lng_max))
+                    lng_selected.collect()
+                print("Accepted...")
+                print({'min':lng_min,'max':lng_max})
+                # print the no of records selected
+                print(f"Selected {len(lng_selected)} records")
+                # prompt the user for moving to next item
+                res=input("\nRespond with 'yes' if Want to move to dates?")
+                # if yes break the loop
+                # else prompt the user for longitude values
+                if res=="yes":
+                    break
+                else:
+                    continue
+            # print the vales are not in range 
+            # if the above if statement is failed    
+            else:
+                print(f"one or more values out of range <({lng1},{lng2})>")
+        # if the above try method fails select entire data 
+        # from the previous selected data        
+        except:
+            # selecting the all records from the previous selected data
+            lng_selected=lat_selected
             print("Accepted...")
-            print({'min':lng_min,'max':lng_max})
+            print({'min':lng_lo,'max':lng_hi})
             # print the no of records selected
             print(f"Selected {len(lng_selected)} records")
             # prompt the user for moving to next item
             res=input("\nRespond with 'yes' if Want to move to dates?")
             # if yes break the loop
-            # else prompt the user for longitude values
+            # else prompt the user for latitude values
             if res=="yes":
                 break
             else:
                 continue
-        # print the vales are not in range 
-        # if the above if statement is failed    
-        else:
-            print(f"one or more values out of range <({lng1},{lng2})>")
-    # if the above try method fails select entire data 
-    # from the previous selected data        
-    except:
-        # selecting the all records from the previous selected data
-        lng_selected=[((lat,lng),data) for (lat,lng),data in lat_selected]
-        print("Accepted...")
-        print({'min':min(lng_list),'max':max(lng_list)})
-        # print the no of records selected
-        print(f"Selected {len(lng_selected)} records")
-        # prompt the user for moving to next item
-        res=input("\nRespond with 'yes' if Want to move to dates?")
-        # if yes break the loop
-        # else prompt the user for latitude values
-        if res=="yes":
-            break
-        else:
-            continue
-# list of dates from the previous selceted records
-date_list=sorted([data['datetime'].date()
-                  for loc,data in lng_selected])
+    # range of dates from the previous selceted records
+    date_lo,date_hi=lng_selected.rangeOf('date')
 
-print("\nSELECT date mm/dd/yy: Enter two values seperated by comma")
-print(f"range is {dt.strftime(min(date_list),'%m/%d/%Y')} through {dt.strftime(max(date_list),'%m/%d/%Y')}")
+    print("\nSELECT date mm/dd/yy: Enter two values seperated by comma")
+    print(f"range is {dt.strftime(date_lo,'%m/%d/%Y')} through {dt.strftime(date_hi,'%m/%d/%Y')}")
 
-while True:
-    try:
-        # split the 2 dates and assign to date1,date2
-        # if nothing is given or single value is is given
-        # select the entire data
-        date1,date2=input("Enter minimum/maximum date values:").split(",")
-        date1,date2=dt.strptime(date1,'%m/%d/%Y'),dt.strptime(date2,'%m/%d/%Y')
-        date_min,date_max=min(date1,date2).date(),max(date1,date2).date()
-        # checking the given inputs are in the range of date list
-        # if yes select the data records
-        # else prompt the user again for the response
-        if min(date_list)<date_min and date_max<max(date_list):
-            # list of selected records with in the range 
-            # from the previous selected data
-            date_selected=[((lat,lng),data) for (lat,lng),data in lng_selected
-                      if date_min<=data['datetime'].date()<=date_max]
+    while True:
+        try:
+            # split the 2 dates and assign to date1,date2
+            # if nothing is given or single value is is given
+            # select the entire data
+            date1,date2=input("Enter minimum/maximum date values:").split(",")
+            date1,date2=dt.strptime(date1,'%m/%d/%Y'),dt.strptime(date2,'%m/%d/%Y')
+            date_min,date_max=min(date1,date2).date(),max(date1,date2).date()
+            # checking the given inputs are in the range of date list
+            # if yes select the data records
+            # else prompt the user again for the response
+            if date_lo<date_min and date_max<date_hi:
+                # list of selected records with in the range 
+                # from the previous selected data
+                with stage('select date'):
+                    date_selected=lng_selected.where(date=(date_min,date_max))
+                    date_selected.collect()
+                print("Accepted...")
+                d=f"{dt.strftime(date1,'%m/%d/%Y')} to {dt.strftime(date2,'%m/%d/%Y')}"
+                print({'min':dt.strftime(date1,'%m/%d/%Y'),
+                       'max':dt.strftime(date2,'%m/%d/%Y')})
+                # print the no of records selected
+                print(f"Selected {len(date_selected)} records")
+                # prompt the user for moving to next item
+                res=input("\nRespond with 'yes' if Want to move to magnitude?")
+                # if yes break the loop
+                # else prompt the user for dates
+                if res=="yes":
+                    break
+                else:
+                    continue
+            # print the vales are not in range 
+            # if the above if statement is failed            
+            else:
+                print(f"one or more values out of range <{dt.strftime(date1,'%m/%d/%Y')},{dt.strftime(date2,'%m/%d/%Y')}>")
+        # if the above try method fails select entire data 
+        # from the previous selected data         
+        except:
+            # selecting the all records from the previous selected data
+            date_selected=lng_selected
+            d=f"{dt.strftime(date_lo,'%m/%d/%Y')} to {dt.strftime(date_hi,'%m/%d/%Y')}"
             print("Accepted...")
-            d=f"{dt.strftime(date1,'%m/%d/%Y')} to {dt.strftime(date2,'%m/%d/%Y')}"
-            print({'min':dt.strftime(date1,'%m/%d/%Y'),
-                   'max':dt.strftime(date2,'%m/%d/%Y')})
+            print({'min':dt.strftime(date_lo,'%m/%d/%Y'),
+                   'max':dt.strftime(date_hi,'%m/%d/%Y')})
             # print the no of records selected
             print(f"Selected {len(date_selected)} records")
             # prompt the user for moving to next item
@@ -380,172 +554,524 @@ while True:
                 break
             else:
                 continue
-        # print the vales are not in range 
-        # if the above if statement is failed            
-        else:
-            print(f"one or more values out of range <{dt.strftime(date1,'%m/%d/%Y')},{dt.strftime(date2,'%m/%d/%Y')}>")
-    # if the above try method fails select entire data 
-    # from the previous selected data         
-    except:
-        # selecting the all records from the previous selected data
-        date_selected=[((lat,lng),data) for (lat,lng),data in lng_selected]
-        d=f"{dt.strftime(min(date_list),'%m/%d/%Y')} to {dt.strftime(max(date_list),'%m/%d/%Y')}"
-        print("Accepted...")
-        print({'min':dt.strftime(min(date_list),'%m/%d/%Y'),
-               'max':dt.strftime(max(date_list),'%m/%d/%Y')})
-        # print the no of records selected
-        print(f"Selected {len(date_selected)} records")
-        # prompt the user for moving to next item
-        res=input("\nRespond with 'yes' if Want to move to magnitude?")
-        # if yes break the loop
-        # else prompt the user for dates
-        if res=="yes":
-            break
-        else:
-            continue
 
-# list of magnitudes from the previous selceted records
-mag_list=sorted([data['Magnitude'] for (lat,lng),data in date_selected])
-print("\nSELECT Magnitude : Enter two values seperated by comma")
-print(f"range is {min(mag_list)} through {max(mag_list)}")
-while True: 
-    try:
-        # split the 2 magnitudes and assign to mag1,mag2
-        # if nothing is given or single value is is given
-        # select the entire data
-        mag1,mag2=input("Enter minimum/maximum magnitude values:").split(",")
-        # converting to floating numbers
-        mag1,mag2=float(mag1),float(mag2)
-        mag_min,mag_max=min(mag1,mag2),max(mag1,mag2)
-        # checking the given inputs are in the range of magnitude list
-        # if yes select the data records
-        # else prompt the user again for the response
-        if min(mag_list)<mag_min and mag_max<max(mag_list):
-            # list of selected records with in the range 
-            # from the previous selected data
-            mag_selected=[((lat,lng),data) for (lat,lng),data in date_selected
-                      if mag_min<=data['Magnitude']<=mag_max]
+    # range of magnitudes from the previous selceted records
+    mag_lo,mag_hi=date_selected.rangeOf('mag')
+    print("\nSELECT Magnitude : Enter two values seperated by comma")
+    print(f"range is {mag_lo} through {mag_hi}")
+    while True: 
+        try:
+            # split the 2 magnitudes and assign to mag1,mag2
+            # if nothing is given or single value is is given
+            # select the entire data
+            mag1,mag2=input("Enter minimum/maximum magnitude values:").split(",")
+            # converting to floating numbers
+            mag1,mag2=float(mag1),float(mag2)
+            mag_min,mag_max=min(mag1,mag2),max(mag1,mag2)
+            # checking the given inputs are in the range of magnitude list
+            # if yes select the data records
+            # else prompt the user again for the response
+            if mag_lo<mag_min and mag_max<mag_hi:
+                # list of selected records with in the range 
+                # from the previous selected data
+                with stage('select magnitude'):
+                    mag_selected=date_selected.where(mag=(mag_min,mag_max))
+                    mag_selected.collect()
+                print("Accepted...")
+                print({'min':mag_min,'max':mag_max})
+                # print the no of records selected
+                print(f"Selected {len(mag_selected)} records")
+                # prompt the user for moving to next item
+                res=input("\nRespond with 'yes' if Want to move to Analysis?")
+                # if yes break the loop
+                # else prompt the user for magnitude values
+                if res=="yes":
+                    break
+                else:
+                    continue
+            # print the vales are not in range 
+            # if the above if statement is failed   
+            else:
+                print(f"one or more values out of range <({mag1},{mag2})>")
+        # if the above try method fails select entire data 
+        # from the previous selected data        
+        except:
+            # selecting the all records from the previous selected data
+            mag_selected=date_selected
             print("Accepted...")
-            print({'min':mag_min,'max':mag_max})
+            print({'min':mag_lo,'max':mag_hi})
             # print the no of records selected
             print(f"Selected {len(mag_selected)} records")
             # prompt the user for moving to next item
             res=input("\nRespond with 'yes' if Want to move to Analysis?")
             # if yes break the loop
-            # else prompt the user for magnitude values
+            # else prompt the user for magnitudes
             if res=="yes":
                 break
             else:
                 continue
-        # print the vales are not in range 
-        # if the above if statement is failed   
-        else:
-            print(f"one or more values out of range <({mag1},{mag2})>")
-    # if the above try method fails select entire data 
-    # from the previous selected data        
-    except:
-        # selecting the all records from the previous selected data
-        mag_selected=[((lat,lng),data) for (lat,lng),data in date_selected]
-        print("Accepted...")
-        print({'min':min(mag_list),'max':max(mag_list)})
-        # print the no of records selected
-        print(f"Selected {len(mag_selected)} records")
-        # prompt the user for moving to next item
-        res=input("\nRespond with 'yes' if Want to move to Analysis?")
-        # if yes break the loop
-        # else prompt the user for magnitudes
-        if res=="yes":
-            break
-        else:
-            continue
- 
-mag_selected.sort(key=lambda x:x[1]['Magnitude'])
-# list with location and severity radius as tuple from previous selected list
-sev_list=[(loc,10**((0.5*data['Magnitude'])-2)) for loc,data in mag_selected]
-sev_list.sort(key=lambda x : x[1])
-# printing largest quake location and data
-print(f"largest equake is at {sev_list[-1][0]}")
-print(qDict[sev_list[-1][0]])
-# calling findCities functions to check the affected cities
-affected_cities=findCities(sev_list[-1][0], cityDict,sev_list[-1][1])
-print(affected_cities)
-print(f"{len(affected_cities)} affected cities within {sev_list[-1][1]} km..")
-print("closest city is...")
-# closest_cities for large quake location and 5000 km radius
-close_cities=findCities(sev_list[-1][0], cityDict,5000)
-# printing the closest city data
-print(close_cities[0])
-
-
-
-# latitude,longittude and magnitude lists for the selected data
-lats=[lat for (lat,lng),data in mag_selected]
-lngs=[lng for (lat,lng),data in mag_selected]
-mags=[data['Magnitude'] for (lat,lng),data in mag_selected]
-# scatter plot with x,y axis as longitude,latitude
-# color based on magnitude values
-plt.scatter(lngs,lats,c=mags)
-# labelling x,y axis and color bar
-plt.xlabel('longitude in degrees')
-plt.ylabel('latitude in degrees')
-plt.colorbar(label='magnitude')
-nl='\n'
-# title of scatter plot
-plt.title(f"{tys}{nl}{d}")
-# displaying the scatter plot
-plt.show()
-
-# list of unique years from the selected data
-year_selected=sorted(set(map(lambda x: x[1]['datetime'].year,
-                                  mag_selected)))
-# creating a new dictionary for no of events
-events={}
-# traversing through years list
-for year in year_selected:
-    # list of data in particular year
-    item=[data for loc,data in mag_selected
-               if data['datetime'].year==year]
-    # appending values to dictionary
-    # key as year and value as length of list of data
-    events[year]=len(item)
-# bar plot with x,y axis as years and length of data 
-# color of bar plot as blue
-plt.bar(events.keys(),events.values(),color='blue')
-# labelling x and y axis
-plt.xlabel('year')
-plt.ylabel('lNumber of events')
-# title for bar plot
-plt.title(f"{tys}{nl}{d}")
-# displaying bar plot
-plt.show()
-
-# creating a new dictionary for average magintudes
-avg_mags={}
-# traversing through years list
-for year in year_selected:
-    # list of magnitudes in particular year
-    item=[data['Magnitude'] for loc,data in mag_selected
-               if data['datetime'].year==year]
-    # appending values to dictionary
-    # key as year and value as length of list of data
-    avg_mags[year]=sum(item)/len(item)
-# scatter plot with x,y axis as year and average magnitude
-plt.scatter(avg_mags.keys(),avg_mags.values())
-# labelling x and y axis
-plt.xlabel('year')
-plt.ylabel('average magnitude')
-nl='\n'
-# title of scatter plot
-plt.title(f"{tys}{nl}{d}")
-# displaying the scatter plot
-plt.show()
+    nl='\n'
+    return mag_selected.items(),f"{tys}{nl}{d}"
 
 
+### Step 5 : analyse and plot the graphs for the selected data
+def reportLargest(mag_selected,cityDict,grid=None):
+    '''
+    Description: prints the largest earthquake of the selection, the
+                 cities affected by it and the closest city.
+    Input:
+        grid : optional CityGrid of cityDict, built on every call if not
+               given
+    '''
+    if grid is None:
+        grid=CityGrid(cityDict)
+    mag_selected=sorted(mag_selected,key=lambda x:x[1]['Magnitude'])
+    # list with location and severity radius as tuple from previous selected list
+    sev_list=[(loc,10**((0.5*data['Magnitude'])-2)) for loc,data in mag_selected]
+    sev_list.sort(key=lambda x : x[1])
+    # printing largest quake location and data
+    print(f"largest equake is at {sev_list[-1][0]}")
+    print(dict(mag_selected)[sev_list[-1][0]])
+    # calling findCities functions to check the affected cities
+    affected_cities=findCities(sev_list[-1][0], cityDict,sev_list[-1][1],
+                               grid.points)
+    print(affected_cities)
+    print(f"{len(affected_cities)} affected cities within {sev_list[-1][1]} km..")
+    print("closest city is...")
+    # nearest city to the large quake location, however far it is
+    close_cities=nearestCities(sev_list[-1][0],cityDict,grid=grid)
+    # printing the closest city data
+    print(close_cities[0] if close_cities else None)
+
 
+def plotQuakes(mag_selected,title,out=None,mode='auto',clusters=None):
+    '''
+    Description: scatter plot of the selected earthquakes with the
+                 color based on the magnitude.
+    Input:
+        out : folder the plot is written to, shown if None
+        mode : 'auto', 'scatter', 'grid' or 'hexbin' (drawQuakes), 'auto'
+               draws the largest magnitude of every cell of a grid
+               instead of a marker per quake for large selections
+        clusters : optional AggTable of clusterSummary, the largest
+                   clusters are circled
+    '''
+    # latitude,longittude and magnitude lists for the selected data
+    lats=[lat for (lat,lng),data in mag_selected]
+    lngs=[lng for (lat,lng),data in mag_selected]
+    mags=[data['Magnitude'] for (lat,lng),data in mag_selected]
+    # scatter plot with x,y axis as longitude,latitude
+    # color based on magnitude values
+    drawn=drawQuakes(plt.gca(),lngs,lats,mags,mode)
+    # circling the hotspots if they were computed
+    if clusters is not None:
+        drawClusters(plt.gca(),clusters)
+    # labelling x,y axis and color bar
+    plt.xlabel('longitude in degrees')
+    plt.ylabel('latitude in degrees')
+    plt.colorbar(drawn,label='magnitude')
+    # title of scatter plot
+    plt.title(title)
+    # displaying the scatter plot
+    showPlot(out,'quakes')
 
 
+def plotEvents(years,title,out=None):
+    '''
+    Description: bar plot of the number of events in every year.
+    Input:
+        years : AggTable of the selection grouped by year (aggregate)
+        out : folder the plot is written to, shown if None
+    '''
+    # dictionary with year as key and the number of events as value
+    events=years.toDict('count')
+    # bar plot with x,y axis as years and length of data 
+    # color of bar plot as blue
+    plt.bar(events.keys(),events.values(),color='blue')
+    # labelling x and y axis
+    plt.xlabel('year')
+    plt.ylabel('lNumber of events')
+    # title for bar plot
+    plt.title(title)
+    # displaying bar plot
+    showPlot(out,'events')
 
 
+def plotAverageMagnitude(years,title,out=None):
+    '''
+    Description: scatter plot of the average magnitude of every year.
+    Input:
+        years : AggTable of the selection grouped by year (aggregate)
+        out : folder the plot is written to, shown if None
+    '''
+    # dictionary with year as key and the average magnitude as value
+    avg_mags=years.toDict('magnitude_mean')
+    # scatter plot with x,y axis as year and average magnitude
+    plt.scatter(avg_mags.keys(),avg_mags.values())
+    # labelling x and y axis
+    plt.xlabel('year')
+    plt.ylabel('average magnitude')
+    # title of scatter plot
+    plt.title(title)
+    # displaying the scatter plot
+    showPlot(out,'average_magnitude')
+
+def plotCountries(countries,title,out=None,top=15):
+    '''
+    Description: bar plot of the number of events of the countries with
+                 the most events, colored by their largest magnitude.
+    Input:
+        countries : AggTable of countryTable, most events first
+        out : folder the plot is written to, shown if None
+        top : number of countries plotted
+    '''
+    rows=countries.rows()[:top]
+    # the country with the most events at the top
+    names=[row['country'] for row in reversed(rows)]
+    counts=[row['count'] for row in reversed(rows)]
+    mags=[row['magnitude_max'] for row in reversed(rows)]
+    bars=plt.barh(names,counts,color=plt.cm.viridis(
+        plt.Normalize(min(mags,default=0),max(mags,default=1))(mags)))
+    # labelling x axis and the bars with the largest magnitude
+    plt.xlabel('Number of events (nearest city in the country)')
+    plt.bar_label(bars,labels=[f"M{m:g}" for m in mags],padding=2)
+    plt.title(title)
+    plt.tight_layout()
+    # displaying the bar plot
+    showPlot(out,'countries')
 
+def plotMagnitudeFrequency(fmd,fit,title,out=None):
+    '''
+    Description: number of events in every magnitude bin and at or above
+                 it on a log scale, with the fitted Gutenberg-Richter law
+                 from the magnitude of completeness on.
+    Input:
+        fmd : AggTable of magnitudeFrequency
+        fit : dictionary of bValue
+        out : folder the plot is written to, shown if None
+    '''
+    mags=fmd['magnitude']
+    # cumulative and per bin number of events
+    plt.semilogy(mags,fmd['cumulative'],'s',color='blue',
+                 label='at or above M')
+    plt.semilogy(mags,fmd['count'],'^',color='gray',label='in the bin')
+    if not np.isnan(fit['b']):
+        above=mags[mags>=fit['mc']-1e-9]
+        plt.semilogy(above,10**(fit['a']-fit['b']*above),color='red',
+                     label=f"b = {fit['b']:.2f} ± {fit['b_error']:.2f}")
+        plt.axvline(fit['mc'],color='red',linestyle=':',
+                    label=f"Mc = {fit['mc']:g}")
+    # labelling x and y axis
+    plt.xlabel('magnitude')
+    plt.ylabel('Number of events')
+    plt.legend()
+    plt.title(title)
+    # displaying the plot
+    showPlot(out,'magnitude_frequency')
+
+def plotRates(rates,title,out=None,bvalues=None):
+    '''
+    Description: events per year in the rolling windows over time, with
+                 the rolling b-value on a second axis if given.
+    Input:
+        rates : AggTable of eventRates
+        out : folder the plot is written to, shown if None
+        bvalues : optional AggTable of rollingBValue
+    '''
+    times=rates['datetime'].astype(object)
+    # line plot of the rate at the end of every window
+    plt.plot(times,rates['rate'],color='blue')
+    plt.xlabel('date')
+    plt.ylabel(f"events per year ({rates['days'].max():g} day windows)"
+               if len(rates) else 'events per year')
+    if bvalues is not None and len(bvalues):
+        # b-value on its own axis at the right
+        ax=plt.gca().twinx()
+        ax.plot(bvalues['datetime'].astype(object),bvalues['b'],
+                color='red',alpha=0.6)
+        ax.set_ylabel('b-value',color='red')
+    plt.title(title)
+    # displaying the plot
+    showPlot(out,'rates')
+
+def exportResults(folder,tables,format='columns'):
+    '''
+    Description: writes every table to a file of the folder named after
+                 it, e.g. selection.csv, or to a folder of columns.
+    Input:
+        folder : folder of the files, created if missing
+        tables : dictionary of name to table for exportTable, the tables
+                 left as None are not written
+        format : one of the export FORMATS
+    '''
+    os.makedirs(folder,exist_ok=True)
+    for name,table in tables.items():
+        if table is None:
+            continue
+        path=os.path.join(folder,name+SUFFIXES[format])
+        rows=exportTable(path,table,format)
+        print(f"Exported {rows} rows to {path}")
+
+### Step 6 : define the command line and the main function
+def parseArgs(argv=None):
+    '''
+    Input:
+        argv : list of command line arguments, sys.argv if not given
+
+    Returns:
+        the parsed arguments
+    '''
+    parser=argparse.ArgumentParser(
+        description="Select, analyse and plot the earthquake data. Without "
+                    "any selection option the ranges are prompted for.")
+    parser.add_argument('--type',help="tremor type or its first three "
+                        "characters, e.g. Earthquake or Nuc")
+    parser.add_argument('--lat',nargs=2,type=float,metavar=('MIN','MAX'),
+                        help="latitude range in degrees")
+    parser.add_argument('--lng',nargs=2,type=float,metavar=('MIN','MAX'),
+                        help="longitude range in degrees")
+    parser.add_argument('--date',nargs=2,metavar=('MIN','MAX'),
+                        help="date range as mm/dd/yyyy")
+    parser.add_argument('--mag',nargs=2,type=float,metavar=('MIN','MAX'),
+                        help="magnitude range")
+    parser.add_argument('--batch',action='store_true',
+                        help="select without prompting, every record when "
+                             "no range is given")
+    parser.add_argument('--no-plot',dest='plot',action='store_false',
+                        help="print the analysis without plotting")
+    parser.add_argument('--save',metavar='DIR',
+                        help="write the plots as png files to the folder "
+                             "instead of showing them")
+    parser.add_argument('--render',choices=('auto','scatter','grid',
+                                            'hexbin'),default='auto',
+                        help="drawing of the quakes, 'auto' switches from "
+                             "a scatter to a grid of the largest "
+                             "magnitudes for large selections")
+    parser.add_argument('--years',metavar='CSV',
+                        help="write the per-year aggregates of the "
+                             "selection to a csv file")
+    parser.add_argument('--impact',metavar='CSV',
+                        help="write the affected cities, population and "
+                             "nearest city of every selected quake to a "
+                             "csv file")
+    parser.add_argument('--clusters',metavar='CSV',
+                        help="find the hotspots of the selection with "
+                             "dbscan, write one row per cluster to a csv "
+                             "file and circle them on the scatter plot")
+    parser.add_argument('--countries',metavar='CSV',
+                        help="tag every selected quake with the country "
+                             "of its nearest city and write the number "
+                             "and magnitudes of the quakes of every "
+                             "country to a csv file")
+    parser.add_argument('--explain',action='store_true',
+                        help="print the plan of the selection, the order "
+                             "of the conditions and the share of the "
+                             "records each keeps")
+    parser.add_argument('--export',metavar='DIR',
+                        help="write the selection, the per-year aggregates "
+                             "and the impact, cluster, country and rate "
+                             "tables computed to files in the folder")
+    parser.add_argument('--export-format',choices=tuple(FORMATS),
+                        default='columns',
+                        help="format of --export, 'columns' writes a "
+                             "memory mappable folder per table, parquet "
+                             "and arrow need pyarrow")
+    parser.add_argument('--timeseries',metavar='CSV',
+                        help="fit the Gutenberg-Richter b-value above the "
+                             "magnitude of completeness, write the event "
+                             "rates of rolling windows to a csv file and "
+                             "plot both")
+    parser.add_argument('--window',type=float,default=WINDOW_DAYS,
+                        metavar='DAYS',help=f"length of the windows of "
+                        f"the rates, {WINDOW_DAYS:g} days by default")
+    parser.add_argument('--step',type=float,default=STEP_DAYS,
+                        metavar='DAYS',help=f"days between two windows of "
+                        f"the rates, {STEP_DAYS:g} by default")
+    parser.add_argument('--eps',type=float,default=EPS,metavar='KM',
+                        help=f"neighborhood radius of the clustering, "
+                             f"{EPS:g} km by default")
+    parser.add_argument('--min-quakes',type=int,default=MIN_SAMPLES,
+                        metavar='N',help=f"quakes within the radius of a "
+                        f"core quake, {MIN_SAMPLES} by default")
+    parser.add_argument('--eps-days',type=float,metavar='DAYS',
+                        help="time window of the neighbors, to separate "
+                             "the aftershock sequences")
+    parser.add_argument('--workers',type=int,metavar='N',
+                        help="number of processes of the impact analysis "
+                             "and of --quakes, every cpu by default")
+    parser.add_argument('--quakes',nargs='+',metavar='CSV',
+                        help="earthquake csv files or glob patterns, e.g. "
+                             "'catalog/*.csv', parsed in parallel with "
+                             "--workers processes and merged without the "
+                             "repeated events")
+    parser.add_argument('--profile',nargs='?',const='',metavar='JSON',
+                        help="print the wall time, calls and peak memory "
+                             "of every stage, also written to the json "
+                             "file if given")
+    return parser.parse_args(argv)
+
+# functions of the session timed as stages with --profile, by the module
+# they are looked up in: havDistMany is counted for findCities, for the
+# searches of the CityGrid and for the impact shards run in this process
+PROFILED={__name__:('promptSelection','reportLargest','findCities',
+                    'nearestCities','havDistMany','loadCatalog','aggregate',
+                    'impactTable','dbscan','clusterSummary','joinCountries',
+                    'countryTable','timeSeries','gutenbergRichter',
+                    'eventRates','rollingBValue','exportResults',
+                    'plotQuakes','plotEvents','plotAverageMagnitude',
+                    'plotCountries','plotMagnitudeFrequency','plotRates'),
+          'spatial_index':('havDistMany',),
+          'impact':('havDistMany',)}
+
+def main(argv=None):
+    '''
+    Description: runs the session, acquiring the data, selecting it
+                 from the command line options or by prompting the user
+                 and plotting the graphs for the selected data. With
+                 --profile every stage is timed and reported at the end,
+                 without it nothing is wrapped or timed.
+    '''
+    args=parseArgs(argv)
+    if args.profile is None:
+        return runSession(args)
+    profiler=profiling.enable()
+    try:
+        # the functions are put back once the session ends
+        with profiling.instrumented(PROFILED),stage('session'):
+            return runSession(args)
+    finally:
+        profiling.disable()
+        profiler.printReport()
+        if args.profile:
+            profiler.dump(args.profile)
+            print(f"Wrote the profile to {args.profile}")
+
+def runSession(args):
+    '''
+    Description: the session of main for the parsed arguments
+    '''
+    if args.save:
+        # no display needed, the plots go to files
+        useHeadless()
+    # announce 
+    print("\n*** Earthquake Data ***")
+    # loading the same dictionaries as getCityData and getQuakeData
+    # from the binary cache, the csv files are parsed only if changed
+    from cache import cachedCities,cachedQuakes
+    with stage('load cities'):
+        cityDict=cachedCities().toDict()
+        # one grid of the cities for every search of the session
+        grid=CityGrid(cityDict)
+    with stage('load quakes'):
+        # kept as a store so that the selections run on its columns
+        if args.quakes:
+            # every distinct event of the files, also several at one
+            # location
+            quakes=loadCatalog(args.quakes,args.workers)
+        else:
+            # one event per location like the dictionary of getQuakeData
+            quakes=cachedQuakes().byLocation()
+        # sorted indexes of the columns, the selections and the range
+        # hints of the session read them instead of scanning every row
+        index=QuakeIndex(quakes)
+
+    # print the length of the data
+    print(f"\nAcquired data {len(cityDict)} cities.")
+    print(f"Acquired data {len(quakes)} earthquakes.")
+
+    ranges=dict(type=args.type,lat=args.lat,lng=args.lng,date=args.date,
+                mag=args.mag)
+    if args.batch or any(v is not None for v in ranges.values()):
+        # the conditions run once, the most selective first
+        query=Query(index).where(**ranges)
+        if args.explain:
+            print(query.explain())
+        with stage('select'):
+            selected=query.collect()
+        print(f"Selected {len(selected)} records")
+        if not len(selected):
+            return
+        # the records only for the functions reading them one by one,
+        # the analysis runs on the columns of the selected store
+        mag_selected=query.items()
+        # title of the plots from the selected types and dates
+        tys=args.type if args.type else f"{typeNames(quakes)}"
+        first,last=query.rangeOf('date')
+        d=f"{first.strftime('%m/%d/%Y')} to {last.strftime('%m/%d/%Y')}"
+        title=f"{tys}\n{d}"
+    else:
+        mag_selected,title=promptSelection(index)
+        selected=mag_selected
+    reportLargest(mag_selected,cityDict,grid)
+    # number of events and magnitudes of every year in one pass
+    years=aggregate(selected,'year')
+    if args.years:
+        years.toCsv(args.years)
+        print(f"Wrote {len(years)} years to {args.years}")
+    impact=None
+    if args.impact:
+        # affected cities of every quake, sharded across processes
+        # quakes of earlier sessions are read from the saved cache,
+        # which is only used with the same city file
+        from cache import CACHE_DIR,fileHash
+        memo=ImpactCache(fileHash("worldcitiesF23.csv"),
+                         path=os.path.join(CACHE_DIR,"impact.npz"))
+        impact=impactTable(selected,cityDict,args.workers,grid=grid,
+                           cache=memo)
+        memo.save()
+        impact.toCsv(args.impact)
+        print(f"Wrote the impact of {len(impact)} quakes to {args.impact}")
+        print("impact cache: {hits} hits, {misses} misses, {size} of "
+              "{maxsize} quakes kept".format(**memo.stats()))
+    clusters=None
+    if args.clusters:
+        # hotspots of the selection, largest first
+        labels=dbscan(selected,args.eps,args.min_quakes,args.eps_days)
+        clusters=clusterSummary(selected,labels)
+        clusters.toCsv(args.clusters)
+        print(f"Wrote {len(clusters)} clusters of "
+              f"{int((labels>=0).sum())} quakes to {args.clusters}")
+    countries=None
+    if args.countries:
+        # nearest city of every quake in one pass over a grid of the
+        # cities instead of a findCities per quake
+        countries=countryTable(joinCountries(selected,cityDict,
+                                                 grid.points))
+        countries.toCsv(args.countries)
+        print(f"Wrote {len(countries)} countries to {args.countries}")
+    fmd=rates=None
+    if args.timeseries:
+        # magnitude-frequency fit and windowed rates over the sorted
+        # times of the selection
+        fmd,fit=gutenbergRichter(selected)
+        if np.isnan(fit['b']):
+            print(f"Gutenberg-Richter: Mc {fit['mc']:g}, {fit['n']} quakes "
+                  f"above it are too few for a b-value")
+        else:
+            print(f"Gutenberg-Richter: Mc {fit['mc']:g}, b {fit['b']:.3f} "
+                  f"± {fit['b_error']:.3f}, a {fit['a']:.3f} from "
+                  f"{fit['n']} quakes")
+        times,mags=timeSeries(selected)
+        rates=eventRates(times,mags,args.window,args.step)
+        bvalues=rollingBValue(times,mags,fit['mc'])
+        rates.toCsv(args.timeseries)
+        print(f"Wrote {len(rates)} windows to {args.timeseries}")
+    if args.export:
+        # files for later jobs, without running the session again
+        exportResults(args.export,{'selection':selected,'years':years,
+                                   'impact':impact,'clusters':clusters,
+                                   'countries':countries,'rates':rates},
+                      args.export_format)
+    if args.plot:
+        plotQuakes(mag_selected,title,args.save,args.render,clusters)
+        plotEvents(years,title,args.save)
+        plotAverageMagnitude(years,title,args.save)
+        if countries is not None:
+            plotCountries(countries,title,args.save)
+        if fmd is not None:
+            plotMagnitudeFrequency(fmd,fit,title,args.save)
+            plotRates(rates,title,args.save,bvalues)
 
 
+if __name__=="__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : haversine.py
+Purpose : Vectorized haversine distances with NumPy, one origin against
+          many points and many against many in bounded chunks
+Revisions:
+    00 : import the required modules
+    01 : define the Points class and toRadians,havDistMany,
+         havDistChunks,havDistPairwise functions
+"""
+### Step 1 : Import the required modules
+from math import radians,cos,sin
+import numpy as np
+
+# Radius of earth in kilometers and miles, the values used by havDist
+RADIUS={'km':6371.0,'miles':3956.0}
+# largest number of pairs evaluated at once by havDistChunks
+# (about 32 MB per float64 temporary)
+CHUNK_PAIRS=1<<22
+
+### Step 2 : define the Points class and the distance functions
+def earthRadius(unit):
+    '''
+    Returns the radius of earth for the unit, miles if not "km"
+    '''
+    return RADIUS['km'] if unit=="km" else RADIUS['miles']
+
+def toRadians(locations):
+    '''
+    Input:
+        locations : iterable of coordinates in degrees (tuple:lat,lng)
+                    or an array of shape (n,2)
+
+    Returns:
+        (lats,lngs) : two float64 arrays of the coordinates in radians
+    '''
+    coords=np.asarray(locations if isinstance(locations,np.ndarray)
+                      else list(locations),dtype=np.float64)
+    coords=coords.reshape(-1,2)
+    return np.radians(coords[:,0]),np.radians(coords[:,1])
+
+def unitVectors(lats,lngs):
+    '''
+    Input:
+        lats,lngs : arrays of coordinates in radians
+
+    Returns:
+        array of shape (n,3) with the points on the unit sphere
+    '''
+    coslat=np.cos(lats)
+    return np.column_stack((coslat*np.cos(lngs),coslat*np.sin(lngs),
+                            np.sin(lats)))
+
+class Points:
+    '''
+    Description : coordinates converted once to radians together with
+                  their unit vectors, so that the distance functions run
+                  without any trigonometry on the stored points.
+    '''
+    def __init__(self,lats,lngs):
+        '''
+        Input:
+            lats,lngs : arrays of coordinates in radians
+        '''
+        self.lats=np.asarray(lats,dtype=np.float64)
+        self.lngs=np.asarray(lngs,dtype=np.float64)
+        self.xyz=unitVectors(self.lats,self.lngs)
+
+    @classmethod
+    def fromDegrees(cls,locations):
+        '''
+        Input:
+            locations : iterable of coordinates in degrees (tuple:lat,lng)
+        '''
+        return cls(*toRadians(locations))
+
+    def __len__(self):
+        return len(self.lats)
+
+    def take(self,ids):
+        '''
+        Returns the Points at the given positions
+        '''
+        points=Points.__new__(Points)
+        points.lats=self.lats[ids]
+        points.lngs=self.lngs[ids]
+        points.xyz=self.xyz[ids]
+        return points
+
+def havDistMany(loc,points,unit="km"):
+    '''
+    Input:
+        loc : coordinates in degrees (tuple:lat,lng)
+        points : Points to measure the distance to
+        unit : optional paramter The default is "km" for kilometers,
+               otherwise miles.
+
+    Returns:
+        array with the distance from loc to every point
+    '''
+    lat,lng=radians(loc[0]),radians(loc[1])
+    origin=np.array([cos(lat)*cos(lng),cos(lat)*sin(lng),sin(lat)])
+    # the haversine of the central angle is a quarter of the squared
+    # chord between the two points on the unit sphere
+    d=points.xyz-origin
+    a=np.einsum('ij,ij->i',d,d)
+    a*=0.25
+    # rounding can push a slightly above 1 for antipodal points
+    np.minimum(a,1.0,out=a)
+    np.sqrt(a,out=a)
+    np.arcsin(a,out=a)
+    a*=2*earthRadius(unit)
+    return a
+
+def havDistChunks(points1,points2,unit="km",chunk=CHUNK_PAIRS):
+    '''
+    Description : generator over the M x N distance matrix between two
+                  sets of points, a block of rows at a time, so that no
+                  more than about chunk pairs are held in memory.
+
+    Input:
+        points1 : the M first Points
+        points2 : the N second Points
+        unit : "km" for kilometers, otherwise miles
+        chunk : upper bound on the number of pairs per block
+
+    Returns:
+        yields (start,stop,block) where block holds the distances from
+        the points start:stop of the first set to every second point
+    '''
+    r=2*earthRadius(unit)
+    rows=max(1,chunk//max(1,len(points2)))
+    x2,y2,z2=points2.xyz.T
+    for start in range(0,len(points1),rows):
+        stop=min(start+rows,len(points1))
+        x1,y1,z1=points1.xyz[start:stop].T[:,:,None]
+        a=(x1-x2)**2
+        a+=(y1-y2)**2
+        a+=(z1-z2)**2
+        a*=0.25
+        np.minimum(a,1.0,out=a)
+        np.sqrt(a,out=a)
+        np.arcsin(a,out=a)
+        a*=r
+        yield start,stop,a
+
+def havDistPairwise(points1,points2,unit="km",chunk=CHUNK_PAIRS):
+    '''
+    Description : the full M x N distance matrix, assembled from the
+                  blocks of havDistChunks.
+
+    Returns:
+        float64 array of shape (M,N)
+    '''
+    out=np.empty((len(points1),len(points2)))
+    for start,stop,block in havDistChunks(points1,points2,unit,chunk):
+        out[start:stop]=block
+    return out
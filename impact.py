@@ -0,0 +1,286 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : impact.py
+Purpose : Exposure of the cities to every selected earthquake, the number
+          and population of the cities within the severity radius and the
+          nearest city, computed in shards by a pool of processes
+Revisions:
+    00 : import the required modules
+    01 : define impactRows, the shard workers and impactTable
+    02 : the nearest city comes from the best-first CityGrid.nearest
+    03 : ImpactCache, a bounded LRU cache of the impact of every quake
+         kept in memory and optionally in a file
+"""
+### Step 1 : Import the required modules
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from aggregate import AggTable
+from haversine import havDistMany
+from quake_store import QuakeStore
+from spatial_index import CityGrid
+from streaming import severity
+
+# number of quakes in every task sent to the workers
+SHARD_ROWS=2000
+# number of quakes kept by default in the ImpactCache
+CACHE_ENTRIES=100000
+
+# city grid and quake columns of the running analysis. They are set in
+# the parent before the pool starts so that forked workers inherit them
+# read-only instead of receiving a copy with every task.
+_shared={}
+
+### Step 2 : define the per-quake analysis
+def impactRows(grid,pop,lat,lng,mag):
+    '''
+    Description : the cities affected by every quake, those closer than
+                  its severity radius as in reportLargest, and the
+                  nearest city.
+
+    Input:
+        grid : CityGrid of the cities
+        pop : int64 array of the population of every city of the grid
+        lat,lng,mag : arrays of the quakes
+
+    Returns:
+        (affected,population,nearest,distance) arrays, one value per
+        quake
+    '''
+    n=len(lat)
+    affected=np.zeros(n,dtype=np.int64)
+    population=np.zeros(n,dtype=np.int64)
+    nearest=np.zeros(n,dtype=np.int64)
+    distance=np.zeros(n,dtype=np.float64)
+    radius=severity(np.asarray(mag,dtype=np.float64))
+    for i,(la,ln,r) in enumerate(zip(lat.tolist(),lng.tolist(),
+                                     radius.tolist())):
+        loc=(la,ln)
+        ids=grid.candidates(loc,r)
+        hits=ids[havDistMany(loc,grid.points.take(ids))<r]
+        affected[i]=len(hits)
+        population[i]=pop[hits].sum()
+        # the same nearest city as nearestCities, -1 without any city
+        found=grid.nearest(loc,1)
+        distance[i],nearest[i]=found[0] if found else (np.nan,-1)
+    return affected,population,nearest,distance
+
+### Step 3 : define the ImpactCache class
+class ImpactCache:
+    '''
+    Description : least recently used cache of the impact of single
+                  quakes, bounded to maxsize quakes. The key is the hash
+                  of the city data with the location and magnitude of
+                  the quake, so results for other city data are never
+                  returned. The cache can be saved to a file and loaded
+                  by the next session.
+    '''
+    def __init__(self,cities,maxsize=CACHE_ENTRIES,path=None):
+        '''
+        Input:
+            cities : hash of the city data, e.g. fileHash of its csv file
+            maxsize : largest number of quakes kept
+            path : optional file the cache is loaded from and saved to
+        '''
+        self.cities=cities
+        self.maxsize=maxsize
+        self.path=path
+        # key to (affected,population,nearest,distance), oldest first
+        self.entries=OrderedDict()
+        self.hits=0
+        self.misses=0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self,lat,lng,mag):
+        '''
+        Returns the key of a quake
+        '''
+        return (self.cities,lat,lng,mag)
+
+    def get(self,key):
+        '''
+        Returns the cached result of the key, None when missing
+        '''
+        value=self.entries.get(key)
+        if value is None:
+            self.misses+=1
+            return None
+        self.hits+=1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self,key,value):
+        '''
+        Description : stores the result, dropping the least recently
+                      used one when full
+        '''
+        self.entries[key]=value
+        self.entries.move_to_end(key)
+        while len(self.entries)>self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        '''
+        Returns a dictionary of the hits, misses, hit rate and size
+        '''
+        total=self.hits+self.misses
+        return {'hits':self.hits,'misses':self.misses,
+                'hit_rate':self.hits/total if total else 0.0,
+                'size':len(self),'maxsize':self.maxsize}
+
+    def load(self,path):
+        '''
+        Description : adds the entries of a saved cache computed from the
+                      same city data, a damaged file is ignored
+        '''
+        try:
+            with np.load(path,allow_pickle=False) as npz:
+                if json.loads(str(npz['cities']))!=self.cities:
+                    return
+                keys=zip(npz['lat'].tolist(),npz['lng'].tolist(),
+                         npz['mag'].tolist())
+                values=zip(npz['affected'].tolist(),
+                           npz['population'].tolist(),
+                           npz['nearest'].tolist(),npz['distance'].tolist())
+                for (lat,lng,mag),value in zip(keys,values):
+                    self.put(self.key(lat,lng,mag),value)
+        except (OSError,ValueError,KeyError):
+            pass
+
+    def save(self,path=None):
+        '''
+        Description : writes the entries, oldest first, under a temporary
+                      name and then renames the file
+        '''
+        path=path or self.path
+        keys=list(self.entries)
+        values=list(self.entries.values())
+        folder=os.path.dirname(path)
+        if folder:
+            os.makedirs(folder,exist_ok=True)
+        tmp=path+'.tmp.npz'
+        np.savez(tmp,cities=np.array(json.dumps(self.cities)),
+                 lat=np.array([k[1] for k in keys],dtype=np.float64),
+                 lng=np.array([k[2] for k in keys],dtype=np.float64),
+                 mag=np.array([k[3] for k in keys],dtype=np.float64),
+                 affected=np.array([v[0] for v in values],dtype=np.int64),
+                 population=np.array([v[1] for v in values],dtype=np.int64),
+                 nearest=np.array([v[2] for v in values],dtype=np.int64),
+                 distance=np.array([v[3] for v in values],dtype=np.float64))
+        os.replace(tmp,path)
+
+### Step 4 : define the shard workers and impactTable
+def _share(grid,pop,lat,lng,mag):
+    '''
+    Description : stores the arrays of the analysis for the shards, in
+                  the parent before forking or as the initializer of a
+                  spawned worker.
+    '''
+    _shared.update(grid=grid,pop=pop,lat=lat,lng=lng,mag=mag)
+
+def _impactShard(bounds):
+    '''
+    Input:
+        bounds : (start,stop) rows of the quakes of the shard
+
+    Returns:
+        (start,rows) with the arrays of impactRows for the shard
+    '''
+    start,stop=bounds
+    s=_shared
+    return start,impactRows(s['grid'],s['pop'],s['lat'][start:stop],
+                            s['lng'][start:stop],s['mag'][start:stop])
+
+def impactTable(quakes,cityDict,workers=None,shard_rows=SHARD_ROWS,
+                grid=None,cache=None):
+    '''
+    Description : impact analysis of every quake of the selection. The
+                  quakes are cut into shards of shard_rows and the shards
+                  run in a pool of worker processes sharing the city grid.
+
+    Input:
+        quakes : QuakeStore, dictionary of quakes data or list of
+                 (location,data) tuples such as mag_selected
+        cityDict : Dictionary of cities data (from getCityData)
+        workers : number of processes, every cpu if not given, 1 runs in
+                  the calling process
+        shard_rows : number of quakes in every task
+        grid : optional CityGrid of cityDict, built if not given
+        cache : optional ImpactCache for the same city data, only the
+                quakes missing from it are computed
+
+    Returns:
+        AggTable with one row per quake in the order of the selection:
+        lat, lng, datetime, magnitude, radius (km), affected (number of
+        cities), population (of the affected cities), nearest_city,
+        nearest_country and nearest_km
+    '''
+    if not isinstance(quakes,QuakeStore):
+        quakes=QuakeStore.fromItems(quakes)
+    if grid is None:
+        grid=CityGrid(cityDict)
+    pop=np.array([data['pop'] for data in grid.cities],dtype=np.int64)
+    n=len(quakes)
+    affected=np.zeros(n,dtype=np.int64)
+    population=np.zeros(n,dtype=np.int64)
+    nearest=np.full(n,-1,dtype=np.int64)
+    distance=np.full(n,np.nan)
+    # the quakes to compute, those missing from the cache
+    todo=np.arange(n)
+    if cache is not None:
+        keys=[cache.key(*k) for k in zip(quakes.lat.tolist(),
+                                         quakes.lng.tolist(),
+                                         quakes.magnitude.tolist())]
+        found=[cache.get(k) for k in keys]
+        done=[i for i,value in enumerate(found) if value is not None]
+        if done:
+            affected[done],population[done],nearest[done],distance[done]=\
+                np.array([found[i] for i in done]).T
+        todo=np.array([i for i,value in enumerate(found) if value is None],
+                      dtype=np.intp)
+    workers=workers or os.cpu_count() or 1
+    shards=[(start,min(start+shard_rows,len(todo)))
+            for start in range(0,len(todo),shard_rows)]
+    arrays=(grid,pop,quakes.lat[todo],quakes.lng[todo],
+            quakes.magnitude[todo])
+    _share(*arrays)
+    try:
+        if workers==1 or len(shards)<=1:
+            results=[_impactShard(shard) for shard in shards]
+        else:
+            # forked workers inherit _shared, spawned ones receive it once
+            fork='fork' in multiprocessing.get_all_start_methods()
+            with ProcessPoolExecutor(
+                    max_workers=min(workers,len(shards)),
+                    mp_context=multiprocessing.get_context('fork')
+                               if fork else None,
+                    initializer=None if fork else _share,
+                    initargs=() if fork else arrays) as pool:
+                results=list(pool.map(_impactShard,shards))
+    finally:
+        _shared.clear()
+    for start,rows in results:
+        ids=todo[start:start+len(rows[0])]
+        affected[ids],population[ids],nearest[ids],distance[ids]=rows
+        if cache is not None:
+            for i,value in zip(ids.tolist(),zip(*(r.tolist() for r in rows))):
+                cache.put(keys[i],value)
+    names=np.array([data['city'] for data in grid.cities]+[''],
+                   dtype=object)
+    countries=np.array([data['country'] for data in grid.cities]+[''],
+                       dtype=object)
+    return AggTable({'lat':quakes.lat,'lng':quakes.lng,
+                     'datetime':quakes.datetime,
+                     'magnitude':quakes.magnitude,
+                     'radius':severity(quakes.magnitude),
+                     'affected':affected,'population':population,
+                     'nearest_city':names[nearest],
+                     'nearest_country':countries[nearest],
+                     'nearest_km':distance},('lat','lng'))
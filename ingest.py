@@ -0,0 +1,549 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : ingest.py
+Purpose : Incremental loading of a growing earthquake file. Only the rows
+          appended since the last run are parsed and added to the saved
+          store, its indexes, the per-year aggregates, the hotspots and
+          the impact of every quake
+Revisions:
+    00 : import the required modules
+    01 : define tailHash, the Catalog class and main
+    02 : the state is a folder of raw arrays, the sorted orders of the
+         index are saved with the store and only the changed values of
+         the arrays are written (writeArray)
+    03 : version 3 for the float64 depth of the QuakeStore
+    04 : an append costs in proportion to the new rows: the columns grow
+         in ArrayBuffers, the hotspots keep their grid, the hash of the
+         city file is kept while its signature holds and a save writes
+         the rows known to have changed (changed) instead of comparing
+         every array
+"""
+### Step 1 : Import the required modules
+import argparse # importing argparse module
+import csv # importing csv module
+import hashlib
+import io
+import json
+import os
+from time import perf_counter
+import numpy as np
+from aggregate import AggTable
+from cache import CACHE_DIR,signedHash,cachedCities
+from cluster import Hotspots,EPS,MIN_SAMPLES
+from impact import impactTable
+from quake_store import QuakeStore,ArrayBuffer,buildQuakes
+from range_index import QuakeIndex
+from spatial_index import CityGrid
+from streaming import YearAggregator
+
+# number of bytes before the end of the ingested part of the file that
+# must be unchanged for the file to count as appended to
+TAIL_BYTES=4096
+# bump when the layout of the saved state changes
+STATE_VERSION=4
+# file of the state folder describing its arrays
+META="meta.json"
+
+### Step 2 : define the helper functions
+def tailHash(path,offset,size=TAIL_BYTES):
+    '''
+    Returns the sha1 hex digest of the size bytes of the file before
+    offset
+    '''
+    start=max(0,offset-size)
+    with open(path,'rb') as f:
+        f.seek(start)
+        return hashlib.sha1(f.read(offset-start)).hexdigest()
+
+def stateFolder(path,cache_dir=CACHE_DIR):
+    '''
+    Returns the folder of the saved state of the catalog of the file
+    '''
+    return os.path.join(cache_dir,os.path.basename(path)+'.ingest')
+
+def writeMeta(folder,meta):
+    '''
+    Description : writes meta.json under a temporary name and then
+                  renames it, like the cache files
+    '''
+    name=os.path.join(folder,META)
+    with open(name+'.tmp','w') as f:
+        json.dump(meta,f)
+    os.replace(name+'.tmp',name)
+
+def readArray(folder,name,entry):
+    '''
+    Returns the array of the raw file of the state folder, with the type,
+    number of rows and shape of a row of its entry in meta.json
+    '''
+    shape=tuple(entry.get('shape',()))
+    count=entry['rows']*int(np.prod(shape,dtype=np.int64))
+    if count==0:
+        return np.zeros((entry['rows'],)+shape,dtype=entry['dtype'])
+    values=np.fromfile(os.path.join(folder,name),dtype=entry['dtype'],
+                       count=count)
+    if len(values)<count:
+        raise ValueError(f"<{name}> is shorter than in {META}")
+    return values.reshape((entry['rows'],)+shape)
+
+def writeArray(folder,name,values,entry=None,changed=None):
+    '''
+    Description : brings the raw file of an array up to date. When the
+                  file holds the array of the last save with the same
+                  type and shape, only the changed rows are written over
+                  it through a memory map, so that only their pages go to
+                  disk, and the new rows are added at the end. The
+                  changed rows are the given ones, or the rows that
+                  differ from the file. Any other file is written again.
+
+    Input:
+        folder : the state folder
+        name : name of the file
+        values : the array
+        entry : entry of the file in meta.json at the last save, if any
+        changed : array of the rows of the last save that may differ
+                  from the file, every row is compared when None
+
+    Returns:
+        (entry,written) the new entry, type, number of rows and shape of
+        a row, and the number of bytes written
+    '''
+    values=np.ascontiguousarray(values,
+                                dtype=values.dtype.newbyteorder('<'))
+    file=os.path.join(folder,name)
+    shape=list(values.shape[1:])
+    width=values.itemsize*int(np.prod(shape,dtype=np.int64))
+    kept=0
+    if entry is not None and entry['dtype']==values.dtype.str and \
+       entry.get('shape',[])==shape and os.path.exists(file) and width:
+        kept=min(entry['rows'],len(values),os.path.getsize(file)//width)
+    written=0
+    if kept:
+        disk=np.memmap(file,dtype=values.dtype,mode='r+',
+                       shape=(kept,)+values.shape[1:])
+        if changed is None:
+            # compared byte for byte, so that NaN and NaT count as equal
+            changed=np.flatnonzero(
+                (disk.reshape(kept,-1).view(np.uint8)!=
+                 values[:kept].reshape(kept,-1).view(np.uint8)).any(axis=1))
+        else:
+            changed=np.unique(changed)
+            changed=changed[changed<kept]
+        if len(changed):
+            disk[changed]=values[changed]
+            disk.flush()
+        written=len(changed)*width
+        del disk
+    with open(file,'r+b' if kept else 'wb') as f:
+        f.seek(kept*width)
+        f.write(values[kept:].reshape(-1).view(np.uint8))
+        f.truncate()
+    written+=(len(values)-kept)*width
+    entry={'dtype':values.dtype.str,'rows':len(values)}
+    if shape:
+        entry['shape']=shape
+    return entry,written
+
+def encodeText(values,categories):
+    '''
+    Returns (codes,categories) of an array of strings, the categories of
+    the last save keep their codes and the new ones are added after them
+    so that the codes of the rows already saved do not change
+    '''
+    found,inverse=np.unique(np.asarray(values,dtype=str),
+                            return_inverse=True)
+    categories=list(categories)
+    position={c:i for i,c in enumerate(categories)}
+    for c in found.tolist():
+        if c not in position:
+            position[c]=len(categories)
+            categories.append(c)
+    recode=np.array([position[c] for c in found.tolist()],dtype=np.int32)
+    return recode[inverse.reshape(-1)],categories
+
+### Step 3 : define the Catalog class
+class Catalog:
+    '''
+    Description : the quakes of a csv file that only grows at the end,
+                  together with the results derived from them. Every call
+                  of ingest parses the bytes added since the last one and
+                  updates the results with the new quakes only, the
+                  state is saved next to the cache of the file.
+    '''
+    def __init__(self,path="earthquakesF23.csv",cache_dir=CACHE_DIR,
+                 eps=EPS,min_samples=MIN_SAMPLES,eps_days=None,
+                 cities="worldcitiesF23.csv",workers=1):
+        '''
+        Input:
+            path : path of the earthquake csv file
+            cache_dir : folder of the saved state
+            eps,min_samples,eps_days : parameters of the hotspots (dbscan)
+            cities : path of the world cities csv file for the impact of
+                     the quakes, None to leave the impact out
+            workers : number of processes of the impact analysis
+        '''
+        self.path=path
+        self.cache_dir=cache_dir
+        self.cities=cities
+        self.workers=workers
+        self.params={'eps':eps,'min_samples':min_samples,
+                     'eps_days':eps_days}
+        # entries of the arrays in the state folder, as last saved
+        self.saved={}
+        self.reset()
+        self.load()
+
+    def changed(self,name,rows=None):
+        '''
+        Description : notes the rows of a saved array that changed since
+                      the last save, writeArray compares every row of the
+                      arrays changed without rows
+        '''
+        if self.dirty is None:
+            return
+        if rows is None or self.dirty.get(name,0) is None:
+            self.dirty[name]=None
+        else:
+            self.dirty[name]=np.concatenate(
+                (self.dirty.get(name,np.zeros(0,dtype=np.intp)),rows))
+
+    def reset(self):
+        '''
+        Description : forgets every ingested row
+        '''
+        self.header=None
+        # bytes and data rows of the file ingested so far
+        self.offset=0
+        self.rows=0
+        self.tail=None
+        self.store=None
+        self.index=None
+        self.years=YearAggregator()
+        self.hotspots=Hotspots(**self.params)
+        # columns of the store and the names of their type codes, the
+        # codes of the names already seen never change
+        self.columns={}
+        self.names={}
+        # columns of the impact, the text columns also as codes
+        self.impact=None
+        self.impactColumns={}
+        self.impactCodes={}
+        self.citySignature=None
+        self.grid=None
+        # rows of the saved arrays changed since the last save, None
+        # when they must all be compared (changed)
+        self.dirty=None
+        # bytes written by the last save
+        self.written=0
+
+    def __len__(self):
+        return 0 if self.store is None else len(self.store)
+
+    ### the saved state
+    def load(self):
+        '''
+        Description : restores the state saved by save, if it was saved
+                      for the same parameters. The hotspots and the impact
+                      are recomputed when their parameters or the city
+                      file changed, the index is read in its saved order.
+        '''
+        folder=stateFolder(self.path,self.cache_dir)
+        try:
+            with open(os.path.join(folder,META)) as f:
+                meta=json.load(f)
+            self.saved=meta.get('arrays',{})
+            if meta['version']!=STATE_VERSION or meta['saving']:
+                # a save that did not finish leaves the arrays mixed
+                return
+            arrays={name:readArray(folder,name,entry)
+                    for name,entry in self.saved.items()}
+        except (OSError,ValueError,KeyError):
+            # a missing or damaged state is rebuilt from the file
+            return
+        def group(prefix):
+            return {k[len(prefix):]:v for k,v in arrays.items()
+                    if k.startswith(prefix)}
+        # the arrays in memory are those of the files from now on
+        self.dirty={}
+        self.columns={k:ArrayBuffer(v) for k,v in group('store.').items()}
+        self.names=meta['names']
+        store=self.makeStore()
+        self.header=meta['header']
+        self.offset=meta['offset']
+        self.rows=meta['rows']
+        self.tail=meta['tail']
+        self.store=store
+        try:
+            self.index=QuakeIndex.fromState(store,group('index.'))
+        except (KeyError,ValueError):
+            self.index=QuakeIndex(store)
+            for name in self.saved:
+                if name.startswith('index.'):
+                    self.changed(name)
+        self.years.count={int(y):n for y,n in meta['count'].items()}
+        self.years.total={int(y):t for y,t in meta['total'].items()}
+        if meta['params']==self.params:
+            self.hotspots=Hotspots.fromState(group('hot.'),**self.params)
+        else:
+            self.hotspots.update(store)
+            for name in self.saved:
+                if name.startswith('hot.'):
+                    self.changed(name)
+        for name,values in group('impact.').items():
+            self.impactColumns[name]=ArrayBuffer(values)
+            categories=self.saved['impact.'+name].get('categories')
+            if categories is not None:
+                # text columns are saved as codes
+                self.impactCodes[name]=(self.impactColumns[name],
+                                        categories)
+                self.impactColumns[name]=ArrayBuffer(
+                    np.array(categories,dtype=object)[values])
+        if self.impactColumns:
+            self.impact=AggTable({name:column.values for name,column in
+                                  self.impactColumns.items()},('lat','lng'))
+            self.citySignature=meta['cities']
+        # only recomputed when the city file changed
+        self.updateImpact(len(self))
+
+    def save(self):
+        '''
+        Description : writes the state to its folder, one raw file per
+                      array and meta.json. Only the values that changed
+                      since the last save are written (writeArray): the
+                      new rows of the store and the impact, the merged
+                      orders of the index and the changed counts, roots
+                      and nearest core quakes of the hotspots. Until
+                      every array is written meta.json marks the state as
+                      being saved, such a state is ingested again.
+
+        Returns:
+            the number of bytes written
+        '''
+        folder=stateFolder(self.path,self.cache_dir)
+        os.makedirs(folder,exist_ok=True)
+        writeMeta(folder,{'version':STATE_VERSION,'saving':True,
+                          'arrays':self.saved})
+        # the few type names go to meta.json
+        arrays={'store.'+k:v.values for k,v in self.columns.items()}
+        arrays.update({'index.'+k:v for k,v in self.index.state().items()})
+        arrays.update({'hot.'+k:v for k,v in self.hotspots.state().items()})
+        text={}
+        for k,v in self.impactColumns.items():
+            if k in self.impactCodes:
+                # text columns as codes, without pickling
+                v,text['impact.'+k]=self.impactCodes[k]
+            arrays['impact.'+k]=v.values
+        entries={}
+        written=0
+        for name,values in arrays.items():
+            entries[name],size=writeArray(
+                folder,name,values,self.saved.get(name),
+                None if self.dirty is None else
+                self.dirty.get(name,np.zeros(0,dtype=np.intp)))
+            if name in text:
+                entries[name]['categories']=text[name]
+            written+=size
+        for name in set(self.saved)-set(entries):
+            # arrays of an earlier save no longer kept
+            try:
+                os.remove(os.path.join(folder,name))
+            except OSError:
+                pass
+        self.saved=entries
+        self.dirty={}
+        writeMeta(folder,{'version':STATE_VERSION,'saving':False,
+                          'header':self.header,'offset':self.offset,
+                          'rows':self.rows,'tail':self.tail,
+                          'count':self.years.count,'total':self.years.total,
+                          'params':self.params,
+                          'cities':self.citySignature,
+                          'names':self.names,'arrays':entries})
+        return written
+
+    ### the incremental updates
+    def makeStore(self):
+        '''
+        Returns the QuakeStore over the columns of the catalog, without
+        copying them
+        '''
+        columns={k:v.values for k,v in self.columns.items()}
+        columns.update({k:np.array(v,dtype=str)
+                        for k,v in self.names.items()})
+        return QuakeStore.fromColumns(columns)
+
+    def grow(self,quakes):
+        '''
+        Description : appends the quakes to the columns of the catalog,
+                      their type names are coded after the names already
+                      seen (encodeText)
+
+        Returns:
+            the QuakeStore of every quake of the catalog
+        '''
+        columns=quakes.columns()
+        for kind in ('type','magtype'):
+            names=columns.pop(kind+'_names')
+            columns[kind+'_codes'],self.names[kind+'_names']=encodeText(
+                names[columns[kind+'_codes']],
+                self.names.get(kind+'_names',[]))
+        for k,v in columns.items():
+            if k in self.columns:
+                self.columns[k].extend(v)
+            else:
+                self.columns[k]=ArrayBuffer(v)
+        return self.makeStore()
+
+    def updateImpact(self,first):
+        '''
+        Description : impact of the quakes from row first on, or of every
+                      quake when the city file changed since the impact
+                      was computed. The city file is only hashed again
+                      when its size or modification time changed.
+        '''
+        if self.cities is None:
+            return
+        signature=signedHash(self.cities,self.citySignature)
+        if self.citySignature is None or \
+           signature['sha1']!=self.citySignature['sha1']:
+            self.grid=None
+            self.impact=None
+        self.citySignature=signature
+        if self.impact is None:
+            first=0
+            self.impactColumns={}
+            self.impactCodes={}
+            for name in self.saved:
+                if name.startswith('impact.'):
+                    self.changed(name)
+        if first>=len(self):
+            return
+        if self.grid is None:
+            self.grid=CityGrid(cachedCities(self.cities).toDict())
+        table=impactTable(self.store.take(np.arange(first,len(self))),
+                          self.grid.cityDict,self.workers,grid=self.grid)
+        for name,values in table.columns.items():
+            if values.dtype==object:
+                codes,categories=self.impactCodes.get(
+                    name,(ArrayBuffer(np.zeros(0,dtype=np.int32)),[]))
+                new,categories=encodeText(values,categories)
+                codes.extend(new)
+                self.impactCodes[name]=(codes,categories)
+            if name in self.impactColumns:
+                self.impactColumns[name].extend(values)
+            else:
+                self.impactColumns[name]=ArrayBuffer(values)
+        self.impact=AggTable({name:column.values for name,column in
+                              self.impactColumns.items()},table.keys)
+
+    def append(self,quakes):
+        '''
+        Description : adds the new quakes to the store and updates the
+                      index, the per-year aggregates, the hotspots and
+                      the impact with them, noting the rows of the saved
+                      arrays that changed.
+        '''
+        first=len(self)
+        self.store=self.grow(quakes)
+        if self.index is None:
+            self.index=QuakeIndex(self.store)
+        else:
+            for name,start in self.index.append(self.store).items():
+                self.changed('index.'+name,np.arange(start,first))
+                self.changed('index.'+name+'_runs')
+        self.years.update(quakes)
+        rows,cells=self.hotspots.update(self.store)
+        for name in ('counts','parents','nearest','distance'):
+            self.changed('hot.'+name,rows)
+        self.changed('hot.cells',np.arange(cells,first))
+        self.changed('hot.cells_runs')
+        self.updateImpact(first)
+
+    def ingest(self):
+        '''
+        Description : parses the complete lines added to the file since
+                      the last call, a line still being written is left
+                      for the next one. A file that shrank or whose last
+                      ingested bytes changed is ingested again from the
+                      start.
+
+        Returns:
+            the number of new quakes
+        '''
+        size=os.path.getsize(self.path)
+        if self.offset and (size<self.offset or
+                            tailHash(self.path,self.offset)!=self.tail):
+            print(f"{self.path} was rewritten, ingesting it again")
+            self.reset()
+        if size==self.offset:
+            return 0
+        with open(self.path,'rb') as f:
+            f.seek(self.offset)
+            data=f.read(size-self.offset)
+        if self.header is None:
+            end=data.find(b'\n')+1
+            if end==0:
+                return 0
+            self.header=next(csv.reader([data[:end].decode()]))
+            self.offset+=end
+            data=data[end:]
+        end=len(data)
+        if not data.endswith(b'\n'):
+            # a last line without its newline may still be written, it
+            # counts once it holds every field
+            last=data.rfind(b'\n')+1
+            fields=next(csv.reader([data[last:].decode()]),[])
+            if len(fields)<len(self.header):
+                end=last
+        read=csv.reader(io.StringIO(data[:end].decode(),newline=''))
+        rows=[row for row in read if row]
+        quakes=buildQuakes(self.header,rows,self.rows) if rows else None
+        self.offset+=end
+        self.rows+=len(rows)
+        self.tail=tailHash(self.path,self.offset)
+        if quakes is not None and len(quakes):
+            self.append(quakes)
+        if self.store is not None:
+            self.written=self.save()
+        return 0 if quakes is None else len(quakes)
+
+### Step 4 : define the command line
+def main(argv=None):
+    '''
+    Description : ingests the rows added to the file since the last run
+                  and prints the updated results.
+    '''
+    parser=argparse.ArgumentParser(
+        description="Parse only the rows appended to the earthquake file "
+                    "since the last run and update the saved results.")
+    parser.add_argument('path',nargs='?',default="earthquakesF23.csv",
+                        help="earthquake csv file")
+    parser.add_argument('--eps',type=float,default=EPS,metavar='KM',
+                        help="neighborhood radius of the hotspots")
+    parser.add_argument('--min-quakes',type=int,default=MIN_SAMPLES,
+                        metavar='N',help="quakes around a core quake")
+    parser.add_argument('--eps-days',type=float,metavar='DAYS',
+                        help="time window of the hotspots")
+    parser.add_argument('--no-impact',dest='impact',action='store_false',
+                        help="leave out the impact of the quakes")
+    parser.add_argument('--workers',type=int,default=1,metavar='N',
+                        help="number of processes of the impact analysis")
+    args=parser.parse_args(argv)
+    start=perf_counter()
+    catalog=Catalog(args.path,eps=args.eps,min_samples=args.min_quakes,
+                    eps_days=args.eps_days,
+                    cities="worldcitiesF23.csv" if args.impact else None,
+                    workers=args.workers)
+    new=catalog.ingest()
+    print(f"Ingested {new} new quakes, {len(catalog)} in total, "
+          f"in {perf_counter()-start:.2f} s")
+    labels=catalog.hotspots.labels()
+    print(f"{int(labels.max())+1 if len(labels) else 0} hotspots, "
+          f"{int((labels>=0).sum())} quakes in a hotspot")
+    for year,agg in list(catalog.years.result().items())[-3:]:
+        print(f"{year}: {agg['count']} events, average magnitude "
+              f"{agg['mean']:.2f}")
+    return catalog
+
+
+if __name__=="__main__":
+    main()
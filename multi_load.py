@@ -0,0 +1,155 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : multi_load.py
+Purpose : Loading a catalog split over many csv files, e.g. one per year
+          or region, parsed in parallel by a pool of processes and merged
+          into one QuakeStore without the events listed more than once
+Revisions:
+    00 : import the required modules
+    01 : define catalogFiles,fileParts,uniqueRows and loadCatalog
+"""
+### Step 1 : Import the required modules
+import csv # importing csv module
+import glob
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from quake_store import QuakeStore,buildQuakes
+
+# number of bytes of a file parsed by one task, large files are cut into
+# several tasks so that a single file also keeps every worker busy
+CHUNK_BYTES=8<<20
+
+### Step 2 : define the helper functions
+def catalogFiles(paths):
+    '''
+    Description : the csv files of a catalog from glob patterns and file
+                  names, each file once and in sorted order.
+
+    Input:
+        paths : a pattern or file name, or a list of them
+
+    Returns:
+        list of file names
+    '''
+    if isinstance(paths,str):
+        paths=[paths]
+    files=set()
+    for pattern in paths:
+        found=glob.glob(pattern)
+        if not found:
+            raise FileNotFoundError(f"no file matches <{pattern}>")
+        files.update(os.path.normpath(name) for name in found)
+    return sorted(files)
+
+def fileParts(path,chunk_bytes=CHUNK_BYTES):
+    '''
+    Description : cuts the data rows of a csv file into parts of about
+                  chunk_bytes ending at the end of a line, counting the
+                  rows before every part for the messages.
+
+    Returns:
+        (header,parts) the names of the columns and a list of
+        (start,stop,first) byte ranges and the position of their first row
+    '''
+    with open(path,'rb') as f:
+        header=next(csv.reader([f.readline().decode()]))
+        parts=[]
+        start=f.tell()
+        first=0
+        while True:
+            block=f.read(chunk_bytes)
+            if not block:
+                break
+            # complete the line cut by the end of the block
+            block+=f.readline()
+            parts.append((start,start+len(block),first))
+            first+=block.count(b'\n')+(not block.endswith(b'\n'))
+            start+=len(block)
+    return header,parts
+
+def _loadPart(task):
+    '''
+    Input:
+        task : (path,header,start,stop,first) of fileParts
+
+    Returns:
+        QuakeStore of the rows of the part, None if it holds none
+    '''
+    path,header,start,stop,first=task
+    with open(path,'rb') as f:
+        f.seek(start)
+        data=f.read(stop-start)
+    read=csv.reader(io.StringIO(data.decode(),newline=''))
+    rows=[row for row in read if row]
+    return buildQuakes(header,rows,first) if rows else None
+
+def uniqueRows(store):
+    '''
+    Description : the first row of every distinct event, two rows being
+                  the same event when their datetime, latitude, longitude
+                  and magnitude are all equal. Unlike the location keys
+                  of getQuakeData, distinct events at the same place are
+                  all kept.
+
+    Returns:
+        sorted array of the positions of the rows kept
+    '''
+    n=len(store)
+    if n==0:
+        return np.arange(0)
+    # equal events end up next to each other, the stable sort keeps the
+    # first one in the files ahead of its copies
+    keys=(store.magnitude,store.lng,store.lat,store.datetime)
+    order=np.lexsort(keys)
+    new=np.zeros(n,dtype=bool)
+    new[0]=True
+    for key in keys:
+        ordered=key[order]
+        new[1:]|=ordered[1:]!=ordered[:-1]
+    return np.sort(order[new])
+
+### Step 3 : define the loader
+def loadCatalog(paths,workers=None,chunk_bytes=CHUNK_BYTES,dedupe=True):
+    '''
+    Description : parses every file of the catalog into columnar chunks
+                  in a pool of worker processes, merges them in the order
+                  of the files and leaves out the events listed more than
+                  once.
+
+    Input:
+        paths : glob pattern or file name, or a list of them
+        workers : number of processes, every cpu if not given, 1 parses
+                  in the calling process
+        chunk_bytes : size of the part of a file parsed by one task
+        dedupe : leave out the repeated events (uniqueRows)
+
+    Returns:
+        QuakeStore of every event of the files
+    '''
+    tasks=[]
+    for path in catalogFiles(paths):
+        header,parts=fileParts(path,chunk_bytes)
+        tasks.extend((path,header)+part for part in parts)
+    workers=workers or os.cpu_count() or 1
+    if workers==1 or len(tasks)<=1:
+        chunks=[_loadPart(task) for task in tasks]
+    else:
+        fork='fork' in multiprocessing.get_all_start_methods()
+        with ProcessPoolExecutor(
+                max_workers=min(workers,len(tasks)),
+                mp_context=multiprocessing.get_context('fork')
+                           if fork else None) as pool:
+            chunks=list(pool.map(_loadPart,tasks))
+    chunks=[chunk for chunk in chunks if chunk is not None and len(chunk)]
+    if not chunks:
+        raise ValueError(f"no quakes in <{paths}>")
+    store=QuakeStore.concat(chunks)
+    if dedupe:
+        keep=uniqueRows(store)
+        if len(keep)<len(store):
+            print(f"Left out {len(store)-len(keep)} repeated quakes")
+            store=store.take(keep)
+    return store
@@ -0,0 +1,216 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : profiling.py
+Purpose : Timing the stages of a run, the wall time, number of calls
+          and peak memory of every stage, reported on the console or as
+          json. Nothing is timed or wrapped until profiling is enabled.
+Revisions:
+    00 : import the required modules
+    01 : define the Profiler class and the enable,stage,instrument
+         functions
+    02 : uninstrument and the instrumented context manager putting the
+         functions back, in every module they are looked up in
+"""
+### Step 1 : Import the required modules
+import contextlib
+import functools
+import importlib
+import json
+import tracemalloc
+from time import perf_counter
+
+# the running Profiler, None while profiling is disabled
+_profiler=None
+# context returned by stage while profiling is disabled
+_NULL=contextlib.nullcontext()
+
+### Step 2 : define the Profiler class
+class Profiler:
+    '''
+    Description : wall time, number of calls and peak memory of named
+                  stages. Stages may be nested, the time and memory of an
+                  inner stage also count for the outer one.
+    '''
+    def __init__(self,memory=True):
+        '''
+        Input:
+            memory : trace the allocations with tracemalloc, which slows
+                     the run down but gives the peak memory of every stage
+        '''
+        self.memory=memory
+        # name to {'calls','seconds','peak_bytes'} in the order first seen
+        self.stages={}
+        # (base,peak) memory of the open stages, innermost last
+        self.stack=[]
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        '''
+        Description : stops tracing the allocations
+        '''
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def stage(self,name):
+        '''
+        Description : context manager timing the block as the stage name
+        '''
+        if self.memory:
+            current,peak=tracemalloc.get_traced_memory()
+            if self.stack:
+                # keep the peak of the outer stage before resetting it
+                self.stack[-1][1]=max(self.stack[-1][1],peak)
+            tracemalloc.reset_peak()
+            self.stack.append([current,current])
+        start=perf_counter()
+        try:
+            yield
+        finally:
+            seconds=perf_counter()-start
+            record=self.stages.setdefault(name,{'calls':0,'seconds':0.0,
+                                                'peak_bytes':0})
+            record['calls']+=1
+            record['seconds']+=seconds
+            if self.memory:
+                current,peak=tracemalloc.get_traced_memory()
+                base,top=self.stack.pop()
+                top=max(top,peak)
+                record['peak_bytes']=max(record['peak_bytes'],top-base)
+                if self.stack:
+                    self.stack[-1][1]=max(self.stack[-1][1],top)
+                tracemalloc.reset_peak()
+
+    def report(self):
+        '''
+        Returns a dictionary of stage name to its number of calls, total
+        seconds and peak memory in bytes above the start of the stage
+        '''
+        return {name:dict(record) for name,record in self.stages.items()}
+
+    def printReport(self):
+        '''
+        Description : prints one line per stage, the slowest first
+        '''
+        print("\n*** Profile ***")
+        print(f"{'stage':<28}{'calls':>8}{'seconds':>11}{'peak MB':>10}")
+        for name,record in sorted(self.stages.items(),
+                                  key=lambda x:-x[1]['seconds']):
+            peak=f"{record['peak_bytes']/1e6:10.2f}" if self.memory else \
+                 f"{'-':>10}"
+            print(f"{name:<28}{record['calls']:>8}"
+                  f"{record['seconds']:>11.4f}{peak}")
+
+    def dump(self,path):
+        '''
+        Description : writes the report to a json file
+        '''
+        with open(path,'w') as f:
+            json.dump({'memory':self.memory,'stages':self.report()},f,
+                      indent=2)
+
+### Step 3 : define the module functions
+def enable(memory=True):
+    '''
+    Description : starts profiling, the stages and instrumented functions
+                  are recorded from now on
+
+    Returns:
+        the running Profiler
+    '''
+    global _profiler
+    _profiler=Profiler(memory)
+    return _profiler
+
+def disable():
+    '''
+    Description : stops profiling
+
+    Returns:
+        the Profiler that was running, None if there was none
+    '''
+    global _profiler
+    profiler,_profiler=_profiler,None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+def stage(name):
+    '''
+    Description : context manager timing a block as the stage name, a
+                  shared no-op context while profiling is disabled
+    '''
+    return _NULL if _profiler is None else _profiler.stage(name)
+
+def profiled(func,name=None):
+    '''
+    Returns func wrapped so that every call is recorded as a stage of
+    the running Profiler
+    '''
+    name=name or func.__name__
+    @functools.wraps(func)
+    def wrapper(*args,**kwargs):
+        with stage(name):
+            return func(*args,**kwargs)
+    return wrapper
+
+def instrument(namespace,names):
+    '''
+    Description : replaces the functions of a module by profiled ones.
+                  Calls made through the module globals, also from the
+                  other functions of the module, are then recorded. It
+                  does nothing while profiling is disabled, so the
+                  functions keep running without any wrapper.
+
+    Input:
+        namespace : module holding the functions
+        names : names of the functions
+
+    Returns:
+        dictionary of name to the function replaced, for uninstrument
+    '''
+    replaced={}
+    if _profiler is None:
+        return replaced
+    for name in names:
+        func=getattr(namespace,name)
+        if not hasattr(func,'__wrapped__'):
+            replaced[name]=func
+            setattr(namespace,name,profiled(func))
+    return replaced
+
+def uninstrument(namespace,replaced):
+    '''
+    Description : puts back the functions replaced by instrument
+
+    Input:
+        namespace : module given to instrument
+        replaced : dictionary returned by instrument
+    '''
+    for name,func in replaced.items():
+        setattr(namespace,name,func)
+
+@contextlib.contextmanager
+def instrumented(targets):
+    '''
+    Description : context manager instrumenting functions of several
+                  modules for the block and putting them back after it,
+                  also when it raises. A function imported with from ...
+                  import is looked up in the module importing it, so it
+                  is listed under every module whose calls are counted.
+
+    Input:
+        targets : dictionary of module, or module name, to the names of
+                  the functions to instrument in it
+    '''
+    done=[]
+    try:
+        for module,names in targets.items():
+            if isinstance(module,str):
+                module=importlib.import_module(module)
+            done.append((module,instrument(module,names)))
+        yield
+    finally:
+        for module,replaced in reversed(done):
+            uninstrument(module,replaced)
@@ -0,0 +1,614 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : quake_store.py
+Purpose : Columnar, array backed stores of the earthquake and city data
+          with accessors that still give the dictionaries returned by
+          getQuakeData and getCityData
+Revisions:
+    00 : import the required modules
+    01 : define the StringColumn,Categorical,QuakeStore and CityStore
+         classes and the loadQuakes,loadCities functions
+    02 : columns,fromColumns and toDict methods for the binary cache,
+         the depth of a record is given back as text like in the file
+    03 : loadQuakes parses the dates in bulk with parseDateTimes
+    04 : buildQuakes for parsing any list of rows, concat and mask
+         methods, matchTypes and toDay helpers for the selections
+    05 : QuakeStore.fromItems for the lists of (location,data) tuples
+    06 : buildQuakes takes the line numbers of rows cut out of the file
+    07 : QuakeStore.byLocation keeps the rows of toDict as a store
+    08 : the depth is kept as float64 like the other numbers, so that
+         the aggregates and exports give the values of the file
+    09 : depthText gives the depth of a record with every digit
+    10 : ArrayBuffer for the columns that grow as rows are appended
+"""
+### Step 1 : Import the required modules
+from datetime import datetime as dt # importing datetime module
+import csv # importing csv module
+import numpy as np
+from dates import parseDateTimes
+
+### Step 2 : define the column classes
+class StringColumn:
+    '''
+    Description : column of mostly distinct strings kept as one UTF-8
+                  buffer and the offsets of every string in it.
+    '''
+    def __init__(self,data,offsets):
+        '''
+        Input:
+            data : uint8 array with the encoded strings one after another
+            offsets : int64 array of length n+1, string i is
+                      data[offsets[i]:offsets[i+1]]
+        '''
+        self.data=data
+        self.offsets=offsets
+
+    @classmethod
+    def fromList(cls,values):
+        '''
+        Input:
+            values : list of strings
+        '''
+        encoded=[v.encode('utf-8') for v in values]
+        offsets=np.zeros(len(encoded)+1,dtype=np.int64)
+        np.cumsum([len(v) for v in encoded],out=offsets[1:])
+        data=np.frombuffer(b''.join(encoded),dtype=np.uint8).copy()
+        return cls(data,offsets)
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self,i):
+        return self.data[self.offsets[i]:self.offsets[i+1]].tobytes()\
+                   .decode('utf-8')
+
+    def take(self,ids):
+        '''
+        Returns a new StringColumn with the strings at the positions
+        '''
+        return StringColumn.fromList([self[i] for i in ids])
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes+self.offsets.nbytes
+
+class Categorical:
+    '''
+    Description : column with few distinct strings kept as small integer
+                  codes into the list of categories, sorted unless the
+                  categories were added as they came (ingest).
+    '''
+    def __init__(self,codes,categories):
+        '''
+        Input:
+            codes : integer array, the position of each value in
+                    categories
+            categories : list of the distinct strings
+        '''
+        self.codes=codes
+        self.categories=list(categories)
+
+    @classmethod
+    def fromList(cls,values):
+        '''
+        Input:
+            values : list of strings
+        '''
+        categories,codes=np.unique(np.array(values,dtype=object),
+                                   return_inverse=True)
+        dtype=np.int8 if len(categories)<128 else np.int32
+        return cls(codes.astype(dtype),[str(c) for c in categories])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self,i):
+        return self.categories[self.codes[i]]
+
+    def code(self,value):
+        '''
+        Returns the code of the value, -1 when it is not a category
+        '''
+        return self.categories.index(value) if value in self.categories \
+               else -1
+
+    def take(self,ids):
+        '''
+        Returns a new Categorical with the values at the positions
+        '''
+        return Categorical(self.codes[ids],self.categories)
+
+    @classmethod
+    def concat(cls,columns):
+        '''
+        Input:
+            columns : list of Categorical, each with its own categories
+
+        Returns:
+            one Categorical over the union of the categories
+        '''
+        categories=sorted(set().union(*(c.categories for c in columns)))
+        position={name:i for i,name in enumerate(categories)}
+        dtype=np.int8 if len(categories)<128 else np.int32
+        codes=[np.array([position[name] for name in c.categories],
+                        dtype=dtype)[c.codes] if len(c.categories)
+               else np.zeros(0,dtype=dtype) for c in columns]
+        return cls(np.concatenate(codes) if codes else
+                   np.zeros(0,dtype=dtype),categories)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes+sum(len(c) for c in self.categories)
+
+class ArrayBuffer:
+    '''
+    Description : numpy array with spare room at its end. The room
+                  doubles whenever it runs out, so appending k rows costs
+                  O(k) amortized instead of copying every row kept.
+    '''
+    def __init__(self,values):
+        '''
+        Input:
+            values : numpy array of the first rows, copied
+        '''
+        self.data=np.array(values)
+        self.size=len(self.data)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def values(self):
+        '''
+        the rows as a view of the buffer, a view taken before an append
+        keeps its length
+        '''
+        return self.data[:self.size]
+
+    def replace(self,start,values):
+        '''
+        Description : writes the values from row start on, the rows after
+                      them are dropped
+
+        Returns:
+            the rows as values does
+        '''
+        end=start+len(values)
+        if end>len(self.data):
+            data=np.empty((max(end,2*len(self.data)),)+self.data.shape[1:],
+                          dtype=self.data.dtype)
+            data[:start]=self.data[:start]
+            self.data=data
+        self.data[start:end]=values
+        self.size=end
+        return self.values
+
+    def extend(self,values):
+        '''
+        Returns the rows as values does, after appending the values
+        '''
+        return self.replace(self.size,values)
+
+### Step 3 : define the QuakeStore and CityStore classes
+def depthText(depth):
+    '''
+    Returns the depth as the text of the file getQuakeData keeps, the
+    shortest text of the float so that it reads back to the same value,
+    without the '.0' of a whole number
+    '''
+    text=repr(float(depth))
+    return text[:-2] if text.endswith('.0') else text
+
+class QuakeStore:
+    '''
+    Description : earthquake data as one typed array per field. Every row
+                  of the file is kept, also rows sharing a location.
+    '''
+    def __init__(self,lat,lng,magnitude,depth,datetime,types,magtypes):
+        '''
+        Input:
+            lat,lng : float64 arrays of the coordinates in degrees
+            magnitude : float64 array of magnitudes
+            depth : float64 array of depths
+            datetime : datetime64[ms] array of the event times
+            types : Categorical of the 'Type' field
+            magtypes : Categorical of the 'Magnitude Type' field
+        '''
+        self.lat=lat
+        self.lng=lng
+        self.magnitude=magnitude
+        self.depth=depth
+        self.datetime=datetime
+        self.types=types
+        self.magtypes=magtypes
+
+    def __len__(self):
+        return len(self.lat)
+
+    def location(self,i):
+        '''
+        Returns the coordinates in degrees (tuple:lat,lng) of row i
+        '''
+        return (float(self.lat[i]),float(self.lng[i]))
+
+    def record(self,i):
+        '''
+        Returns row i as the dictionary getQuakeData gives for it
+        '''
+        return {'Type':self.types[i],'Depth':depthText(self.depth[i]),
+                'Magnitude':float(self.magnitude[i]),
+                'Magnitude Type':self.magtypes[i],
+                'datetime':self.datetime[i].astype(object)}
+
+    def __getitem__(self,i):
+        return self.record(i)
+
+    def items(self):
+        '''
+        Returns a generator of (location,record) pairs in file order,
+        like qDict.items()
+        '''
+        return ((self.location(i),self.record(i)) for i in range(len(self)))
+
+    @classmethod
+    def fromItems(cls,items):
+        '''
+        Input:
+            items : dictionary of quakes data (from getQuakeData) or a
+                    list of (location,data) tuples such as mag_selected
+
+        Returns:
+            QuakeStore with one row per item
+        '''
+        items=list(items.items() if isinstance(items,dict) else items)
+        datas=[data for loc,data in items]
+        return cls(np.array([loc[0] for loc,data in items],dtype=np.float64),
+                   np.array([loc[1] for loc,data in items],dtype=np.float64),
+                   np.array([d['Magnitude'] for d in datas],dtype=np.float64),
+                   np.array([d['Depth'] for d in datas],dtype=np.float64),
+                   np.array([d['datetime'] for d in datas],
+                            dtype='datetime64[ms]'),
+                   Categorical.fromList([d['Type'] for d in datas]),
+                   Categorical.fromList([d['Magnitude Type'] for d in datas]))
+
+    def toDict(self):
+        '''
+        Returns the dictionary getQuakeData builds from the same rows,
+        location as key and the rest of the data as a dictionary
+        '''
+        types=[self.types.categories[c] for c in self.types.codes.tolist()]
+        magtypes=[self.magtypes.categories[c]
+                  for c in self.magtypes.codes.tolist()]
+        depths=[depthText(d) for d in self.depth.tolist()]
+        rows=zip(self.lat.tolist(),self.lng.tolist(),types,depths,
+                 self.magnitude.tolist(),magtypes,
+                 self.datetime.astype(object).tolist())
+        return {(lat,lng):{'Type':ty,'Depth':depth,'Magnitude':mag,
+                           'Magnitude Type':magtype,'datetime':when}
+                for lat,lng,ty,depth,mag,magtype,when in rows}
+
+    def byLocation(self):
+        '''
+        Description : the rows toDict keeps, one per location: the data of
+                      the last row of every location in the place of its
+                      first row, like the keys of getQuakeData.
+
+        Returns:
+            QuakeStore of the kept rows
+        '''
+        n=len(self)
+        if n==0:
+            return self
+        # -0.0 and 0.0 are the same key of a dictionary
+        lat,lng=self.lat+0.0,self.lng+0.0
+        # the rows of a location end up next to each other in file order
+        order=np.lexsort((lng,lat))
+        start=np.ones(n,dtype=bool)
+        start[1:]=(lat[order][1:]!=lat[order][:-1])| \
+                  (lng[order][1:]!=lng[order][:-1])
+        starts=np.flatnonzero(start)
+        first=order[starts]
+        last=order[np.append(starts[1:]-1,n-1)]
+        return self.take(last[np.argsort(first)])
+
+    def columns(self):
+        '''
+        Returns a dictionary of name to array holding the whole store
+        '''
+        return {'lat':self.lat,'lng':self.lng,'magnitude':self.magnitude,
+                'depth':self.depth,'datetime':self.datetime,
+                'type_codes':self.types.codes,
+                'type_names':np.array(self.types.categories,dtype=str),
+                'magtype_codes':self.magtypes.codes,
+                'magtype_names':np.array(self.magtypes.categories,
+                                         dtype=str)}
+
+    @classmethod
+    def fromColumns(cls,cols):
+        '''
+        Input:
+            cols : mapping of name to array as given by columns()
+        '''
+        return cls(cols['lat'],cols['lng'],cols['magnitude'],cols['depth'],
+                   cols['datetime'],
+                   Categorical(cols['type_codes'],
+                               cols['type_names'].tolist()),
+                   Categorical(cols['magtype_codes'],
+                               cols['magtype_names'].tolist()))
+
+    def take(self,ids):
+        '''
+        Input:
+            ids : array of row positions or a boolean mask
+
+        Returns:
+            a new QuakeStore with the selected rows
+        '''
+        if getattr(ids,'dtype',None)==bool:
+            ids=np.flatnonzero(ids)
+        return QuakeStore(self.lat[ids],self.lng[ids],self.magnitude[ids],
+                          self.depth[ids],self.datetime[ids],
+                          self.types.take(ids),self.magtypes.take(ids))
+
+    @classmethod
+    def concat(cls,stores):
+        '''
+        Input:
+            stores : list of QuakeStore
+
+        Returns:
+            one QuakeStore with the rows of every store in turn
+        '''
+        return cls(np.concatenate([q.lat for q in stores]),
+                   np.concatenate([q.lng for q in stores]),
+                   np.concatenate([q.magnitude for q in stores]),
+                   np.concatenate([q.depth for q in stores]),
+                   np.concatenate([q.datetime for q in stores]),
+                   Categorical.concat([q.types for q in stores]),
+                   Categorical.concat([q.magtypes for q in stores]))
+
+    def mask(self,type=None,lat=None,lng=None,date=None,mag=None):
+        '''
+        Description : the rows meeting every given condition, a condition
+                      left as None selects every row.
+
+        Input:
+            type : tremor type, its first three characters or a list of
+                   types
+            lat,lng,mag : (min,max) ranges, both ends included
+            date : (min,max) dates, both days included, as date or
+                   datetime objects or 'mm/dd/yyyy' text
+
+        Returns:
+            boolean array with one value per row
+        '''
+        keep=np.ones(len(self),dtype=bool)
+        if type is not None:
+            codes=[self.types.code(t) for t in
+                   matchTypes(type,self.types.categories)]
+            keep&=np.isin(self.types.codes,codes)
+        for values,bounds in ((self.lat,lat),(self.lng,lng),
+                              (self.magnitude,mag)):
+            if bounds is not None:
+                lo,hi=min(bounds),max(bounds)
+                keep&=(values>=lo)&(values<=hi)
+        if date is not None:
+            lo,hi=sorted(toDay(d) for d in date)
+            days=self.datetime.astype('datetime64[D]')
+            keep&=(days>=lo)&(days<=hi)
+        return keep
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in (self.lat,self.lng,self.magnitude,
+                   self.depth,self.datetime,self.types,self.magtypes))
+
+class CityStore:
+    '''
+    Description : city data as one typed array per field. Every row of
+                  the file is kept, also rows sharing a location.
+    '''
+    def __init__(self,lat,lng,pop,city,country,iso3):
+        '''
+        Input:
+            lat,lng : float64 arrays of the coordinates in degrees
+            pop : int64 array of the population, 0 when not known
+            city : StringColumn of the city names
+            country,iso3 : Categorical of the country name and code
+        '''
+        self.lat=lat
+        self.lng=lng
+        self.pop=pop
+        self.city=city
+        self.country=country
+        self.iso3=iso3
+
+    def __len__(self):
+        return len(self.lat)
+
+    def location(self,i):
+        '''
+        Returns the coordinates in degrees (tuple:lat,lng) of row i
+        '''
+        return (float(self.lat[i]),float(self.lng[i]))
+
+    def record(self,i):
+        '''
+        Returns row i as the dictionary getCityData gives for it
+        '''
+        return {'city':self.city[i],'country':self.country[i],
+                'iso3':self.iso3[i],'pop':int(self.pop[i])}
+
+    def __getitem__(self,i):
+        return self.record(i)
+
+    def items(self):
+        '''
+        Returns a generator of (location,record) pairs in file order,
+        like cityDict.items()
+        '''
+        return ((self.location(i),self.record(i)) for i in range(len(self)))
+
+    def toDict(self):
+        '''
+        Returns the dictionary getCityData builds from the same rows,
+        location as key and the rest of the data as a dictionary
+        '''
+        names=self.city.data.tobytes().decode('utf-8') \
+              if self.city.data.size else ''
+        offsets=self.city.offsets.tolist()
+        if names.isascii():
+            cities=[names[a:b] for a,b in zip(offsets,offsets[1:])]
+        else:
+            cities=[self.city[i] for i in range(len(self))]
+        countries=[self.country.categories[c]
+                   for c in self.country.codes.tolist()]
+        iso3s=[self.iso3.categories[c] for c in self.iso3.codes.tolist()]
+        rows=zip(self.lat.tolist(),self.lng.tolist(),cities,countries,
+                 iso3s,self.pop.tolist())
+        return {(lat,lng):{'city':city,'country':country,'iso3':iso3,
+                           'pop':pop}
+                for lat,lng,city,country,iso3,pop in rows}
+
+    def columns(self):
+        '''
+        Returns a dictionary of name to array holding the whole store
+        '''
+        return {'lat':self.lat,'lng':self.lng,'pop':self.pop,
+                'city_data':self.city.data,'city_offsets':self.city.offsets,
+                'country_codes':self.country.codes,
+                'country_names':np.array(self.country.categories,dtype=str),
+                'iso3_codes':self.iso3.codes,
+                'iso3_names':np.array(self.iso3.categories,dtype=str)}
+
+    @classmethod
+    def fromColumns(cls,cols):
+        '''
+        Input:
+            cols : mapping of name to array as given by columns()
+        '''
+        return cls(cols['lat'],cols['lng'],cols['pop'],
+                   StringColumn(cols['city_data'],cols['city_offsets']),
+                   Categorical(cols['country_codes'],
+                               cols['country_names'].tolist()),
+                   Categorical(cols['iso3_codes'],
+                               cols['iso3_names'].tolist()))
+
+    def take(self,ids):
+        '''
+        Input:
+            ids : array of row positions or a boolean mask
+
+        Returns:
+            a new CityStore with the selected rows
+        '''
+        if getattr(ids,'dtype',None)==bool:
+            ids=np.flatnonzero(ids)
+        return CityStore(self.lat[ids],self.lng[ids],self.pop[ids],
+                         self.city.take(ids),self.country.take(ids),
+                         self.iso3.take(ids))
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c in (self.lat,self.lng,self.pop,
+                   self.city,self.country,self.iso3))
+
+### Step 4 : define the selection helpers
+def matchTypes(ty,names):
+    '''
+    Input:
+        ty : tremor type, its first three characters or a list of types
+        names : the known tremor types
+
+    Returns:
+        list of the tremor types selected
+    '''
+    if not isinstance(ty,str):
+        return [name for t in ty for name in matchTypes(t,names)]
+    if ty in names:
+        return [ty]
+    # the first three characters stand for the whole type
+    return [name for name in names if ty and ty in name[:3]]
+
+def toDay(value):
+    '''
+    Input:
+        value : date or datetime object, numpy datetime64 or text in
+                'mm/dd/yyyy' or 'yyyy-mm-dd' form
+
+    Returns:
+        the day as numpy datetime64[D]
+    '''
+    if isinstance(value,str):
+        fmt='%m/%d/%Y' if '/' in value else '%Y-%m-%d'
+        value=dt.strptime(value,fmt)
+    if isinstance(value,dt):
+        value=value.date()
+    return np.datetime64(value,'D')
+
+### Step 5 : define the loadQuakes and loadCities functions
+def buildQuakes(header,rows,first=0,numbers=None):
+    '''
+    Description: converting rows of the earthquake csv file into a
+                 QuakeStore.
+
+    Input:
+        header : the names of the columns
+        rows : list of rows, each a list of text fields
+        first : position of rows[0] in the file, for the messages
+        numbers : optional line of every row in the file, for the
+                  messages about rows that are not one after another
+
+    Returns : QuakeStore with every row whose date could be parsed
+    '''
+    date,time=header.index('Date'),header.index('Time')
+    times,report=parseDateTimes([row[date] for row in rows],
+                                [row[time] for row in rows])
+    # rows in neither format are reported and left out
+    if report['rejected']:
+        for i,d,t in report['rejected']:
+            line=numbers[i] if numbers is not None else first+i+2
+            print(f"Skipped row {line}, unknown date/time <{d},{t}>")
+        skip={i for i,d,t in report['rejected']}
+        rows=[row for i,row in enumerate(rows) if i not in skip]
+        times=times[~np.isnat(times)]
+    # one list per column of the file
+    col={name:[row[i] for row in rows] for i,name in enumerate(header)}
+    return QuakeStore(np.array(col['Latitude'],dtype=np.float64),
+                      np.array(col['Longitude'],dtype=np.float64),
+                      np.array(col['Magnitude'],dtype=np.float64),
+                      np.array(col['Depth'],dtype=np.float64),
+                      times,
+                      Categorical.fromList(col['Type']),
+                      Categorical.fromList(col['Magnitude Type']))
+
+def loadQuakes(path="earthquakesF23.csv"):
+    '''
+    Description: reading the earthquake data from a csv file into a
+                 QuakeStore.
+    Returns : QuakeStore with every row of the file
+    '''
+    with open(path) as f:
+        read=csv.reader(f)
+        header=next(read)
+        rows=list(read)
+    return buildQuakes(header,rows)
+
+def loadCities(path="worldcitiesF23.csv"):
+    '''
+    Description: reading the world cities data from a csv file into a
+                 CityStore.
+    Returns : CityStore with every row of the file
+    '''
+    with open(path,"r") as f:
+        read=csv.reader(f)
+        header=next(read)
+        rows=list(read)
+    col={name:[row[i] for row in rows] for i,name in enumerate(header)}
+    pop=[0 if p=="" else int(p) for p in col['pop']]
+    return CityStore(np.array(col['lat'],dtype=np.float64),
+                     np.array(col['lng'],dtype=np.float64),
+                     np.array(pop,dtype=np.int64),
+                     StringColumn.fromList(col['city']),
+                     Categorical.fromList(col['country']),
+                     Categorical.fromList(col['iso3']))
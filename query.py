@@ -0,0 +1,441 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : query.py
+Purpose : Selections built one condition at a time and run only when the
+          results are needed, the most selective condition first, in one
+          pass over the records or on the text of the csv file before
+          the rows are parsed
+Revisions:
+    00 : import the required modules
+    01 : define the condition functions and the Query class
+    02 : where keeps the index of a store source for the next conditions
+"""
+### Step 1 : Import the required modules
+import csv # importing csv module
+import io
+import os
+from itertools import compress
+import numpy as np
+from quake_store import QuakeStore,buildQuakes,matchTypes,toDay
+from range_index import QuakeIndex
+from streaming import readChunks,CHUNK_ROWS
+
+# number of records the selectivity of a condition is estimated on when
+# there is no index
+SAMPLE_ROWS=2000
+# places of a csv file the sample is read from, the catalogs are sorted
+# by date so that the first rows alone tell little about the others
+SAMPLE_PARTS=20
+# conditions in the order of promptSelection
+CONDITIONS=('type','lat','lng','date','mag')
+# field of the csv file tested by the conditions pushed into the reader
+FIELDS={'type':'Type','lat':'Latitude','lng':'Longitude','mag':'Magnitude'}
+# column of a QuakeStore of the range conditions
+COLUMNS={'lat':'lat','lng':'lng','mag':'magnitude','date':'datetime'}
+
+### Step 2 : define the condition functions
+def normalize(name,value):
+    '''
+    Returns the condition in the form kept by Query, a tuple of type
+    names or (min,max) with the dates as datetime64[D]
+    '''
+    if name=='type':
+        return (value,)
+    if name=='date':
+        return tuple(sorted(toDay(d) for d in value))
+    return (float(min(value)),float(max(value)))
+
+def combine(name,old,new):
+    '''
+    Returns the condition met by the records meeting both conditions
+    '''
+    if old is None:
+        return new
+    if name=='type':
+        return old+new
+    return (max(old[0],new[0]),min(old[1],new[1]))
+
+def resolveTypes(specs,names):
+    '''
+    Returns the sorted list of the names matching every type of specs
+    '''
+    found=set(names)
+    for spec in specs:
+        found&=set(matchTypes(spec,sorted(names)))
+    return sorted(found)
+
+def describe(name,cond):
+    '''
+    Returns the condition as text for explain
+    '''
+    if name=='type':
+        return "type "+" and ".join(repr(spec) for spec in cond)
+    if name=='date':
+        return f"date {cond[0]} to {cond[1]}"
+    return f"{name} {cond[0]:g} to {cond[1]:g}"
+
+def storeTest(store,name,cond):
+    '''
+    Returns test(rows), True for the rows of the store meeting the
+    condition, rows being an array of positions or slice(None)
+    '''
+    if name=='type':
+        codes=[store.types.code(t) for t in
+               resolveTypes(cond,store.types.categories)]
+        return lambda rows:np.isin(store.types.codes[rows],codes)
+    values=getattr(store,COLUMNS[name])
+    lo,hi=cond
+    if name=='date':
+        # the first and the last millisecond of the days
+        lo=lo.astype('datetime64[ms]')
+        hi=(hi+1).astype('datetime64[ms]')-np.timedelta64(1,'ms')
+    return lambda rows:(values[rows]>=lo)&(values[rows]<=hi)
+
+def itemTest(items,name,cond):
+    '''
+    Returns test(item), True for a (location,data) tuple meeting the
+    condition, the checks of select
+    '''
+    if name=='type':
+        types=set(resolveTypes(cond,set(data['Type'] for loc,data in items)))
+        return lambda item:item[1]['Type'] in types
+    lo,hi=cond
+    if name=='date':
+        lo,hi=lo.astype(object),hi.astype(object)
+        return lambda item:lo<=item[1]['datetime'].date()<=hi
+    if name=='mag':
+        return lambda item:lo<=item[1]['Magnitude']<=hi
+    i=0 if name=='lat' else 1
+    return lambda item:lo<=item[0][i]<=hi
+
+def textTest(header,name,cond):
+    '''
+    Returns test(rows), True for the rows of the csv file meeting the
+    condition, only the field of the condition is converted
+    '''
+    k=header.index(FIELDS[name])
+    if name=='type':
+        def test(rows):
+            texts=[row[k] for row in rows]
+            types=set(resolveTypes(cond,set(texts)))
+            return np.fromiter((t in types for t in texts),dtype=bool,
+                               count=len(texts))
+        return test
+    lo,hi=cond
+    def test(rows):
+        values=np.array([row[k] for row in rows],dtype=np.float64)
+        return (values>=lo)&(values<=hi)
+    return test
+
+def sampleFile(path,rows=SAMPLE_ROWS,parts=SAMPLE_PARTS):
+    '''
+    Description : reads about rows rows of the csv file from parts places
+                  spread evenly over it.
+
+    Returns:
+        (header,rows) the names of the columns and the rows read
+    '''
+    size=os.path.getsize(path)
+    sample=[]
+    with open(path,'rb') as f:
+        header=next(csv.reader([f.readline().decode()]))
+        start=f.tell()
+        for k in range(parts):
+            f.seek(start+(size-start)*k//parts)
+            if k:
+                # the rest of the line cut by the seek
+                f.readline()
+            lines=[f.readline() for i in range(rows//parts)]
+            text=b''.join(lines).decode()
+            sample.extend(row for row in csv.reader(io.StringIO(text))
+                          if row)
+    return header,sample
+
+### Step 3 : define the Query class
+class Query:
+    '''
+    Description : a selection of quakes built one condition at a time.
+                  Nothing is selected until the results are asked for,
+                  then the conditions are ordered by the share of the
+                  records they keep, from the index when there is one and
+                  from a sample otherwise, and each one only looks at the
+                  records the ones before it kept.
+    '''
+    def __init__(self,source,index=None,chunk_rows=CHUNK_ROWS):
+        '''
+        Input:
+            source : QuakeStore, QuakeIndex, dictionary of quakes data,
+                     list of (location,data) tuples such as mag_selected,
+                     or the path of an earthquake csv file
+            index : optional QuakeIndex of a QuakeStore source
+            chunk_rows : rows of a csv file read at a time
+        '''
+        if isinstance(source,QuakeIndex):
+            index,source=source,source.store
+        if isinstance(source,str):
+            self.kind='file'
+        elif isinstance(source,QuakeStore):
+            self.kind='store'
+        else:
+            self.kind='items'
+        self.source=source
+        self.index=index if self.kind=='store' else None
+        self.chunk_rows=chunk_rows
+        self.conditions={}
+        self.steps=None
+        self.statistics=None
+        self.result=None
+
+    def where(self,type=None,lat=None,lng=None,date=None,mag=None):
+        '''
+        Description : adds conditions to the selection, a condition given
+                      twice keeps the records meeting both. Nothing is
+                      selected yet.
+
+        Input:
+            type : tremor type, its first three characters or a list of
+                   types
+            lat,lng,mag : (min,max) ranges, both ends included
+            date : (min,max) dates, both days included, as date or
+                   datetime objects or 'mm/dd/yyyy' text
+
+        Returns:
+            a new Query, this one is left as it is. Without an index the
+            new one starts from the results of this one when they were
+            already selected, with an index it fetches its rows from the
+            index again.
+        '''
+        if self.result is not None and self.index is None:
+            query=Query(self.result,chunk_rows=self.chunk_rows)
+        else:
+            query=Query(self.source,self.index,self.chunk_rows)
+            query.conditions=dict(self.conditions)
+        for name,value in zip(CONDITIONS,(type,lat,lng,date,mag)):
+            if value is not None:
+                query.conditions[name]=combine(name,
+                                               query.conditions.get(name),
+                                               normalize(name,value))
+        return query
+
+    def records(self):
+        '''
+        Returns the list of (location,data) tuples of an items source
+        '''
+        if isinstance(self.source,dict):
+            self.source=list(self.source.items())
+        return self.source
+
+    def plan(self):
+        '''
+        Description : orders the conditions by the share of the records
+                      they keep, the most selective first.
+
+        Returns:
+            list of one dictionary per condition: name, text, share (of
+            the records kept), how (it is run) and test
+        '''
+        if self.steps is not None:
+            return self.steps
+        steps=[]
+        if self.kind=='store':
+            store=self.source
+            n=len(store)
+            found={}
+            if self.index is not None:
+                # exact counts from the sorted indexes
+                self.statistics='the counts of the QuakeIndex'
+                args={name:resolveTypes(cond,store.types.categories)
+                      if name=='type' else cond
+                      for name,cond in self.conditions.items()}
+                found={name:(count,fetch) for count,name,fetch,test in
+                       self.index.conditions(**args)}
+            else:
+                self.statistics=f"a sample of {min(n,SAMPLE_ROWS)} rows"
+                sample=np.linspace(0,n-1,min(n,SAMPLE_ROWS)).astype(np.intp)
+            for name,cond in self.conditions.items():
+                test=storeTest(store,name,cond)
+                if name in found:
+                    share=found[name][0]/n if n else 0.0
+                else:
+                    share=float(test(sample).mean()) if n else 0.0
+                steps.append({'name':name,'text':describe(name,cond),
+                              'share':share,'test':test,
+                              'fetch':found.get(name,(0,None))[1]})
+            steps.sort(key=lambda s:s['share'])
+            for i,s in enumerate(steps):
+                s['how']='tested on the rows left' if i else \
+                         'rows from the index' if s['fetch'] else \
+                         'scan of the column'
+        elif self.kind=='items':
+            items=self.records()
+            sample=items[::max(1,len(items)//SAMPLE_ROWS)]
+            self.statistics=f"a sample of {len(sample)} records"
+            for name,cond in self.conditions.items():
+                test=itemTest(items,name,cond)
+                share=sum(map(test,sample))/len(sample) if sample else 0.0
+                steps.append({'name':name,'text':describe(name,cond),
+                              'share':share,'test':test,
+                              'how':'fused into one pass'})
+            steps.sort(key=lambda s:s['share'])
+        else:
+            # rows from all over the file, the dates are tested on the
+            # rows left once they are parsed
+            header,rows=sampleFile(self.source)
+            self.statistics=f"a sample of {len(rows)} rows of the file"
+            sample=buildQuakes(header,rows) if 'date' in self.conditions \
+                   and rows else None
+            for name,cond in self.conditions.items():
+                if name=='date':
+                    continue
+                test=textTest(header,name,cond)
+                steps.append({'name':name,'text':describe(name,cond),
+                              'share':float(test(rows).mean()) if rows
+                                      else 0.0,
+                              'test':test,
+                              'how':'tested on the text before parsing'})
+            steps.sort(key=lambda s:s['share'])
+            if 'date' in self.conditions:
+                cond=self.conditions['date']
+                share=float(storeTest(sample,'date',cond)(slice(None))
+                            .mean()) if sample is not None and len(sample) \
+                      else 0.0
+                steps.append({'name':'date','text':describe('date',cond),
+                              'share':share,'test':None,
+                              'how':'tested after parsing the rows left'})
+        self.steps=steps
+        return steps
+
+    def collect(self):
+        '''
+        Description : runs the selection, once, with the plan.
+
+        Returns:
+            QuakeStore of the selected rows, or the list of the selected
+            (location,data) tuples in their order for an items source
+        '''
+        if self.result is not None:
+            return self.result
+        steps=self.plan()
+        if self.kind=='store':
+            store=self.source
+            if not steps:
+                self.result=store
+                return store
+            first=steps[0]
+            rows=first['fetch']() if first['fetch'] else \
+                 np.flatnonzero(first['test'](slice(None)))
+            for s in steps[1:]:
+                rows=rows[s['test'](rows)]
+            self.result=store.take(np.sort(rows))
+        elif self.kind=='items':
+            # the filters are chained, every record goes through them
+            # once and stops at the first condition it fails
+            selected=iter(self.records())
+            for s in steps:
+                selected=filter(s['test'],selected)
+            self.result=list(selected)
+        else:
+            self.result=self.scanFile(steps)
+        return self.result
+
+    def scanFile(self,steps):
+        '''
+        Description : reads the csv file a chunk at a time, leaves out
+                      the rows failing the conditions on their text
+                      fields and parses only the rows left.
+
+        Returns:
+            QuakeStore of the selected rows
+        '''
+        date=self.conditions.get('date')
+        pushed=[s for s in steps if s['name']!='date']
+        chunks=[]
+        for header,first,rows in readChunks(self.source,self.chunk_rows):
+            # line of every row in the file, for the messages of the
+            # rows with unknown dates
+            numbers=np.arange(first,first+len(rows))+2
+            for s in pushed:
+                keep=s['test'](rows)
+                rows=list(compress(rows,keep))
+                numbers=numbers[keep]
+                if not rows:
+                    break
+            # an empty first chunk keeps the columns of an empty selection
+            if not rows and chunks:
+                continue
+            chunk=buildQuakes(header,rows,first,numbers)
+            if date is not None:
+                chunk=chunk.take(storeTest(chunk,'date',date)(slice(None)))
+            chunks.append(chunk)
+        if not chunks:
+            raise ValueError(f"no quakes in <{self.source}>")
+        return QuakeStore.concat(chunks)
+
+    def __len__(self):
+        return len(self.collect())
+
+    def items(self):
+        '''
+        Returns the list of (location,data) tuples of the selection, like
+        mag_selected
+        '''
+        result=self.collect()
+        return result if self.kind=='items' else list(result.items())
+
+    def rangeOf(self,name):
+        '''
+        Input:
+            name : 'lat','lng','date' or 'mag'
+
+        Returns:
+            (min,max) of the selected records, the dates as date objects
+        '''
+        if self.kind=='store' and self.index is not None and \
+           not self.conditions:
+            lo,hi=self.index.rangeOf(name)
+            values=np.array([lo,hi])
+        elif self.kind=='items':
+            if name=='date':
+                values=[data['datetime'].date() for loc,data in
+                        self.collect()]
+            elif name=='mag':
+                values=[data['Magnitude'] for loc,data in self.collect()]
+            else:
+                i=0 if name=='lat' else 1
+                values=[loc[i] for loc,data in self.collect()]
+            return min(values),max(values)
+        else:
+            values=getattr(self.collect(),COLUMNS[name])
+        if len(values)==0:
+            raise ValueError("the selection is empty")
+        lo,hi=values.min(),values.max()
+        if name=='date':
+            return lo.astype('datetime64[D]').astype(object),\
+                   hi.astype('datetime64[D]').astype(object)
+        return float(lo),float(hi)
+
+    def explain(self):
+        '''
+        Returns the plan as text, the conditions in the order they run
+        with the share of the records each one keeps
+        '''
+        steps=self.plan()
+        if self.kind=='file':
+            source=f"the file <{self.source}>"
+            n=None
+        else:
+            n=len(self.source) if self.kind=='store' else len(self.records())
+            source=f"{n} {'rows' if self.kind=='store' else 'records'}"
+        lines=[f"Query over {source}"]
+        if not steps:
+            lines.append("  no condition, every record is selected")
+            return '\n'.join(lines)
+        lines[0]+=f", shares from {self.statistics}"
+        for i,s in enumerate(steps,1):
+            lines.append(f"  {i}. {s['text']:<36}keeps {s['share']:7.2%}  "
+                         f"{s['how']}")
+        estimate=float(np.prod([s['share'] for s in steps]))
+        lines.append(f"Estimated result {estimate:.2%} of the records"+
+                     (f", about {round(estimate*n)}" if n is not None
+                      else ""))
+        return '\n'.join(lines)
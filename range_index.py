@@ -0,0 +1,400 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : range_index.py
+Purpose : Sorted indexes over the latitude, longitude, date and
+          magnitude of a QuakeStore, built once at load, so that range
+          queries use bisection and the range hints are read directly
+Revisions:
+    00 : import the required modules
+    01 : define the SortedIndex and QuakeIndex classes
+    02 : extend and append merge the rows added to the store
+    03 : state and fromState for keeping the sorted orders with the
+         store
+    04 : the appended rows are sorted in runs merged in turn instead of
+         being inserted into every sorted array
+"""
+### Step 1 : Import the required modules
+import numpy as np
+from quake_store import ArrayBuffer,matchTypes,toDay
+
+### Step 2 : define the SortedIndex class
+def missingOf(values):
+    '''
+    Returns a boolean array, True for the missing values (NaN, NaT)
+    '''
+    if values.dtype.kind=='M':
+        return np.isnat(values)
+    if values.dtype.kind=='f':
+        return np.isnan(values)
+    return np.zeros(len(values),dtype=bool)
+
+class SortedIndex:
+    '''
+    Description : the values of one column in sorted order together with
+                  the row of every value. Missing values (NaN, NaT) are
+                  kept at the end and never match a range. The rows added
+                  later are sorted in runs following the first one, and a
+                  run is merged into the run before it once it is at
+                  least half as long, so that adding k rows costs
+                  O(k log n) amortized and a search looks into O(log n)
+                  runs.
+    '''
+    def __init__(self,values):
+        '''
+        Input:
+            values : numpy array of the column
+        '''
+        self.setOrder(values,np.argsort(values,kind='stable'))
+
+    def setOrder(self,values,order,stops=None):
+        '''
+        Description : keeps the rows of the values in the order of the
+                      runs, every run ending at one of the stops, a
+                      single run if not given
+        '''
+        order=np.asarray(order)
+        self.order=ArrayBuffer(order)
+        self.sorted=ArrayBuffer(values[order])
+        # (start,stop,valid) of every run, valid is the number of values
+        # of the run that are not missing
+        self.runs=[]
+        start=0
+        for stop in ([len(order)] if stops is None else
+                     np.asarray(stops).tolist()):
+            if stop>start:
+                missing=missingOf(self.sorted.values[start:stop])
+                self.runs.append((start,stop,
+                                  stop-start-int(np.count_nonzero(missing))))
+            start=stop
+        if start!=len(order):
+            raise ValueError("the runs do not cover the index")
+
+    @classmethod
+    def fromOrder(cls,values,order,stops=None):
+        '''
+        Returns the SortedIndex of the values from the order and the run
+        stops of a saved index, without sorting them again
+        '''
+        index=cls.__new__(cls)
+        index.setOrder(values,order,stops)
+        return index
+
+    def stops(self):
+        '''
+        Returns the array of the ends of the runs, for fromOrder
+        '''
+        return np.array([stop for start,stop,valid in self.runs],
+                        dtype=np.int64)
+
+    def __len__(self):
+        return len(self.order)
+
+    def parts(self):
+        '''
+        Returns a list of (sorted,order) of the values of every run that
+        are not missing
+        '''
+        values,order=self.sorted.values,self.order.values
+        return [(values[start:start+valid],order[start:start+valid])
+                for start,stop,valid in self.runs if valid]
+
+    def min(self):
+        found=[values[0] for values,rows in self.parts()]
+        return min(found) if found else None
+
+    def max(self):
+        found=[values[-1] for values,rows in self.parts()]
+        return max(found) if found else None
+
+    def count(self,lo,hi):
+        '''
+        Returns the number of rows with a value in the range
+        '''
+        total=0
+        for values,rows in self.parts():
+            start=np.searchsorted(values,lo,side='left')
+            stop=np.searchsorted(values,hi,side='right')
+            total+=max(int(stop)-int(start),0)
+        return total
+
+    def rows(self,lo,hi):
+        '''
+        Returns the unsorted array of the rows with a value in the range
+        '''
+        found=[]
+        for values,rows in self.parts():
+            start=np.searchsorted(values,lo,side='left')
+            stop=np.searchsorted(values,hi,side='right')
+            found.append(rows[start:max(stop,start)])
+        if len(found)==1:
+            return found[0]
+        return np.concatenate(found+[np.zeros(0,dtype=np.intp)])
+
+    def matches(self,values):
+        '''
+        Input:
+            values : array of values to look up
+
+        Returns:
+            (k,rows) arrays, every row holding the value values[k]
+        '''
+        found_k,found_rows=[],[]
+        for ordered,order in self.parts():
+            lo=np.searchsorted(ordered,values,side='left')
+            count=np.searchsorted(ordered,values,side='right')-lo
+            total=int(count.sum())
+            if total==0:
+                continue
+            # position of every match inside the range of its value
+            inside=np.arange(total)-np.repeat(np.cumsum(count)-count,count)
+            found_k.append(np.repeat(np.arange(len(values)),count))
+            found_rows.append(order[np.repeat(lo,count)+inside])
+        return (np.concatenate(found_k+[np.zeros(0,dtype=np.intp)]),
+                np.concatenate(found_rows+[np.zeros(0,dtype=np.intp)]))
+
+    def extend(self,values,first):
+        '''
+        Description : adds new rows as a run of their own and merges the
+                      last runs while a run is at least half as long as
+                      the run before it. Merged values are placed after
+                      the equal values of the run before, so that every
+                      run keeps the order of a stable sort.
+
+        Input:
+            values : numpy array of the column for the new rows
+            first : row of values[0]
+
+        Returns:
+            the first position of the sorted values and the order that
+            changed, the positions after it were written again
+        '''
+        order=np.argsort(values,kind='stable')
+        start=len(self)
+        self.sorted.extend(values[order])
+        self.order.extend(order+first)
+        self.runs.append((start,len(self),len(values)-
+                          int(np.count_nonzero(missingOf(values)))))
+        changed=start
+        while len(self.runs)>1 and \
+              2*(self.runs[-1][1]-self.runs[-1][0])>= \
+              self.runs[-2][1]-self.runs[-2][0]:
+            changed=self.merge()
+        return changed
+
+    def merge(self):
+        '''
+        Description : merges the last run into the run before it
+
+        Returns:
+            the start of the merged run
+        '''
+        (start,middle,valid_a),(middle,stop,valid_b)=self.runs[-2:]
+        values,order=self.sorted.values,self.order.values
+        a,b=slice(start,start+valid_a),slice(middle,middle+valid_b)
+        pos=np.searchsorted(values[a],values[b],side='right')
+        merged=np.concatenate((np.insert(values[a],pos,values[b]),
+                               values[start+valid_a:middle],
+                               values[middle+valid_b:stop]))
+        rows=np.concatenate((np.insert(order[a],pos,order[b]),
+                             order[start+valid_a:middle],
+                             order[middle+valid_b:stop]))
+        self.sorted.replace(start,merged)
+        self.order.replace(start,rows)
+        self.runs[-2:]=[(start,stop,valid_a+valid_b)]
+        return start
+
+    def bitmap(self,lo,hi):
+        '''
+        Returns a boolean array, True for the rows in the range
+        '''
+        bits=np.zeros(len(self),dtype=bool)
+        bits[self.rows(lo,hi)]=True
+        return bits
+
+### Step 3 : define the QuakeIndex class
+class QuakeIndex:
+    '''
+    Description : one SortedIndex per range column of a QuakeStore and
+                  the rows of every tremor type.
+    '''
+    # columns with a sorted index, by the name of the condition
+    COLUMNS={'lat':'lat','lng':'lng','date':'datetime','mag':'magnitude'}
+
+    def __init__(self,store):
+        '''
+        Input:
+            store : QuakeStore to index
+        '''
+        self.store=store
+        self.indexes={name:SortedIndex(getattr(store,column))
+                      for name,column in self.COLUMNS.items()}
+        self.indexTypes()
+
+    def indexTypes(self):
+        '''
+        Description : the rows of every type code
+        '''
+        store=self.store
+        self.types={code:ArrayBuffer(np.flatnonzero(store.types.codes==code))
+                    for code in range(len(store.types.categories))}
+
+    def __len__(self):
+        return len(self.store)
+
+    def state(self):
+        '''
+        Returns the order and the run stops (name_runs) of every sorted
+        index, for fromState
+        '''
+        state={}
+        for name,index in self.indexes.items():
+            state[name]=index.order.values
+            state[name+'_runs']=index.stops()
+        return state
+
+    @classmethod
+    def fromState(cls,store,state):
+        '''
+        Input:
+            store : the indexed QuakeStore
+            state : mapping of name to array as given by state()
+
+        Returns:
+            the QuakeIndex of the store, the sorted values are read in
+            the saved order instead of sorting the columns again
+        '''
+        for name in cls.COLUMNS:
+            if len(state[name])!=len(store):
+                raise ValueError(f"the order of <{name}> does not match "
+                                 f"the store")
+        index=cls.__new__(cls)
+        index.store=store
+        index.indexes={name:SortedIndex.fromOrder(getattr(store,column),
+                                                  state[name],
+                                                  state.get(name+'_runs'))
+                       for name,column in cls.COLUMNS.items()}
+        index.indexTypes()
+        return index
+
+    def append(self,store):
+        '''
+        Description : brings the index up to date with rows appended to
+                      the store, only the new rows are sorted. The type
+                      codes of the indexed rows stay valid when the new
+                      types are added after the known ones.
+
+        Input:
+            store : QuakeStore holding the indexed rows followed by the
+                    new ones
+
+        Returns:
+            dictionary of name to the first position of its order that
+            changed, as SortedIndex.extend
+        '''
+        first=len(self.store)
+        known=self.store.types.categories
+        same=store.types.categories[:len(known)]==known
+        self.store=store
+        changed={name:self.indexes[name].extend(getattr(store,column)[first:],
+                                                first)
+                 for name,column in self.COLUMNS.items()}
+        if same:
+            codes=store.types.codes[first:]
+            for code in range(len(store.types.categories)):
+                rows=np.flatnonzero(codes==code)+first
+                if code in self.types:
+                    self.types[code].extend(rows)
+                else:
+                    self.types[code]=ArrayBuffer(rows)
+        else:
+            # other types renumber the codes
+            self.indexTypes()
+        return changed
+
+    def rangeOf(self,name):
+        '''
+        Input:
+            name : 'lat','lng','date' or 'mag'
+
+        Returns:
+            (min,max) of the column, read from the ends of the index
+        '''
+        index=self.indexes[name]
+        return index.min(),index.max()
+
+    def bounds(self,name,bounds):
+        '''
+        Description : turns a (min,max) condition into the values to
+                      search, the dates become the first and the last
+                      millisecond of the days.
+        '''
+        lo,hi=min(bounds),max(bounds)
+        if name=='date':
+            lo,hi=sorted((toDay(lo),toDay(hi)))
+            lo=lo.astype('datetime64[ms]')
+            hi=(hi+1).astype('datetime64[ms]')-np.timedelta64(1,'ms')
+        return lo,hi
+
+    def conditions(self,type=None,lat=None,lng=None,date=None,mag=None):
+        '''
+        Returns a list of (count,name,fetch,test) for every given
+        condition, fetch() gives the matching rows from the index and
+        test(rows) checks given rows against the condition
+        '''
+        found=[]
+        store=self.store
+        if type is not None:
+            codes=[store.types.code(t) for t in
+                   matchTypes(type,store.types.categories)]
+            def fetch():
+                return np.concatenate([self.types[c].values for c in codes]+
+                                      [np.zeros(0,dtype=np.intp)])
+            def test(rows):
+                return np.isin(store.types.codes[rows],codes)
+            count=sum(len(self.types[c]) for c in codes)
+            found.append((count,'type',fetch,test))
+        for name,cond in (('lat',lat),('lng',lng),('date',date),
+                          ('mag',mag)):
+            if cond is not None:
+                lo,hi=self.bounds(name,cond)
+                index=self.indexes[name]
+                values=getattr(store,self.COLUMNS[name])
+                found.append((index.count(lo,hi),name,
+                              lambda index=index,lo=lo,hi=hi:
+                                  index.rows(lo,hi),
+                              lambda rows,values=values,lo=lo,hi=hi:
+                                  (values[rows]>=lo)&(values[rows]<=hi)))
+        return found
+
+    def select(self,type=None,lat=None,lng=None,date=None,mag=None):
+        '''
+        Description : rows meeting every given condition. Every condition
+                      is counted by bisection first, the rows of the most
+                      selective one are fetched from its index and only
+                      those rows are checked against the other conditions.
+
+        Input:
+            type : tremor type, its first three characters or a list of
+                   types
+            lat,lng,mag : (min,max) ranges, both ends included
+            date : (min,max) dates, both days included
+
+        Returns:
+            sorted array of the selected rows
+        '''
+        found=sorted(self.conditions(type,lat,lng,date,mag),
+                     key=lambda x:x[0])
+        if not found:
+            return np.arange(len(self))
+        rows=found[0][2]()
+        for count,name,fetch,test in found[1:]:
+            rows=rows[test(rows)]
+        return np.sort(rows)
+
+    def mask(self,**conditions):
+        '''
+        Returns the selection of select as a boolean array over the rows
+        '''
+        bits=np.zeros(len(self),dtype=bool)
+        bits[self.select(**conditions)]=True
+        return bits
@@ -0,0 +1,153 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : render.py
+Purpose : Drawing the quake locations so that the plots stay fast and
+          small for any number of quakes, one marker per quake up to a
+          threshold and a density grid of the magnitudes above it, and
+          writing the figures to files without a display
+Revisions:
+    00 : import the required modules
+    01 : define magnitudeGrid,drawQuakes,useHeadless and showPlot
+    02 : define drawClusters to mark the hotspots on the quakes
+    03 : the 'max' grid reduces the magnitudes with np.maximum.at
+"""
+### Step 1 : Import the required modules
+import os
+import matplotlib.pyplot as plt
+import numpy as np
+
+# number of quakes above which the automatic mode draws a density grid
+MAX_POINTS=20000
+# number of markers above which the scatter is drawn as an image inside
+# vector files (svg, pdf) instead of one path per marker
+RASTER_POINTS=2000
+# size in degrees of the cells of the density grid
+GRID_CELL=1.0
+# number of hexagons across the longitudes in the hexbin mode
+HEX_SIZE=180
+# drawing modes of drawQuakes
+MODES=('auto','scatter','grid','hexbin')
+
+### Step 2 : define the density grid
+def magnitudeGrid(lngs,lats,mags,cell=GRID_CELL,reduce='max'):
+    '''
+    Description : 2D histogram of the magnitudes on a longitude/latitude
+                  grid covering the globe, the largest or the mean
+                  magnitude of the quakes in every cell.
+
+    Input:
+        lngs,lats,mags : arrays of the quakes
+        cell : size of a cell in degrees
+        reduce : 'max' or 'mean'
+
+    Returns:
+        masked array of shape (rows,cols), row 0 at latitude -90 and the
+        cells without any quake masked
+    '''
+    lngs=np.asarray(lngs,dtype=np.float64)
+    lats=np.asarray(lats,dtype=np.float64)
+    mags=np.asarray(mags,dtype=np.float64)
+    nrows,ncols=int(np.ceil(180/cell)),int(np.ceil(360/cell))
+    rows=np.clip(((lats+90)//cell).astype(np.int64),0,nrows-1)
+    cols=np.clip(((lngs+180)//cell).astype(np.int64),0,ncols-1)
+    flat=rows*ncols+cols
+    if reduce=='max':
+        # largest magnitude of every cell, -inf left in the empty ones
+        values=np.full(nrows*ncols,-np.inf)
+        np.maximum.at(values,flat,mags)
+        empty=np.isneginf(values)
+    elif reduce=='mean':
+        count=np.bincount(flat,minlength=nrows*ncols)
+        values=np.bincount(flat,weights=mags,minlength=nrows*ncols)/ \
+               np.maximum(count,1)
+        empty=count==0
+    else:
+        raise ValueError(f"unknown reduction <{reduce}>")
+    return np.ma.masked_array(values,mask=empty).reshape(nrows,ncols)
+
+### Step 3 : define the drawing and output functions
+def drawQuakes(ax,lngs,lats,mags,mode='auto',reduce='max',
+               max_points=MAX_POINTS,cell=GRID_CELL):
+    '''
+    Description : draws the quakes on the axes, a scatter colored by
+                  magnitude or, above max_points in the 'auto' mode, the
+                  density grid of magnitudeGrid.
+
+    Input:
+        ax : matplotlib axes
+        lngs,lats,mags : sequences of the quakes
+        mode : 'auto', 'scatter', 'grid' or 'hexbin'
+        reduce : 'max' or 'mean' magnitude of the grid and hexbin cells
+        max_points : number of quakes above which 'auto' draws the grid
+        cell : size in degrees of the grid cells
+
+    Returns:
+        the artist drawn, for the color bar
+    '''
+    if mode not in MODES:
+        raise ValueError(f"unknown drawing mode <{mode}>")
+    n=len(mags)
+    if mode=='auto':
+        mode='grid' if n>max_points else 'scatter'
+    if mode=='scatter':
+        return ax.scatter(lngs,lats,c=mags,rasterized=n>RASTER_POINTS)
+    if mode=='hexbin':
+        return ax.hexbin(lngs,lats,C=mags,gridsize=(HEX_SIZE,HEX_SIZE//2),
+                         extent=(-180,180,-90,90),mincnt=1,
+                         reduce_C_function=np.max if reduce=='max'
+                                           else np.mean,
+                         rasterized=True)
+    grid=magnitudeGrid(lngs,lats,mags,cell,reduce)
+    return ax.imshow(grid,origin='lower',extent=(-180,180,-90,90),
+                     interpolation='nearest',aspect='auto')
+
+def drawClusters(ax,clusters,top=10):
+    '''
+    Description : marks the centroids of the largest clusters over the
+                  quakes, a circle growing with the number of quakes and
+                  the number of the cluster next to it.
+
+    Input:
+        ax : matplotlib axes
+        clusters : AggTable of clusterSummary, largest cluster first
+        top : number of clusters marked, every cluster if None
+    '''
+    rows=clusters.rows()[:top]
+    if not rows:
+        return
+    counts=np.array([row['count'] for row in rows],dtype=np.float64)
+    ax.scatter([row['lng'] for row in rows],[row['lat'] for row in rows],
+               s=40+400*counts/counts.max(),facecolors='none',
+               edgecolors='red',linewidths=1.5)
+    for row in rows:
+        ax.annotate(str(row['cluster']),(row['lng'],row['lat']),
+                    xytext=(4,4),textcoords='offset points',color='red')
+
+def useHeadless():
+    '''
+    Description : switches matplotlib to the Agg backend, the figures
+                  are then written to files by showPlot
+    '''
+    plt.switch_backend('Agg')
+
+def showPlot(out=None,name='figure',fmt='png'):
+    '''
+    Description : shows the current figure, or writes it to the out
+                  folder and closes it.
+
+    Input:
+        out : folder of the image files, the figure is shown if None
+        name : file name without the extension
+        fmt : image format, e.g. 'png', 'svg' or 'pdf'
+
+    Returns:
+        the path of the file written, None when shown
+    '''
+    if out is None:
+        plt.show()
+        return None
+    os.makedirs(out,exist_ok=True)
+    path=os.path.join(out,f"{name}.{fmt}")
+    plt.savefig(path)
+    plt.close()
+    return path
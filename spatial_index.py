@@ -0,0 +1,355 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : spatial_index.py
+Purpose : Grid based spatial index over the city data so that radius
+          queries only compute the distance to the cities in the cells
+          around the target location instead of scanning every city
+Revisions:
+    00 : import the required modules
+    01 : define the CityGrid class with a findCities compatible query
+    02 : compute the candidate distances with havDistMany
+    03 : k nearest cities by a best-first search over the cells
+    04 : ChordGrid of unit vectors shared by the neighbor search of
+         dbscan and the nearest city search of the country join
+    05 : ChordGrid cells around the whole sphere for the hotspots
+"""
+### Step 1 : Import the required modules
+from math import radians,degrees,sin,cos,asin,floor,ceil,pi
+import heapq
+import numpy as np
+from haversine import Points,havDistMany
+
+# Radius of earth in kilometers, the same value used by havDist
+EARTH_RADIUS=6371
+# widening of the candidate window in degrees so that rounding in the
+# trigonometry never drops a city lying exactly on the boundary
+MARGIN=1e-6
+# share of the grid above which visiting the cells one by one costs
+# more than measuring the distance to every city
+FULL_SCAN=0.25
+# number of cells ordered first by the nearest city search, the rest of
+# the cells are only sorted if the nearest cities are not among them
+FIRST_CELLS=8
+
+### Step 2 : define the CityGrid class
+class CityGrid:
+    '''
+    Description : bins the cities into cells of fixed size in latitude
+                  and longitude. The grid is built once from the
+                  dictionary returned by getCityData and can then answer
+                  any number of radius queries.
+    '''
+    def __init__(self,cityDict,cell=1.0):
+        '''
+        Input:
+            cityDict : Dictionary of cities data (from getCityData)
+            cell : size of a grid cell in degrees, the default is 1.0
+        '''
+        self.cityDict=cityDict
+        self.cell=cell
+        self.nrows=ceil(180/cell)
+        self.ncols=ceil(360/cell)
+        # locations and data in the order of the dictionary
+        self.locations=list(cityDict.keys())
+        self.cities=list(cityDict.values())
+        # coordinates in radians for havDistMany
+        self.points=Points.fromDegrees(self.locations)
+        # rows maps a row number to a dictionary of column number to
+        # the list of positions of the cities in the cell
+        self.rows={}
+        for order,co in enumerate(self.locations):
+            row,col=self.cellOf(co)
+            cols=self.rows.setdefault(row,{})
+            cols.setdefault(col,[]).append(order)
+        # the occupied cells as arrays for the nearest city search, the
+        # positions of their cities and their edges in radians
+        cells=[(row,col,members) for row,cols in self.rows.items()
+               for col,members in cols.items()]
+        self.cellIds=[np.array(members,dtype=np.intp)
+                      for row,col,members in cells]
+        self.cellRow=np.array([row for row,col,members in cells],
+                              dtype=np.intp)
+        self.cellCol=np.array([col for row,col,members in cells],
+                              dtype=np.intp)
+        # edges of every row and every column of the grid in radians
+        edges=np.arange(self.nrows+1)*cell-90
+        self.latLo=np.radians(edges[:-1])
+        self.latHi=np.radians(np.minimum(edges[1:],90))
+        self.lngLo=np.radians(np.arange(self.ncols)*cell-180)
+        self.cellWidth=radians(cell)
+
+    def __len__(self):
+        return len(self.cityDict)
+
+    def cellOf(self,loc):
+        '''
+        Input:
+            loc : coordinates in degrees (tuple:lat,lng)
+
+        Returns:
+            (row,col) : the grid cell holding the location
+        '''
+        row=min(int(floor((loc[0]+90)/self.cell)),self.nrows-1)
+        col=int(floor((loc[1]+180)/self.cell))%self.ncols
+        return row,col
+
+    def candidates(self,loc,r):
+        '''
+        Description : collects the cities of every cell that may hold a
+                      city within r kilometers of the location. The
+                      window is the bounding box of the spherical cap
+                      so it never misses a city.
+
+        Input:
+            loc : coordinates in degrees (tuple:lat,lng)
+            r : radius value in kilometers
+
+        Returns:
+            an array of the positions of the candidate cities
+        '''
+        # angular radius of the spherical cap
+        delta=r/EARTH_RADIUS
+        # a cap this large covers the whole globe
+        if delta>=pi:
+            return np.arange(len(self.locations))
+        lat=loc[0]
+        lat_lo=lat-degrees(delta)-MARGIN
+        lat_hi=lat+degrees(delta)+MARGIN
+        row_lo=max(int(floor((lat_lo+90)/self.cell)),0)
+        row_hi=min(int(floor((lat_hi+90)/self.cell)),self.nrows-1)
+        # if the cap reaches a pole every longitude is within reach
+        all_cols=lat_lo<=-90 or lat_hi>=90
+        if not all_cols:
+            # widest longitude difference on the cap
+            s=sin(delta)/cos(radians(lat))
+            if s>=1:
+                all_cols=True
+            else:
+                dlng=degrees(asin(s))+MARGIN
+                col_lo=int(floor((loc[1]-dlng+180)/self.cell))
+                col_hi=int(floor((loc[1]+dlng+180)/self.cell))
+                if col_hi-col_lo+1>=self.ncols:
+                    all_cols=True
+        # share of the grid covered by the window
+        span=self.ncols if all_cols else col_hi-col_lo+1
+        if (row_hi-row_lo+1)*span>FULL_SCAN*self.nrows*self.ncols:
+            return np.arange(len(self.locations))
+        found=[]
+        for row in range(row_lo,row_hi+1):
+            cols=self.rows.get(row)
+            if not cols:
+                continue
+            if all_cols:
+                for members in cols.values():
+                    found.extend(members)
+            elif span>len(cols):
+                # fewer occupied cells than the window, check each one
+                for col,members in cols.items():
+                    # shift the column into the window to handle the
+                    # wrap around at the antimeridian
+                    if col_lo<=col+self.ncols*((col_hi-col)//self.ncols):
+                        found.extend(members)
+            else:
+                for col in range(col_lo,col_hi+1):
+                    members=cols.get(col%self.ncols)
+                    if members:
+                        found.extend(members)
+        return np.array(found,dtype=np.intp)
+
+    def findCities(self,loc,r):
+        '''
+        Description : accepts a target location and radius value as
+                      input and returns the same list of cities as
+                      findCities(loc,cityDict,r) does for the indexed
+                      dictionary.
+
+        Input :
+        loc : coordinates in degrees (tuple:lat,lng)
+        r : radius value
+
+        Returns:
+        close_cities : return a list of close cities to the given location.
+        '''
+        ids=self.candidates(loc,r)
+        distances=havDistMany(loc,self.points.take(ids))
+        hits=np.flatnonzero(distances<r)
+        close=[(round(distance,2),order) for order,distance in
+               zip(ids[hits].tolist(),distances[hits].tolist())]
+        # sorting on the rounded distance and then on the position in
+        # the dictionary gives the order of the linear scan
+        close.sort()
+        return [{'city':self.cities[order]['city'],
+                 'country':self.cities[order]['country'],
+                 'pop':self.cities[order]['pop'],'distance':distance}
+                for distance,order in close]
+
+    def cellBounds(self,loc):
+        '''
+        Description : lower bound of the distance from the location to
+                      any city of every occupied cell. A path into a cell
+                      must cover the difference in latitude, and from
+                      outside the longitudes of the cell it must cross
+                      one of the meridians at its edges.
+
+        Input:
+            loc : coordinates in degrees (tuple:lat,lng)
+
+        Returns:
+            array of the bounds in km, in the order of cellIds
+        '''
+        lat,lng=radians(loc[0]),radians(loc[1])
+        # the latitude only depends on the row of the cell and the
+        # longitude on its column, both are computed once per row and
+        # column of the grid
+        # difference in latitude to the band of every row
+        gap=np.maximum(np.maximum(self.latLo-lat,lat-self.latHi),0)
+        # difference in longitude to the nearest edge of every column, 0
+        # if the location lies within the longitudes of the column
+        east=(self.lngLo-lng)%(2*pi)
+        west=(lng-self.lngLo-self.cellWidth)%(2*pi)
+        inside=(lng-self.lngLo)%(2*pi)<=self.cellWidth
+        dlng=np.where(inside,0,np.minimum(east,west))
+        # distance to the half meridian of that edge, the nearest pole
+        # once it is more than a quarter turn away
+        meridian=np.where(dlng<=pi/2,
+                          np.arcsin(np.minimum(cos(lat)*np.sin(dlng),1)),
+                          pi/2-abs(lat))
+        return np.maximum(gap[self.cellRow],meridian[self.cellCol])*\
+               EARTH_RADIUS-MARGIN
+
+    def nearest(self,loc,k=1):
+        '''
+        Description : best-first search of the k nearest cities. The
+                      cells are visited by increasing lower bound and a
+                      bounded heap keeps the k nearest cities seen, the
+                      search stops at the first cell that cannot hold a
+                      nearer city.
+
+        Input:
+            loc : coordinates in degrees (tuple:lat,lng)
+            k : number of cities
+
+        Returns:
+            list of (distance,order) of the min(k,len) nearest cities,
+            nearest first, with the distance rounded to 2 decimals and
+            ties broken by the position in the dictionary as findCities
+            does
+        '''
+        if k<=0 or not self.cellIds:
+            return []
+        bounds=self.cellBounds(loc)
+        # max heap of (-distance,-order) of the k nearest cities so far
+        heap=[]
+        first=min(FIRST_CELLS,len(bounds))
+        part=np.argpartition(bounds,first-1)[:first]
+        seen=np.zeros(len(bounds),dtype=bool)
+        for cells in (part[np.argsort(bounds[part])],None):
+            if cells is None:
+                # the nearest cities may lie further, order every cell
+                seen[part]=True
+                cells=np.argsort(bounds)
+                cells=cells[~seen[cells]]
+            for c in cells.tolist():
+                # a rounded distance can only tie below the bound plus
+                # the rounding step
+                if len(heap)==k and bounds[c]>0.01-heap[0][0]:
+                    return [(-d,-order) for d,order in
+                            sorted(heap,reverse=True)]
+                ids=self.cellIds[c]
+                distances=havDistMany(loc,self.points.take(ids))
+                if len(heap)==k:
+                    # only the cities that may round below the farthest
+                    keep=distances<=0.01-heap[0][0]
+                    ids,distances=ids[keep],distances[keep]
+                for order,distance in zip(ids.tolist(),distances.tolist()):
+                    item=(-round(distance,2),-order)
+                    if len(heap)<k:
+                        heapq.heappush(heap,item)
+                    elif item>heap[0]:
+                        heapq.heapreplace(heap,item)
+        return [(-d,-order) for d,order in sorted(heap,reverse=True)]
+
+    def nearestCities(self,loc,k=1):
+        '''
+        Description : accepts a target location and returns the k nearest
+                      cities in the format of findCities, there is always
+                      a result as long as the grid holds a city.
+
+        Input :
+        loc : coordinates in degrees (tuple:lat,lng)
+        k : number of cities, the default is 1
+
+        Returns:
+        close_cities : list of the k nearest cities, nearest first.
+        '''
+        return [{'city':self.cities[order]['city'],
+                 'country':self.cities[order]['country'],
+                 'pop':self.cities[order]['pop'],'distance':distance}
+                for distance,order in self.nearest(loc,k)]
+
+### Step 3 : define the ChordGrid class
+class ChordGrid:
+    '''
+    Description : unit vectors of points binned on a 3D grid of cubes as
+                  wide as a chord, so that the points less than a chord
+                  away from a location all lie in the 27 cells around its
+                  cell. The neighbor search of dbscan and the nearest
+                  city search of the country join look up their
+                  candidates in it.
+    '''
+    def __init__(self,xyz,chord,sphere=False):
+        '''
+        Input:
+            xyz : unit vectors of the points, at least one unless sphere
+            chord : width of the cells on the unit sphere
+            sphere : cells around the whole sphere instead of around the
+                     points, so that the codes of the cells do not depend
+                     on the points and points binned later (cellOf) get
+                     the same codes
+        '''
+        self.chord=chord
+        cells=np.floor(xyz/chord).astype(np.int64)
+        # a border of empty cells around the points
+        if sphere:
+            lowest,highest=floor(-1/chord),floor(1/chord)
+            self.low=np.full(3,lowest-1,dtype=np.int64)
+            self.span=highest-lowest+3
+        else:
+            self.low=cells.min(axis=0)-1
+            self.span=int((cells-self.low).max())+2
+        cells-=self.low
+        # code of the cell of every point, the points ordered by it
+        self.codes=self.encode(cells)
+        self.order=np.argsort(self.codes,kind='stable')
+        self.sorted=self.codes[self.order]
+        # the 27 cells around a cell as differences of their codes
+        span=self.span
+        self.offsets=np.array([(dx*span+dy)*span+dz for dx in (-1,0,1)
+                               for dy in (-1,0,1) for dz in (-1,0,1)])
+
+    def encode(self,cells):
+        '''
+        Returns the codes of an array of (x,y,z) cell numbers
+        '''
+        return (cells[:,0]*self.span+cells[:,1])*self.span+cells[:,2]
+
+    def cellOf(self,xyz):
+        '''
+        Returns the codes of the cells of unit vectors, those beyond the
+        grid in its border cells
+        '''
+        cells=np.floor(xyz/self.chord).astype(np.int64)-self.low
+        return self.encode(np.clip(cells,0,self.span-1))
+
+    def bounds(self,codes):
+        '''
+        Input:
+            codes : array of cell codes, e.g. codes[:,None]+offsets for
+                    the cells around every cell
+
+        Returns:
+            (lo,hi) arrays shaped like codes, the points of a cell are
+            order[lo:hi]
+        '''
+        return (np.searchsorted(self.sorted,codes,side='left'),
+                np.searchsorted(self.sorted,codes,side='right'))
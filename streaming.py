@@ -0,0 +1,168 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : streaming.py
+Purpose : Reading earthquake catalogs of any size in bounded chunks,
+          selecting the rows while streaming and keeping the per-year
+          aggregates and the most severe quakes up to date as it goes
+Revisions:
+    00 : import the required modules
+    01 : define readChunks,streamQuakes, the YearAggregator and TopN
+         classes and streamSummary
+"""
+### Step 1 : Import the required modules
+import csv # importing csv module
+import heapq
+import numpy as np
+from quake_store import buildQuakes
+
+# number of rows parsed at a time
+CHUNK_ROWS=50000
+
+### Step 2 : define the chunked readers
+def readChunks(path,chunk_rows=CHUNK_ROWS):
+    '''
+    Description : generator over the rows of a csv file, chunk_rows at
+                  a time, so that only one chunk is in memory.
+
+    Returns:
+        yields (header,first,rows) where first is the position of rows[0]
+        among the data rows of the file
+    '''
+    with open(path,newline='') as f:
+        read=csv.reader(f)
+        header=next(read)
+        rows=[]
+        first=0
+        for row in read:
+            rows.append(row)
+            if len(rows)==chunk_rows:
+                yield header,first,rows
+                first+=len(rows)
+                rows=[]
+        if rows:
+            yield header,first,rows
+
+def streamQuakes(path="earthquakesF23.csv",chunk_rows=CHUNK_ROWS,
+                 **predicates):
+    '''
+    Description : generator over the selected quakes of a csv file, one
+                  QuakeStore per chunk of the file.
+
+    Input:
+        path : path of the earthquake csv file
+        chunk_rows : number of rows parsed at a time
+        predicates : type,lat,lng,date,mag conditions of QuakeStore.mask
+
+    Returns:
+        yields a QuakeStore with the selected rows of every chunk
+    '''
+    for header,first,rows in readChunks(path,chunk_rows):
+        chunk=buildQuakes(header,rows,first)
+        keep=chunk.mask(**predicates)
+        yield chunk if keep.all() else chunk.take(keep)
+
+### Step 3 : define the incremental aggregates
+def severity(magnitude):
+    '''
+    Returns the severity radius in km of the magnitudes, the radius of
+    the affected cities
+    '''
+    return 10**((0.5*magnitude)-2)
+
+class YearAggregator:
+    '''
+    Description : number of events and sum of the magnitudes of every
+                  year, updated one chunk at a time.
+    '''
+    def __init__(self):
+        self.count={}
+        self.total={}
+
+    def update(self,quakes):
+        '''
+        Input:
+            quakes : QuakeStore of the next chunk
+        '''
+        years=quakes.datetime.astype('datetime64[Y]').astype(np.int64)+1970
+        found,index=np.unique(years,return_inverse=True)
+        counts=np.bincount(index,minlength=len(found))
+        totals=np.bincount(index,weights=quakes.magnitude,
+                           minlength=len(found))
+        for year,n,total in zip(found.tolist(),counts.tolist(),
+                                totals.tolist()):
+            self.count[year]=self.count.get(year,0)+n
+            self.total[year]=self.total.get(year,0.0)+total
+
+    def result(self):
+        '''
+        Returns a dictionary of year to {'count','mean'} in year order
+        '''
+        return {year:{'count':self.count[year],
+                      'mean':self.total[year]/self.count[year]}
+                for year in sorted(self.count)}
+
+class TopN:
+    '''
+    Description : the n quakes with the largest severity radius seen so
+                  far, kept in a bounded heap.
+    '''
+    def __init__(self,n=10):
+        self.n=n
+        # min heap of (radius,-row,location,record)
+        self.heap=[]
+        self.seen=0
+
+    def update(self,quakes):
+        '''
+        Input:
+            quakes : QuakeStore of the next chunk
+        '''
+        radius=severity(quakes.magnitude)
+        # only the n largest of the chunk can enter the heap, the
+        # stable sort keeps the earlier row first among equal radii
+        ids=np.argsort(-radius,kind='stable')[:self.n]
+        for i in ids.tolist():
+            # the heap drops the smallest radius, and the latest row
+            # among equal radii
+            item=(float(radius[i]),-(self.seen+i),quakes.location(i),
+                  quakes.record(i))
+            if len(self.heap)<self.n:
+                heapq.heappush(self.heap,item)
+            elif item[:2]>self.heap[0][:2]:
+                heapq.heapreplace(self.heap,item)
+        self.seen+=len(quakes)
+
+    def result(self):
+        '''
+        Returns a list of (radius,location,record), largest first
+        '''
+        return [(radius,loc,record) for radius,row,loc,record in
+                sorted(self.heap,reverse=True,key=lambda x:x[:2])]
+
+### Step 4 : define the streamSummary function
+def streamSummary(path="earthquakesF23.csv",top=10,chunk_rows=CHUNK_ROWS,
+                  **predicates):
+    '''
+    Description : one pass over the file giving the per-year aggregates
+                  and the most severe quakes of the selection, with the
+                  memory bounded by the chunk size.
+
+    Input:
+        path : path of the earthquake csv file
+        top : number of most severe quakes kept
+        chunk_rows : number of rows parsed at a time
+        predicates : type,lat,lng,date,mag conditions of QuakeStore.mask
+
+    Returns:
+        dictionary with the number of 'selected' quakes, the 'years'
+        aggregates of YearAggregator and the 'top' list of TopN
+    '''
+    years=YearAggregator()
+    largest=TopN(top)
+    selected=0
+    for quakes in streamQuakes(path,chunk_rows,**predicates):
+        years.update(quakes)
+        largest.update(quakes)
+        selected+=len(quakes)
+    return {'selected':selected,'years':years.result(),
+            'top':largest.result()}
@@ -0,0 +1,202 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : synthetic.py
+Purpose : Generating earthquake catalogs and city tables of any size with
+          the columns of earthquakesF23.csv and worldcitiesF23.csv, the
+          same seed always giving the same file
+Revisions:
+    00 : import the required modules
+    01 : define writeQuakes,writeCities,parseSize and the cached
+         syntheticQuakes,syntheticCities files
+"""
+### Step 1 : Import the required modules
+import os
+import numpy as np
+
+# columns of the files, in the order of the real ones
+QUAKE_HEADER=['Date','Time','Latitude','Longitude','Type','Depth',
+              'Magnitude','Magnitude Type']
+CITY_HEADER=['city','lat','lng','country','iso3','pop']
+# tremor and magnitude types with their share of the real catalog
+TYPES={'Earthquake':23232,'Nuclear Explosion':175,'Explosion':4,
+       'Rock Burst':1}
+MAGNITUDE_TYPES={'MW':7722,'MWC':5669,'MB':3760,'MWB':2458,'MWW':1983,
+                 'MS':1702,'ML':77,'MWR':26,'MD':6,'MH':5}
+# time span of the real catalog
+FIRST_DAY,LAST_DAY=np.datetime64('1965-01-01'),np.datetime64('2017-01-01')
+# share of the quakes whose Date and Time are ISO 8601 timestamps
+# instead of mm/dd/yyyy and hh:mm:ss, far above the real 3 rows so that
+# both formats are parsed in every benchmark
+ISO_SHARE=0.01
+# number of seismic zones and of countries, the cities and most quakes
+# are scattered around zone centers
+ZONES=200
+COUNTRIES=240
+# rows generated and written at a time
+CHUNK_ROWS=500000
+# multipliers of the size suffixes of parseSize
+SUFFIXES={'k':10**3,'m':10**6,'g':10**9}
+
+### Step 2 : define the helper functions
+def parseSize(text):
+    '''
+    Returns the number of rows of a size like '10k', '1M' or '2500'
+    '''
+    text=text.strip().lower()
+    if text and text[-1] in SUFFIXES:
+        return int(float(text[:-1])*SUFFIXES[text[-1]])
+    return int(text)
+
+def sizeName(n):
+    '''
+    Returns the shortest name of n rows for parseSize, e.g. '10k' or '1M'
+    '''
+    for suffix,scale in (('M',10**6),('k',10**3)):
+        if n>=scale and n%scale==0:
+            return f"{n//scale}{suffix}"
+    return str(n)
+
+def zoneCenters(seed):
+    '''
+    Returns the latitudes and longitudes of the zone centers, spread
+    evenly over the sphere
+    '''
+    rng=np.random.default_rng([seed,0])
+    lats=np.degrees(np.arcsin(rng.uniform(-1,1,ZONES)))
+    return lats,rng.uniform(-180,180,ZONES)
+
+def locations(rng,n,centers,clustered=0.8,spread=3.0):
+    '''
+    Returns n latitudes and longitudes, the clustered share of them
+    normally scattered around the centers and the others uniform over
+    the sphere, rounded to 3 decimals like the files
+    '''
+    zone=rng.integers(0,len(centers[0]),n)
+    lats=centers[0][zone]+rng.normal(0,spread,n)
+    lngs=centers[1][zone]+rng.normal(0,spread,n)
+    free=rng.random(n)>=clustered
+    lats[free]=np.degrees(np.arcsin(rng.uniform(-1,1,int(free.sum()))))
+    lngs[free]=rng.uniform(-180,180,int(free.sum()))
+    lats=np.clip(lats,-90,90)
+    # back into -180..180 across the antimeridian
+    lngs=(lngs+180)%360-180
+    return np.round(lats,3),np.round(lngs,3)
+
+def choices(rng,shares,n):
+    '''
+    Returns n names drawn with the probabilities of the shares dictionary
+    '''
+    names=list(shares)
+    p=np.array([shares[name] for name in names],dtype=np.float64)
+    return np.array(names,dtype=object)[rng.choice(len(names),n,p=p/p.sum())]
+
+### Step 3 : define the generators
+def quakeLines(rng,n,centers):
+    '''
+    Returns n lines of the earthquake csv file, without the header
+    '''
+    lats,lngs=locations(rng,n,centers)
+    # Gutenberg-Richter magnitudes with a b-value of 1 from 5.5 on
+    mags=np.round(np.minimum(5.5+rng.exponential(1/np.log(10),n),9.1),1)
+    depths=np.round(np.minimum(rng.exponential(70,n),700),1)
+    seconds=rng.integers(0,int((LAST_DAY-FIRST_DAY)/np.timedelta64(1,'s')),
+                         n)
+    times=np.datetime_as_string(FIRST_DAY+seconds.astype('timedelta64[s]'),
+                                unit='s')
+    iso=rng.random(n)<ISO_SHARE
+    types=choices(rng,TYPES,n)
+    magtypes=choices(rng,MAGNITUDE_TYPES,n)
+    lines=[]
+    for t,i,lat,lng,ty,depth,mag,mt in zip(times.tolist(),iso.tolist(),
+                                           lats.tolist(),lngs.tolist(),
+                                           types,depths.tolist(),
+                                           mags.tolist(),magtypes):
+        if i:
+            date=time=t+'.000Z'
+        else:
+            date,time=f"{t[5:7]}/{t[8:10]}/{t[:4]}",t[11:]
+        lines.append(f"{date},{time},{lat:g},{lng:g},{ty},{depth:g},"
+                     f"{mag:g},{mt}\r\n")
+    return lines
+
+def writeQuakes(path,n,seed=0,chunk_rows=CHUNK_ROWS):
+    '''
+    Description : writes a synthetic earthquake catalog of n rows with
+                  the columns and both date formats of earthquakesF23.csv.
+                  Most quakes are around the zone centers, the magnitudes
+                  follow the Gutenberg-Richter law and the dates are
+                  uniform over the years of the real catalog.
+
+    Input:
+        path : path of the csv file
+        n : number of rows
+        seed : seed of the random numbers, the same seed and n always
+               give the same file
+        chunk_rows : rows generated at a time
+
+    Returns:
+        the path
+    '''
+    centers=zoneCenters(seed)
+    rng=np.random.default_rng([seed,1])
+    tmp=path+'.tmp'
+    with open(tmp,'w',newline='') as f:
+        f.write(','.join(QUAKE_HEADER)+'\r\n')
+        for start in range(0,n,chunk_rows):
+            f.writelines(quakeLines(rng,min(chunk_rows,n-start),centers))
+    # a file interrupted while written is never taken for a whole one
+    os.replace(tmp,path)
+    return path
+
+def writeCities(path,n,seed=0):
+    '''
+    Description : writes a synthetic city table of n rows with the
+                  columns of worldcitiesF23.csv, the cities around the
+                  same zone centers as the quakes of the seed and a few
+                  populations left empty like in the real file.
+
+    Input:
+        path : path of the csv file
+        n : number of cities
+        seed : seed of the random numbers
+
+    Returns:
+        the path
+    '''
+    centers=zoneCenters(seed)
+    rng=np.random.default_rng([seed,2])
+    lats,lngs=locations(rng,n,centers,clustered=0.6,spread=5.0)
+    countries=rng.integers(0,COUNTRIES,n)
+    pops=np.round(rng.lognormal(10,1.5,n)).astype(np.int64)
+    empty=rng.random(n)<0.01
+    tmp=path+'.tmp'
+    with open(tmp,'w',newline='') as f:
+        f.write(','.join(CITY_HEADER)+'\r\n')
+        for i,(lat,lng,c,pop,e) in enumerate(zip(lats.tolist(),lngs.tolist(),
+                                                 countries.tolist(),
+                                                 pops.tolist(),
+                                                 empty.tolist())):
+            iso3=''.join(chr(65+c//26**k%26) for k in (2,1,0))
+            f.write(f"City {i},{lat:g},{lng:g},Country {c},{iso3},"
+                    f"{'' if e else pop}\r\n")
+    os.replace(tmp,path)
+    return path
+
+### Step 4 : define the cached files
+def syntheticQuakes(n,folder,seed=0):
+    '''
+    Returns the path of the synthetic catalog of n rows in the folder,
+    written only if it is not there yet
+    '''
+    os.makedirs(folder,exist_ok=True)
+    path=os.path.join(folder,f"quakes_{sizeName(n)}_{seed}.csv")
+    return path if os.path.exists(path) else writeQuakes(path,n,seed)
+
+def syntheticCities(n,folder,seed=0):
+    '''
+    Returns the path of the synthetic city table of n rows in the folder,
+    written only if it is not there yet
+    '''
+    os.makedirs(folder,exist_ok=True)
+    path=os.path.join(folder,f"cities_{sizeName(n)}_{seed}.csv")
+    return path if os.path.exists(path) else writeCities(path,n,seed)
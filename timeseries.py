@@ -0,0 +1,275 @@
+"""
+Author : Pulyala Sairam Reddy
+Filename : timeseries.py
+Purpose : Magnitude-frequency (Gutenberg-Richter) and event rate analysis
+          of the quakes over their sorted times, the windowed counts and
+          sums taken as differences of cumulative sums so that every
+          window costs the same however many quakes it holds
+Revisions:
+    00 : import the required modules
+    01 : define timeSeries,magnitudeFrequency,bValue,completeness,
+         gutenbergRichter,eventRates and rollingBValue
+    02 : bValue needs min_events quakes above mc, bValue and
+         rollingBValue take a NaN mc of an empty selection
+"""
+### Step 1 : Import the required modules
+import numpy as np
+from aggregate import AggTable
+from quake_store import QuakeStore
+
+# width of the magnitude bins, the precision of the catalog
+MAG_BIN=0.1
+# fewest quakes above the magnitude of completeness a b-value is fitted on
+MIN_EVENTS=50
+# shares of the quakes the Gutenberg-Richter law has to explain in the
+# goodness of fit test, the first one met gives the completeness
+GFT_LEVELS=(95.0,90.0)
+# length and spacing in days of the windows of the event rates
+WINDOW_DAYS=365.0
+STEP_DAYS=30.0
+# quakes in every window of the rolling b-value and their spacing
+B_EVENTS=200
+B_STEP=50
+# milliseconds in a day and days in a year
+DAY_MS=86400000
+YEAR_DAYS=365.25
+
+### Step 2 : define the helper functions
+def timeSeries(quakes):
+    '''
+    Description : the times and magnitudes of the quakes sorted by time.
+
+    Input:
+        quakes : QuakeStore, dictionary of quakes data (from
+                 getQuakeData) or list of (location,data) tuples such as
+                 mag_selected
+
+    Returns:
+        (times,mags) datetime64[ms] and float64 arrays in time order
+    '''
+    if not isinstance(quakes,QuakeStore):
+        quakes=QuakeStore.fromItems(quakes)
+    order=np.argsort(quakes.datetime,kind='stable')
+    return quakes.datetime[order],quakes.magnitude[order]
+
+def magnitudeBins(mags,bin=MAG_BIN):
+    '''
+    Returns the magnitudes as whole numbers of bins, rounded like the
+    magnitudes of the catalog
+    '''
+    return np.round(np.asarray(mags,dtype=np.float64)/bin).astype(np.int64)
+
+def moment(mags):
+    '''
+    Returns the seismic moment in N m of moment magnitudes
+    '''
+    return 10**(1.5*np.asarray(mags,dtype=np.float64)+9.1)
+
+### Step 3 : define the magnitude-frequency analysis
+def magnitudeFrequency(mags,bin=MAG_BIN):
+    '''
+    Description : number of quakes in every magnitude bin and at or above
+                  it, from one bincount and a reversed cumulative sum.
+
+    Returns:
+        AggTable with the columns magnitude, count and cumulative, one row
+        per bin from the smallest to the largest magnitude
+    '''
+    bins=magnitudeBins(mags,bin)
+    if len(bins)==0:
+        return AggTable({'magnitude':np.zeros(0),
+                         'count':np.zeros(0,dtype=np.int64),
+                         'cumulative':np.zeros(0,dtype=np.int64)},
+                        ['magnitude'])
+    low=int(bins.min())
+    counts=np.bincount(bins-low)
+    return AggTable({'magnitude':np.round((np.arange(len(counts))+low)*bin,
+                                          6),
+                     'count':counts,
+                     'cumulative':np.cumsum(counts[::-1])[::-1]},
+                    ['magnitude'])
+
+def bValue(mags,mc,bin=MAG_BIN,min_events=MIN_EVENTS):
+    '''
+    Description : maximum likelihood b-value of the quakes at or above the
+                  magnitude of completeness (Aki 1965, with the half bin
+                  correction of Utsu), its standard error (Shi and Bolt
+                  1982) and the a-value of log10 N(>=M) = a - b M.
+
+    Input:
+        mags : magnitudes
+        mc : magnitude of completeness, NaN without any quake
+        bin : width of the magnitude bins
+        min_events : fewest quakes at or above mc a b-value is fitted on
+
+    Returns:
+        dictionary with mc, n (quakes used), b, b_error and a, the values
+        are NaN below min_events quakes or with a NaN mc
+    '''
+    fit={'mc':float(mc),'n':0,'b':np.nan,'b_error':np.nan,'a':np.nan}
+    if np.isnan(mc):
+        return fit
+    bins=magnitudeBins(mags,bin)
+    m=np.asarray(mags,dtype=np.float64)[bins>=round(mc/bin)]
+    n=len(m)
+    fit['n']=n
+    if n<max(min_events,2):
+        return fit
+    mean=m.mean()
+    spread=mean-(mc-bin/2)
+    if spread<=0:
+        return fit
+    b=np.log10(np.e)/spread
+    fit['b']=float(b)
+    fit['b_error']=float(2.3*b*b*np.sqrt(((m-mean)**2).sum()/(n*(n-1))))
+    fit['a']=float(np.log10(n)+b*mc)
+    return fit
+
+def completeness(mags,bin=MAG_BIN,method='maxc',correction=0.0,
+                 min_events=MIN_EVENTS):
+    '''
+    Description : magnitude of completeness, the smallest magnitude above
+                  which the catalog holds every quake.
+
+    Input:
+        mags : magnitudes
+        bin : width of the magnitude bins
+        method : 'maxc' the bin with the most quakes (maximum curvature),
+                 'gft' the smallest magnitude whose Gutenberg-Richter fit
+                 explains GFT_LEVELS of the counts (Wiemer and Wyss 2000),
+                 maxc when no magnitude does
+        correction : added to the maximum curvature, often 0.2 as it
+                     tends to be too small
+        min_events : fewest quakes a gft fit is tried on
+
+    Returns:
+        the magnitude of completeness, NaN without any quake
+    '''
+    fmd=magnitudeFrequency(mags,bin)
+    if len(fmd)==0:
+        return np.nan
+    maxc=float(fmd['magnitude'][np.argmax(fmd['count'])])+correction
+    if method=='maxc':
+        return round(maxc,6)
+    if method!='gft':
+        raise ValueError(f"unknown method <{method}>, maxc or gft")
+    fits={}
+    for i,mc in enumerate(fmd['magnitude'].tolist()):
+        if fmd['cumulative'][i]<min_events:
+            break
+        fit=bValue(mags,mc,bin,min_events)
+        if np.isnan(fit['b']):
+            continue
+        # quakes in every bin from mc on against those of the fitted law
+        edges=fmd['magnitude'][i:]-bin/2
+        expected=10**(fit['a']-fit['b']*edges)
+        expected=expected-np.append(expected[1:],0.0)
+        observed=fmd['count'][i:]
+        fits[mc]=100-100*np.abs(observed-expected).sum()/observed.sum()
+    for level in GFT_LEVELS:
+        for mc,fitted in fits.items():
+            if fitted>=level:
+                return mc
+    return round(maxc,6)
+
+def gutenbergRichter(quakes,bin=MAG_BIN,method='maxc',correction=0.0,
+                     min_events=MIN_EVENTS):
+    '''
+    Description : magnitude-frequency distribution, magnitude of
+                  completeness and b-value of the quakes.
+
+    Input:
+        quakes : anything timeSeries takes
+        bin,method,correction,min_events : as in completeness
+
+    Returns:
+        (fmd,fit) the AggTable of magnitudeFrequency and the dictionary
+        of bValue
+    '''
+    times,mags=timeSeries(quakes)
+    mc=completeness(mags,bin,method,correction,min_events)
+    return magnitudeFrequency(mags,bin),bValue(mags,mc,bin,min_events)
+
+### Step 4 : define the windowed rates
+def eventRates(times,mags=None,window=WINDOW_DAYS,step=STEP_DAYS):
+    '''
+    Description : number of quakes, rate and moment released in windows
+                  of window days ending every step days. The quakes are
+                  counted per step with one bincount, a window is the
+                  difference of two cumulative counts, so the cost is
+                  linear in the quakes and the steps.
+
+    Input:
+        times : datetime64 array of the quakes, in any order
+        mags : optional moment magnitudes for the released moment
+        window : length of the windows in days, rounded to whole steps
+        step : days between the ends of two windows
+
+    Returns:
+        AggTable with one row per step: datetime (end of the window),
+        days (of the window, shorter for the first ones), count, rate
+        (quakes per year) and moment (N m) when mags are given
+    '''
+    times=np.asarray(times).astype('datetime64[ms]')
+    names=['datetime','days','count','rate']+(['moment'] if mags is not None
+                                             else [])
+    if len(times)==0:
+        return AggTable({name:np.zeros(0) for name in names},['datetime'])
+    step_ms=int(round(step*DAY_MS))
+    width=max(1,int(round(window/step)))
+    # the steps start at midnight of the day of the first quake
+    origin=times.min().astype('datetime64[D]').astype('datetime64[ms]')
+    slot=((times-origin).astype(np.int64))//step_ms
+    steps=int(slot.max())+1
+    def windowed(weights=None):
+        total=np.zeros(steps+1)
+        np.cumsum(np.bincount(slot,weights,minlength=steps),out=total[1:])
+        ends=np.arange(1,steps+1)
+        return total[ends]-total[np.maximum(ends-width,0)]
+    counts=windowed().round().astype(np.int64)
+    days=np.minimum(np.arange(1,steps+1),width)*step
+    columns={'datetime':origin+np.arange(1,steps+1)*
+                        np.timedelta64(step_ms,'ms'),
+             'days':days,'count':counts,
+             'rate':counts/(days/YEAR_DAYS)}
+    if mags is not None:
+        columns['moment']=windowed(moment(mags))
+    return AggTable(columns,['datetime'])
+
+def rollingBValue(times,mags,mc,events=B_EVENTS,step=B_STEP,bin=MAG_BIN):
+    '''
+    Description : b-value of windows of the given number of successive
+                  quakes at or above mc, a window every step quakes. The
+                  mean and spread of every window come from cumulative
+                  sums of the magnitudes and their squares.
+
+    Input:
+        times,mags : times and magnitudes in time order (timeSeries)
+        mc : magnitude of completeness, NaN gives no window
+        events : quakes in every window
+        step : quakes between the starts of two windows
+
+    Returns:
+        AggTable with one row per window: datetime (of its last quake),
+        b and b_error
+    '''
+    if np.isnan(mc):
+        keep=np.zeros(len(mags),dtype=bool)
+    else:
+        keep=magnitudeBins(mags,bin)>=round(mc/bin)
+    times=np.asarray(times)[keep]
+    m=np.asarray(mags,dtype=np.float64)[keep]
+    if len(m)<max(events,2):
+        return AggTable({'datetime':times[:0],'b':np.zeros(0),
+                         'b_error':np.zeros(0)},['datetime'])
+    total=np.concatenate(([0.0],np.cumsum(m)))
+    squares=np.concatenate(([0.0],np.cumsum(m*m)))
+    starts=np.arange(0,len(m)-events+1,step)
+    mean=(total[starts+events]-total[starts])/events
+    # sum of the squared distances from the mean of every window
+    spread=(squares[starts+events]-squares[starts])-events*mean*mean
+    with np.errstate(divide='ignore',invalid='ignore'):
+        b=np.log10(np.e)/(mean-(mc-bin/2))
+        error=2.3*b*b*np.sqrt(np.maximum(spread,0)/(events*(events-1)))
+    return AggTable({'datetime':times[starts+events-1],'b':b,
+                     'b_error':error},['datetime'])